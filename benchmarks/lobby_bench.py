@@ -0,0 +1,323 @@
+"""
+	Drive the lobby flow through the REST api and measure the
+	throughput and the latencies of each step:
+
+		create player -> create game -> join game ->
+		create team -> join team -> leave
+
+	The requests go through the Flask test client in this process,
+	or over http to a locally spawned gunicorn with --target gunicorn.
+	The database is seeded with --players players first. Prints the
+	results as json, --output writes them to a file as well so runs
+	of different commits can be compared.
+
+		python benchmarks/lobby_bench.py --players 10000 1000000 --concurrency 8
+		python benchmarks/lobby_bench.py --target gunicorn --workers 4 --concurrency 16
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.models import Game, Player, Team
+
+PLAYERS_PER_GAME = 10
+INSERT_BATCH = 50000
+STEPS = ('create_player', 'create_game', 'join_game', 'create_team', 'join_team', 'leave')
+
+
+def bench_config(database_path):
+
+	class BenchConfig(Config):
+		SQLALCHEMY_DATABASE_URI = "sqlite:///" + database_path
+		TOKEN_SWEEP_INTERVAL = None
+
+	return BenchConfig()
+
+
+def seed(app, player_count):
+	"""
+		Bulk insert the players in games of ten, each game with one team
+	"""
+	game_count = player_count // PLAYERS_PER_GAME
+	now = datetime.utcnow()
+
+	with app.app_context():
+		for first in range(1, game_count + 1, INSERT_BATCH):
+			games = range(first, min(first + INSERT_BATCH, game_count + 1))
+			db.session.execute(Game.__table__.insert(),
+				[{'id': g, 'name': 'game', 'created_time': now,
+				  'max_players': PLAYERS_PER_GAME, 'version': 1} for g in games])
+			db.session.execute(Team.__table__.insert(),
+				[{'id': g, 'name': 'team', 'created_time': now, 'game_id': g,
+				  'max_players': PLAYERS_PER_GAME, 'version': 1} for g in games])
+
+		for first in range(1, game_count * PLAYERS_PER_GAME + 1, INSERT_BATCH):
+			players = range(first, min(first + INSERT_BATCH, game_count * PLAYERS_PER_GAME + 1))
+			db.session.execute(Player.__table__.insert(),
+				[{'id': p, 'name': 'player', 'created_time': now,
+				  'game_id': (p - 1) // PLAYERS_PER_GAME + 1,
+				  'team_id': (p - 1) // PLAYERS_PER_GAME + 1} for p in players])
+
+		# the first player of each game owns it and its team, the reaper
+		# of a spawned server removes the teams without an owner
+		for table in (Game.__table__, Team.__table__):
+			db.session.execute(table.update().values(owner_id=(table.c.id - 1) * PLAYERS_PER_GAME + 1))
+		db.session.commit()
+
+
+class TestClientTransport:
+	"""
+		Requests through the Flask test client, one per thread
+	"""
+
+	def __init__(self, app):
+		self.client = app.test_client()
+
+	def request(self, method, url, body, token=None):
+		headers = {'Authorization': 'Bearer ' + token} if token else {}
+		res = self.client.open(url, method=method, json=body, headers=headers)
+		return res.status_code, res.get_json(silent=True)
+
+
+class HttpTransport:
+	"""
+		Requests over a keep-alive http connection, one per thread
+	"""
+
+	def __init__(self, host, port):
+		self.connection = http.client.HTTPConnection(host, port, timeout=60)
+
+	def request(self, method, url, body, token=None):
+		headers = {'Content-Type': 'application/json'}
+		if token:
+			headers['Authorization'] = 'Bearer ' + token
+		try:
+			self.connection.request(method, url, json.dumps(body), headers)
+			res = self.connection.getresponse()
+		except (http.client.HTTPException, OSError):
+			# the server closed the connection, try once more on a new one
+			self.connection.close()
+			self.connection.request(method, url, json.dumps(body), headers)
+			res = self.connection.getresponse()
+		data = res.read()
+		if res.getheader('Content-Type', '').startswith('application/json'):
+			return res.status, json.loads(data)
+		return res.status, None
+
+
+def lobby_flow(transport, timings):
+	"""
+		One pass of the lobby flow, the seconds each step took are
+		appended to timings. Returns whether every step succeeded.
+	"""
+	def step(name, method, url, body, token=None):
+		begin = time.perf_counter()
+		status, data = transport.request(method, url, body, token)
+		timings[name].append(time.perf_counter() - begin)
+		if status >= 400:
+			raise RuntimeError(f"{name} failed with {status}")
+		return data
+
+	try:
+		data = step('create_player', 'POST', '/players', {'player': {'name': 'bench'}})
+		pid, token = data['player']['id'], data['player']['token']
+		player = {'player': {'id': pid}}
+
+		data = step('create_game', 'POST', '/games', player, token)
+		game_url = '/games/game' + str(data['game']['id'])
+
+		step('join_game', 'PUT', game_url, player, token)
+
+		data = step('create_team', 'POST', game_url + '/teams', player, token)
+		team_url = game_url + '/teams/team' + str(data['team']['id'])
+
+		step('join_team', 'PUT', team_url, player, token)
+
+		step('leave', 'PATCH', game_url, {'del_player': {'id': pid}}, token)
+	except RuntimeError:
+		return False
+
+	return True
+
+
+def percentile(sorted_values, fraction):
+	if not sorted_values:
+		return None
+	index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+	return sorted_values[index]
+
+
+def drive(make_transport, flows, concurrency):
+	"""
+		Run the flows from concurrent threads, returns the
+		elapsed seconds, the failed flows and the step timings
+	"""
+	remaining = [flows]
+	failures = [0]
+	lock = threading.Lock()
+	timings = {name: [] for name in STEPS}
+
+	def worker():
+		transport = make_transport()
+		local_timings = {name: [] for name in STEPS}
+		local_failures = 0
+		while True:
+			with lock:
+				if remaining[0] == 0:
+					break
+				remaining[0] -= 1
+			if not lobby_flow(transport, local_timings):
+				local_failures += 1
+
+		with lock:
+			failures[0] += local_failures
+			for name in STEPS:
+				timings[name].extend(local_timings[name])
+
+	threads = [threading.Thread(target=worker) for i in range(concurrency)]
+	begin = time.perf_counter()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	elapsed = time.perf_counter() - begin
+
+	return elapsed, failures[0], timings
+
+
+def summarize(elapsed, flows, failures, timings):
+	steps = {}
+	for name in STEPS:
+		values = sorted(timings[name])
+		steps[name] = {
+			'count': len(values),
+			'mean_ms': 1000 * sum(values) / len(values) if values else None,
+			'p50_ms': 1000 * percentile(values, 0.50) if values else None,
+			'p90_ms': 1000 * percentile(values, 0.90) if values else None,
+			'p99_ms': 1000 * percentile(values, 0.99) if values else None,
+		}
+	requests = sum(len(values) for values in timings.values())
+	return {
+		'flows': flows,
+		'failed_flows': failures,
+		'seconds': elapsed,
+		'flows_per_second': (flows - failures) / elapsed,
+		'requests_per_second': requests / elapsed,
+		'steps': steps,
+	}
+
+
+def free_port():
+	with socket.socket() as sock:
+		sock.bind(('127.0.0.1', 0))
+		return sock.getsockname()[1]
+
+
+def start_gunicorn(database_path, workers, worker_class):
+	"""
+		Spawn gunicorn serving the database and wait until it answers
+	"""
+	port = free_port()
+	env = dict(os.environ, DATABASE_URL="sqlite:///" + database_path)
+	server = subprocess.Popen(
+		['gunicorn', 'krokeapp.runner:app',
+		 '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+		 '--worker-class', worker_class, '--log-level', 'warning'],
+		cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env)
+
+	deadline = time.monotonic() + 30
+	while time.monotonic() < deadline and server.poll() is None:
+		try:
+			status, data = HttpTransport('127.0.0.1', port).request('GET', '/index', None)
+			return server, port
+		except OSError:
+			time.sleep(0.2)
+
+	server.terminate()
+	raise RuntimeError("gunicorn did not start")
+
+
+def git_commit():
+	try:
+		return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+		                               stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def run(args, player_count):
+	database_dir = tempfile.mkdtemp()
+	database_path = os.path.join(database_dir, 'lobby_bench.db')
+
+	app = create_app(bench_config(database_path))
+	init_database(db, app)
+	seed(app, player_count)
+	# the workers must not share the connections of this process
+	db.get_engine(app).dispose()
+
+	server = None
+	try:
+		if args.target == 'gunicorn':
+			server, port = start_gunicorn(database_path, args.workers, args.worker_class)
+			make_transport = lambda: HttpTransport('127.0.0.1', port)
+		else:
+			make_transport = lambda: TestClientTransport(app)
+
+		# warm up the connections and the code paths
+		drive(make_transport, args.concurrency, args.concurrency)
+		elapsed, failures, timings = drive(make_transport, args.flows, args.concurrency)
+	finally:
+		if server is not None:
+			server.terminate()
+			server.wait()
+		db.get_engine(app).dispose()
+		for suffix in ('', '-wal', '-shm'):
+			if os.path.exists(database_path + suffix):
+				os.remove(database_path + suffix)
+		os.rmdir(database_dir)
+
+	return dict(players=player_count, target=args.target, concurrency=args.concurrency,
+	            **summarize(elapsed, args.flows, failures, timings))
+
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description='Benchmark the lobby flow of the api')
+	parser.add_argument('--target', choices=['client', 'gunicorn'], default='client',
+	                    help='Flask test client in this process or a spawned gunicorn')
+	parser.add_argument('--players', type=int, nargs='+', default=[10000],
+	                    help='Players seeded in the database before each run')
+	parser.add_argument('--flows', type=int, default=500,
+	                    help='Lobby flows per run')
+	parser.add_argument('--concurrency', type=int, default=4,
+	                    help='Flows run at the same time')
+	parser.add_argument('--workers', type=int, default=4,
+	                    help='Gunicorn workers')
+	parser.add_argument('--worker_class', default='sync',
+	                    help='Gunicorn worker class')
+	parser.add_argument('--output', help='Write the results to this json file')
+	args = parser.parse_args()
+
+	results = {
+		'commit': git_commit(),
+		'runs': [run(args, player_count) for player_count in args.players],
+	}
+	print(json.dumps(results, indent=2))
+
+	if args.output:
+		with open(args.output, 'w') as output:
+			json.dump(results, output, indent=2)
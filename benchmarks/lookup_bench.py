@@ -0,0 +1,117 @@
+"""
+	Time the lookups of the players and teams of a single game
+	while the tables grow. With the foreign keys indexed the
+	lookup time stays flat, --no_indexes drops the indexes
+	for comparison. Prints the results as json.
+
+		python benchmarks/lookup_bench.py --sizes 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.models import Game, Player, Team
+
+PLAYERS_PER_GAME = 10
+FOREIGN_KEY_INDEXES = ('ix_player_game_id_id', 'ix_player_team_id', 'ix_team_game_id_id')
+
+
+def fill(app, player_count):
+	"""
+		Bulk insert the players in games of ten, each game with one team
+	"""
+	game_count = player_count // PLAYERS_PER_GAME
+	now = datetime.utcnow()
+
+	with app.app_context():
+		db.session.execute(Game.__table__.insert(),
+			[{'id': g, 'name': 'game', 'created_time': now, 'max_players': PLAYERS_PER_GAME,
+			  'version': 1} for g in range(1, game_count + 1)])
+		db.session.execute(Team.__table__.insert(),
+			[{'id': g, 'name': 'team', 'created_time': now, 'game_id': g, 'version': 1}
+			 for g in range(1, game_count + 1)])
+		db.session.execute(Player.__table__.insert(),
+			[{'id': p, 'name': 'player', 'created_time': now,
+			  'game_id': (p - 1) // PLAYERS_PER_GAME + 1, 'team_id': (p - 1) // PLAYERS_PER_GAME + 1}
+			 for p in range(1, game_count * PLAYERS_PER_GAME + 1)])
+		db.session.commit()
+
+	return game_count
+
+
+def time_lookups(app, game_count, lookups):
+	"""
+		Average seconds per lookup of the players and the teams of a game
+	"""
+	game_ids = [random.randint(1, game_count) for i in range(lookups)]
+	timings = {}
+
+	with app.app_context():
+		begin = time.perf_counter()
+		for game_id in game_ids:
+			Player.query.filter_by(game_id=game_id).all()
+		timings['game_players'] = (time.perf_counter() - begin) / lookups
+
+		begin = time.perf_counter()
+		for game_id in game_ids:
+			Player.query.filter_by(team_id=game_id).all()
+		timings['team_players'] = (time.perf_counter() - begin) / lookups
+
+		begin = time.perf_counter()
+		for game_id in game_ids:
+			Team.query.filter_by(game_id=game_id).all()
+		timings['game_teams'] = (time.perf_counter() - begin) / lookups
+
+	return timings
+
+
+def run(size, lookups, indexes):
+	database_dir = tempfile.mkdtemp()
+
+	class BenchConfig(Config):
+		SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(database_dir, 'lookup_bench.db')
+
+	app = create_app(BenchConfig())
+	init_database(db, app)
+
+	if not indexes:
+		engine = db.get_engine(app)
+		for table in (Player.__table__, Team.__table__):
+			for index in table.indexes:
+				if index.name in FOREIGN_KEY_INDEXES:
+					index.drop(bind=engine)
+
+	game_count = fill(app, size)
+	timings = time_lookups(app, game_count, lookups)
+
+	db.get_engine(app).dispose()
+	os.remove(os.path.join(database_dir, 'lookup_bench.db'))
+	os.rmdir(database_dir)
+
+	return dict(players=size, indexes=indexes, **timings)
+
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description='Benchmark foreign key lookups')
+	parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+	                    help='Player counts to benchmark')
+	parser.add_argument('--lookups', type=int, default=500,
+	                    help='Lookups per measurement')
+	parser.add_argument('--no_indexes', action='store_true',
+	                    help='Drop the foreign key indexes')
+	args = parser.parse_args()
+
+	results = [run(size, args.lookups, not args.no_indexes) for size in args.sizes]
+	print(json.dumps(results, indent=2))
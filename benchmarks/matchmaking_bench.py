@@ -0,0 +1,137 @@
+"""
+	Measure the matchmaking queue: the players matched per second
+	when draining a full queue, and the time the players wait in the
+	queue when they arrive at a steady rate and the queue is ticked
+	every --interval seconds. Prints the results as json.
+
+		python benchmarks/matchmaking_bench.py --players 10000 --rate 500 --interval 0.5
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.background import start_periodic_task
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.matchmaking import get_queue, tick
+from krokeapp.models import Player
+
+
+def seed(app, player_count):
+	now = datetime.utcnow()
+	with app.app_context():
+		db.session.execute(Player.__table__.insert(),
+			[{'id': p, 'name': 'player', 'created_time': now} for p in range(1, player_count + 1)])
+		db.session.commit()
+
+
+def percentile(sorted_values, fraction):
+	index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+	return sorted_values[index]
+
+
+def drain(app, player_count):
+	"""
+		Queue all the players at once and tick until the queue is empty
+	"""
+	with app.app_context():
+		queue = get_queue()
+		for playerid in range(1, player_count + 1):
+			queue.join(playerid)
+
+		ticks = 0
+		begin = time.perf_counter()
+		while tick():
+			ticks += 1
+		elapsed = time.perf_counter() - begin
+
+	return {'players': player_count, 'ticks': ticks, 'seconds': elapsed,
+	        'players_per_second': queue.matched / elapsed,
+	        'ms_per_tick': 1000 * elapsed / ticks}
+
+
+def arrivals(app, player_count, rate, interval):
+	"""
+		Queue the players at a steady rate while the queue is
+		ticked in the background, returns the queue wait times
+	"""
+	task = start_periodic_task(app, interval, tick)
+	with app.app_context():
+		queue = get_queue()
+		begin = time.perf_counter()
+		for playerid in range(1, player_count + 1):
+			# keep to the arrival rate
+			delay = begin + playerid / rate - time.perf_counter()
+			if delay > 0:
+				time.sleep(delay)
+			queue.join(playerid)
+
+		# the last players are matched on the following ticks
+		deadline = time.perf_counter() + 60
+		while len(queue) >= app.config['MATCH_SIZE'] and time.perf_counter() < deadline:
+			time.sleep(interval / 10)
+		time.sleep(2 * interval)
+	task.stop()
+	task.join()
+
+	waits = sorted(queue.waits)
+	return {'players': player_count, 'rate': rate, 'interval': interval, 'matched': len(waits),
+	        'unmatched': len(queue),
+	        'wait_p50_ms': 1000 * percentile(waits, 0.5), 'wait_p99_ms': 1000 * percentile(waits, 0.99),
+	        'wait_max_ms': 1000 * waits[-1]}
+
+
+def run(mode, args):
+	database_dir = tempfile.mkdtemp()
+
+	class BenchConfig(Config):
+		SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(database_dir, 'matchmaking_bench.db')
+		TOKEN_SWEEP_INTERVAL = None
+		REAP_INTERVAL = None
+		MATCHMAKING_INTERVAL = None
+		MATCH_SIZE = args.match_size
+		MATCHMAKING_MAX_MATCHES = args.max_matches
+
+	app = create_app(BenchConfig())
+	init_database(db, app)
+	seed(app, args.players)
+
+	if mode == 'drain':
+		result = drain(app, args.players)
+	else:
+		result = arrivals(app, args.players, args.rate, args.interval)
+
+	db.get_engine(app).dispose()
+	for suffix in ('', '-wal', '-shm'):
+		path = os.path.join(database_dir, 'matchmaking_bench.db' + suffix)
+		if os.path.exists(path):
+			os.remove(path)
+	os.rmdir(database_dir)
+
+	return dict(mode=mode, match_size=args.match_size, **result)
+
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description='Benchmark the matchmaking queue')
+	parser.add_argument('--players', type=int, default=10000,
+	                    help='Players queued')
+	parser.add_argument('--match_size', type=int, default=8,
+	                    help='Players in a match')
+	parser.add_argument('--max_matches', type=int, default=100,
+	                    help='Matches formed at most in a tick')
+	parser.add_argument('--rate', type=float, default=500,
+	                    help='Players arriving per second')
+	parser.add_argument('--interval', type=float, default=0.5,
+	                    help='Seconds between ticks')
+	args = parser.parse_args()
+
+	print(json.dumps([run('drain', args), run('arrivals', args)], indent=2))
@@ -0,0 +1,113 @@
+"""
+	Time serializing a listing of games with the json encoders,
+	per 1000 games. The flask jsonify of debug mode pretty-prints
+	with the standard library, the responses are now encoded
+	compact with orjson when it is installed. Prints the results
+	as json.
+
+		python benchmarks/serialization_bench.py --games 1000 10000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from flask import json as flask_json
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.models import Game, Player
+
+PLAYERS_PER_GAME = 10
+
+
+def fill(app, game_count):
+	"""
+		Bulk insert the games with an owner and ten players each
+	"""
+	now = datetime.utcnow()
+	player_count = game_count * PLAYERS_PER_GAME
+
+	with app.app_context():
+		# the games first, the owners are set once the players exist
+		db.session.execute(Game.__table__.insert(),
+			[{'id': g, 'name': 'game', 'created_time': now, 'max_players': PLAYERS_PER_GAME,
+			  'version': 1} for g in range(1, game_count + 1)])
+		db.session.execute(Player.__table__.insert(),
+			[{'id': p, 'name': 'player' + str(p), 'created_time': now,
+			  'game_id': (p - 1) // PLAYERS_PER_GAME + 1} for p in range(1, player_count + 1)])
+		db.session.execute(Game.__table__.update().values(
+			owner_id=(Game.__table__.c.id - 1) * PLAYERS_PER_GAME + 1))
+		db.session.commit()
+
+
+def best_of(repeat, function):
+	timings = []
+	for i in range(repeat):
+		begin = time.perf_counter()
+		function()
+		timings.append(time.perf_counter() - begin)
+	return min(timings)
+
+
+def run(game_count, repeat):
+	database_dir = tempfile.mkdtemp()
+
+	class BenchConfig(Config):
+		SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(database_dir, 'serialization_bench.db')
+		TOKEN_SWEEP_INTERVAL = None
+
+	app = create_app(BenchConfig())
+	init_database(db, app)
+	fill(app, game_count)
+
+	encoders = {
+		'json_pretty': lambda data: flask_json.dumps(data, indent=2, separators=(', ', ': ')).encode(),
+		'json_compact': lambda data: flask_json.dumps(data, separators=(',', ':')).encode(),
+	}
+	try:
+		import orjson
+		encoders['orjson'] = lambda data: orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+	except ImportError:
+		pass
+
+	per_thousand = 1000 / game_count
+	results = {'games': game_count}
+	with app.test_request_context():
+		games = Game.query_with_members().all()
+
+		results['to_json_ms'] = 1000 * per_thousand * best_of(repeat, lambda: [game.to_json() for game in games])
+
+		listing = {'games': [game.to_json() for game in games], 'next': None}
+		for name, encode in encoders.items():
+			results[name + '_ms'] = 1000 * per_thousand * best_of(repeat, lambda: encode(listing))
+			results[name + '_bytes'] = int(per_thousand * len(encode(listing)))
+
+	db.get_engine(app).dispose()
+	for suffix in ('', '-wal', '-shm'):
+		path = os.path.join(database_dir, 'serialization_bench.db' + suffix)
+		if os.path.exists(path):
+			os.remove(path)
+	os.rmdir(database_dir)
+
+	return results
+
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description='Benchmark serializing the game listings')
+	parser.add_argument('--games', type=int, nargs='+', default=[1000, 10000],
+	                    help='Game counts to benchmark')
+	parser.add_argument('--repeat', type=int, default=5,
+	                    help='Best of this many runs')
+	args = parser.parse_args()
+
+	results = [run(game_count, args.repeat) for game_count in args.games]
+	print(json.dumps(results, indent=2))
@@ -0,0 +1,114 @@
+"""
+	Measure the startup of a worker against databases of different
+	sizes: the wall time of a fresh process importing krokeapp.runner,
+	as gunicorn does when it spawns a worker, and the time of the
+	database check of init_if_not_found. The time the old check took,
+	loading every game, is shown for comparison. Prints the results
+	as json.
+
+		python benchmarks/startup_bench.py --games 0 10000 1000000 --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# add the parent directory to path for importing krokeapp
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database, init_if_not_found
+from krokeapp.models import Game, Player
+
+INSERT_BATCH = 50000
+
+
+def seed(app, game_count):
+	"""
+		Bulk insert the games, each with an owner
+	"""
+	now = datetime.utcnow()
+	with app.app_context():
+		for first in range(1, game_count + 1, INSERT_BATCH):
+			ids = range(first, min(first + INSERT_BATCH, game_count + 1))
+			db.session.execute(Game.__table__.insert(),
+				[{'id': i, 'name': 'game', 'created_time': now, 'max_players': 16, 'version': 1} for i in ids])
+			db.session.execute(Player.__table__.insert(),
+				[{'id': i, 'name': 'player', 'created_time': now, 'game_id': i} for i in ids])
+		db.session.execute('UPDATE game SET owner_id = id')
+		db.session.commit()
+
+
+def spawn_worker(database_uri):
+	"""
+		Seconds until a new process has created the app of the runner
+	"""
+	env = dict(os.environ, DATABASE_URL=database_uri)
+	begin = time.perf_counter()
+	subprocess.run([sys.executable, '-c', 'import krokeapp.runner'], cwd=ROOT, env=env, check=True)
+	return time.perf_counter() - begin
+
+
+def timed(function, repeat):
+	seconds = []
+	for i in range(repeat):
+		begin = time.perf_counter()
+		function()
+		seconds.append(time.perf_counter() - begin)
+	return seconds
+
+
+def run(game_count, repeat):
+	database_dir = tempfile.mkdtemp()
+	database_path = os.path.join(database_dir, 'startup_bench.db')
+
+	class BenchConfig(Config):
+		SQLALCHEMY_DATABASE_URI = "sqlite:///" + database_path
+		TOKEN_SWEEP_INTERVAL = None
+		REAP_INTERVAL = None
+		MATCHMAKING_INTERVAL = None
+
+	app = create_app(BenchConfig())
+	init_database(db, app)
+	seed(app, game_count)
+
+	def full_table_probe():
+		with app.app_context():
+			Game.query.all()
+
+	check = timed(lambda: init_if_not_found(db, app), repeat)
+	probe = timed(full_table_probe, repeat)
+	db.get_engine(app).dispose()
+	boot = [spawn_worker(BenchConfig.SQLALCHEMY_DATABASE_URI) for i in range(repeat)]
+
+	for suffix in ('', '-wal', '-shm'):
+		if os.path.exists(database_path + suffix):
+			os.remove(database_path + suffix)
+	os.rmdir(database_dir)
+
+	return {
+		'games': game_count,
+		'worker_boot_ms': 1000 * statistics.median(boot),
+		'worker_boot_min_ms': 1000 * min(boot),
+		'init_if_not_found_ms': 1000 * statistics.median(check),
+		'full_table_probe_ms': 1000 * statistics.median(probe),
+	}
+
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description='Benchmark the startup of a worker')
+	parser.add_argument('--games', type=int, nargs='+', default=[0, 10000, 100000],
+	                    help='Games in the database of each run')
+	parser.add_argument('--repeat', type=int, default=5,
+	                    help='Measurements per run, the median is reported')
+	args = parser.parse_args()
+
+	print(json.dumps([run(game_count, args.repeat) for game_count in args.games], indent=2))
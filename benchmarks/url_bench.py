@@ -0,0 +1,125 @@
+"""
+	Time Game.games_to_json with the urls formatted from templates
+	built once per request against building them with url_for for
+	every game, as before. Prints the results as json.
+
+		python benchmarks/url_bench.py --games 1000 5000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from flask import url_for
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import krokeapp.models
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.models import Game, Player
+
+PLAYERS_PER_GAME = 2
+
+
+class UrlFor:
+	"""
+		Stands in for a url template and builds
+		the url with url_for on every format
+	"""
+
+	def __init__(self, endpoint):
+		self.endpoint = endpoint
+
+	def format(self, **values):
+		return url_for(self.endpoint, **values)
+
+
+def fill(app, game_count):
+	now = datetime.utcnow()
+	player_count = game_count * PLAYERS_PER_GAME
+
+	with app.app_context():
+		# the games first, the owners are set once the players exist
+		db.session.execute(Game.__table__.insert(),
+			[{'id': g, 'name': 'game', 'created_time': now, 'max_players': PLAYERS_PER_GAME,
+			  'version': 1} for g in range(1, game_count + 1)])
+		db.session.execute(Player.__table__.insert(),
+			[{'id': p, 'name': 'player', 'created_time': now,
+			  'game_id': (p - 1) // PLAYERS_PER_GAME + 1} for p in range(1, player_count + 1)])
+		db.session.execute(Game.__table__.update().values(
+			owner_id=(Game.__table__.c.id - 1) * PLAYERS_PER_GAME + 1))
+		db.session.commit()
+
+
+def time_listing(app, repeat):
+	"""
+		Best times of the whole listing and of serializing the
+		loaded games, each run in a request of its own
+	"""
+	listing = []
+	serializing = []
+	for i in range(repeat):
+		with app.test_request_context():
+			begin = time.perf_counter()
+			Game.games_to_json()
+			listing.append(time.perf_counter() - begin)
+
+			games = Game.query_with_members().all()
+			begin = time.perf_counter()
+			[game.to_json() for game in games]
+			serializing.append(time.perf_counter() - begin)
+	return min(listing), min(serializing)
+
+
+def run(game_count, repeat):
+	database_dir = tempfile.mkdtemp()
+
+	class BenchConfig(Config):
+		SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(database_dir, 'url_bench.db')
+		TOKEN_SWEEP_INTERVAL = None
+
+	app = create_app(BenchConfig())
+	init_database(db, app)
+	fill(app, game_count)
+
+	templates = time_listing(app, repeat)
+
+	url_template = krokeapp.models.url_template
+	krokeapp.models.url_template = lambda endpoint, *names: UrlFor(endpoint)
+	try:
+		per_object = time_listing(app, repeat)
+	finally:
+		krokeapp.models.url_template = url_template
+
+	db.get_engine(app).dispose()
+	for suffix in ('', '-wal', '-shm'):
+		path = os.path.join(database_dir, 'url_bench.db' + suffix)
+		if os.path.exists(path):
+			os.remove(path)
+	os.rmdir(database_dir)
+
+	return {'games': game_count,
+	        'games_to_json_url_for_ms': 1000 * per_object[0],
+	        'games_to_json_url_template_ms': 1000 * templates[0],
+	        'to_json_url_for_ms': 1000 * per_object[1],
+	        'to_json_url_template_ms': 1000 * templates[1],
+	        'to_json_speedup': per_object[1] / templates[1]}
+
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description='Benchmark the urls of the game listing')
+	parser.add_argument('--games', type=int, nargs='+', default=[1000, 5000],
+	                    help='Game counts to benchmark')
+	parser.add_argument('--repeat', type=int, default=5,
+	                    help='Best of this many runs')
+	args = parser.parse_args()
+
+	results = [run(game_count, args.repeat) for game_count in args.games]
+	print(json.dumps(results, indent=2))
@@ -37,7 +37,32 @@ def create_app(config):
 
     # give the app to the database instance
     db.init_app(app)
+
+    from krokeapp.database import configure_engine, register_request_transaction
+
+    # connection pooling and sqlite tuning
+    configure_engine(db, app)
+
+    # request timings and query counts at /metrics, if enabled
+    from krokeapp.metrics import init_metrics
+    init_metrics(db, app)
+
+    # commit the changes once per request
+    register_request_transaction(db, app)
+
+    # encoder of the json responses
+    from krokeapp.serialization import init_json
+    init_json(app)
+
+    # cache of the serialized resources
+    from krokeapp.cache import init_cache
+    init_cache(app)
     
+    # queue of the matchmaking, the servers tick it in the background,
+    # see krokeapp.background.start_background_tasks
+    from krokeapp.matchmaking import init_matchmaking
+    init_matchmaking(app)
+
     # load the application url endpoints
     from krokeapp.apiroutes import api_routes
     app.register_blueprint(api_routes)
@@ -1,6 +1,9 @@
 from flask import Blueprint
 from flask_cors import CORS
 
+from krokeapp.cache import get_cache
+from krokeapp.serialization import jsonify
+
 api_routes = Blueprint('api', __name__, template_folder='templates')
 
 
@@ -14,7 +17,14 @@ def index():
     return "<h1>Hello World!</h1>"
 
 
+@api_routes.route("/cache")
+def cache_stats():
+    """The hits and misses of the resource cache"""
+    return jsonify({'cache': get_cache().stats()})
+
+
 # import the app routes
 from krokeapp.apiroutes import player_routes
 from krokeapp.apiroutes import game_routes
-from krokeapp.apiroutes import team_routes
\ No newline at end of file
+from krokeapp.apiroutes import team_routes
+from krokeapp.apiroutes import matchmaking_routes
\ No newline at end of file
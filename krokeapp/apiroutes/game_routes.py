@@ -1,10 +1,17 @@
 
-from flask import jsonify, request, url_for, Response
+import queue
+from datetime import datetime
+
+from flask import request, url_for, Response, current_app
 from krokeapp import db
 from krokeapp import logger
 from krokeapp.models import Player, Game, Team
+from krokeapp.authentication import request_token
+from krokeapp.events import broker, format_event, keepalive_event
+from krokeapp.cache import get_cache
+from krokeapp.serialization import jsonify
 from krokeapp.status_codes import *
-from krokeapp.utils import get_from_dict
+from krokeapp.utils import get_from_dict, get_page_args, conditional_response, to_id
 
 from krokeapp.apiroutes import api_routes
 
@@ -12,16 +19,46 @@ from krokeapp.apiroutes import api_routes
 def games():
     """end-point for creating games and getting game info."""
 
-    if request.method == 'GET':				
-        return jsonify(Game.games_to_json()) 
+    if request.method == 'GET':
+        # cursor pagination and the filters are given as url arguments
+        try:
+            limit, after = get_page_args(request.args, current_app.config)
+            created_after = request.args.get('created_after')
+            if created_after is not None:
+                created_after = datetime.fromisoformat(created_after)
+            owner_id = request.args.get('owner')
+            if owner_id is not None:
+                owner_id = int(owner_id)
+        except ValueError:
+            return jsonify(''), UNPROCESSABLE
+
+        not_full = request.args.get('not_full', '').lower() in ('1', 'true')
+
+        # the summaries are enough for browsing the lobbies
+        view = request.args.get('view', 'full')
+        if view == 'summary':
+            return jsonify(Game.games_summary_json(limit=limit, after=after,
+                                                   not_full=not_full,
+                                                   created_after=created_after,
+                                                   owner_id=owner_id))
+        if view != 'full':
+            return jsonify(''), UNPROCESSABLE
+
+        return jsonify(Game.games_to_json(limit=limit, after=after,
+                                          not_full=not_full,
+                                          created_after=created_after,
+                                          owner_id=owner_id))
 
     if request.method == 'POST':
         pjson = request.get_json()
         # player id 
         player_id = get_from_dict(pjson, ['player', 'id'])
         if player_id is not None:	
-            db_player = Player.query.filter_by(id=player_id).first()
+            db_player = Player.by_id(player_id)
             if db_player is not None:
+                # only the player themselves can create the game
+                if not db_player.auth(request_token(pjson, ['player', 'token'])):
+                    return jsonify(''), UNAUTHORIZED
                 game = Game.new_game(db_player)
                 response = jsonify(game.to_json())
                 response.status_code = RESOURCE_CREATED
@@ -56,6 +93,10 @@ def game(id):
         player = Player.by_id(pid)
         if player is not None:
 
+            # players can only remove themselves
+            if not player.auth(request_token(rjson, ['del_player', 'token'])):
+                return jsonify(), UNAUTHORIZED
+
             # cannot leave from game player is not in
             if player.game is not game:
                 return jsonify(), PRECONDITION_FAILED
@@ -80,11 +121,14 @@ def game(id):
       
     # send out info for this game specifically
     if request.method == 'GET':
-        # find the game
-        game = Game.by_id(id)
+        # the game is served from the cache until it changes
+        # and on a miss the body is only built for clients without the current version
+        cached = get_cache().get_versioned(Game.cache_key(id), lambda: Game.current_etag(id),
+                                           lambda: Game.cached_json(id))
         # only send out info of existing games
-        if game is not None:
-            return jsonify(game.to_json())
+        if cached is not None:
+            etag, make_json = cached
+            return conditional_response(etag, make_json)
         else:
             return jsonify(), UNPROCESSABLE
 
@@ -92,6 +136,14 @@ def game(id):
     if request.method == 'PUT':
         # find the game
         game = Game.by_id(id)
+
+        # many players can join at once
+        player_items = get_from_dict(rjson, ['players'])
+        if player_items is not None:
+            if game is None:
+                return jsonify(), UNPROCESSABLE
+            return join_players(game, player_items)
+
         # id of the player wanting to join
         pid = get_from_dict(rjson, ['player', 'id'])        
         player = Player.by_id(pid)
@@ -99,11 +151,17 @@ def game(id):
         if game is None or player is None:
             return jsonify(), UNPROCESSABLE
 
-        # cannot add player twice
-        if player in game.players:
-            return jsonify(), UNPROCESSABLE
+        if not player.auth(request_token(rjson, ['player', 'token'])):
+            return jsonify(), UNAUTHORIZED
+
+        # the join is checked and done in one atomic update
+        if not game.add_player(player):
+            # cannot add player twice
+            if player.game_id == game.id:
+                return jsonify(), UNPROCESSABLE
+            # the game is full (or was deleted meanwhile)
+            return jsonify(), CONFLICT
 
-        game.add_player(player)
         return jsonify(), SUCCESS
         
     # owner can delete the game
@@ -117,10 +175,105 @@ def game(id):
         if player is None or game is None:
             return jsonify(), UNPROCESSABLE
         # only the owner can delete the game
-        if game.owner is not player:
+        if not player.auth(request_token(rjson, ['player', 'token'])) or game.owner is not player:
             return jsonify(), UNAUTHORIZED
 
         # finally delete the game
         Game.remove_game(game)
 
         return jsonify(), SUCCESS
+
+
+def join_players(game, player_items):
+    """
+        Join the players of a bulk request to the game with 
+        set-based updates. Each item gets a status code of its own,
+        the same one a single join would have responded with.
+    """
+    if not isinstance(player_items, list):
+        return jsonify(), UNPROCESSABLE
+
+    pids = []
+    tokens = []
+    for item in player_items:
+        pid = get_from_dict(item, ['player', 'id']) if isinstance(item, dict) else None
+        pids.append(to_id(pid))
+        # each player authenticates with their own token
+        tokens.append(get_from_dict(item, ['player', 'token']) if isinstance(item, dict) else None)
+
+    players = {player.id: player for player in 
+               Player.by_ids([pid for pid in pids if pid is not None])}
+
+    joining = []
+    results = []
+    for pid, token in zip(pids, tokens):
+        player = players.get(pid)
+        # only existing players can join, and only once
+        if player is None or player.game_id == game.id or player in joining:
+            status = UNPROCESSABLE
+        elif not player.auth(token):
+            status = UNAUTHORIZED
+        else:
+            joining.append(player)
+            status = SUCCESS
+        results.append({'player': {'id': pid}, 'status': status})
+
+    joined = game.add_players(joining)
+    # the players that did not fit in the game
+    for result in results:
+        if result['status'] == SUCCESS and players[result['player']['id']] not in joined:
+            result['status'] = CONFLICT
+
+    return jsonify({'players': results}), SUCCESS
+
+
+@api_routes.route("/games/game<id>/events", methods=['GET'])
+def game_events(id):
+    """
+        Server-sent event stream of the changes in a game.
+        Membership and team changes made by this process are pushed
+        as they happen, changes made by other workers are noticed from
+        the game version and sent as 'changed' events. The local
+        changes move the version too, a 'changed' event may follow them.
+    """
+
+    game = Game.by_id(id)
+    if game is None:
+        return jsonify(), UNPROCESSABLE
+
+    game_id = game.id
+    version = game.version
+    keepalive = current_app.config['EVENTS_KEEPALIVE']
+    # the stream outlives the request context
+    app = current_app._get_current_object()
+
+    stream = broker.subscribe(game_id)
+
+    def generate():
+        known_version = version
+        try:
+            yield format_event('hello', {'game': {'id': game_id, 'version': version}})
+            while True:
+                try:
+                    event_type, data = stream.get(timeout=keepalive)
+                except queue.Empty:
+                    # check for changes made by the other workers
+                    with app.app_context():
+                        chunk, known_version = keepalive_event(game_id, known_version)
+                    yield chunk
+                    if known_version is None:
+                        return
+                    continue
+
+                # known_version stays the version read from the database,
+                # the next keepalive reports the changes of the other workers
+                # made before this one too
+                yield format_event(event_type, data)
+                if event_type == 'game_removed':
+                    return
+        finally:
+            broker.unsubscribe(game_id, stream)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
@@ -0,0 +1,64 @@
+from flask import request
+from krokeapp.models import Player
+from krokeapp.authentication import request_token
+from krokeapp.matchmaking import get_queue
+from krokeapp.serialization import jsonify
+from krokeapp.status_codes import *
+from krokeapp.utils import get_from_dict, to_id
+
+from krokeapp.apiroutes import api_routes
+
+
+@api_routes.route("/matchmaking", methods=['GET', 'POST', 'DELETE'])
+def matchmaking():
+    """
+        End-point for queueing for a match instead of picking
+        a game. The queue is matched in the background, it lives
+        in the memory of the process so the matchmaking is served
+        by a single worker.
+    """
+
+    rjson = request.get_json()
+
+    # the state of the queue
+    if request.method == 'GET':
+        return jsonify({'matchmaking': get_queue().stats()})
+
+    # the player joining or leaving the queue
+    player = Player.by_id(get_from_dict(rjson, ['player', 'id']))
+    if player is None:
+        return jsonify(''), UNPROCESSABLE
+
+    if not player.auth(request_token(rjson, ['player', 'token'])):
+        return jsonify(''), UNAUTHORIZED
+
+    # join the queue, players in a game or already queued are refused
+    if request.method == 'POST':
+        if player.game_id is not None or not get_queue().join(player.id):
+            return jsonify(''), CONFLICT
+        return jsonify({'queued': {'waiting': len(get_queue())}}), SUCCESS
+
+    # leave the queue
+    if request.method == 'DELETE':
+        if not get_queue().leave(player.id):
+            return jsonify(''), PRECONDITION_FAILED
+        return jsonify(''), SUCCESS
+
+
+@api_routes.route("/matchmaking/player<playerid>", methods=['GET'])
+def matchmaking_status(playerid):
+    """
+        The game and the team the player was matched to, or
+        how long they have been waiting for one
+    """
+    player = Player.by_id(to_id(playerid))
+    if player is None:
+        return jsonify(''), UNPROCESSABLE
+
+    if not player.auth(request_token(request.get_json(silent=True), ['player', 'token'])):
+        return jsonify(''), UNAUTHORIZED
+
+    status = get_queue().status(player.id, player.game_id)
+    if status is None:
+        return jsonify(''), UNPROCESSABLE
+    return jsonify(status)
@@ -1,11 +1,13 @@
 
 
-from flask import jsonify, request, url_for, Response
+from flask import request, url_for, Response, current_app
 from krokeapp import db
 from krokeapp import logger
 from krokeapp.models import Player, Game, Team
+from krokeapp.authentication import request_token
+from krokeapp.serialization import jsonify
 from krokeapp.status_codes import *
-from krokeapp.utils import get_from_dict
+from krokeapp.utils import get_from_dict, get_page_args
 
 
 from krokeapp.apiroutes import api_routes
@@ -14,18 +16,32 @@ from krokeapp.apiroutes import api_routes
 @api_routes.route("/players", methods=['GET', 'POST'])
 def players():
 
-    # just for debugging get all the players
+    # just for debugging get all the players, a page at a time
     if request.method == 'GET':
-        return jsonify(Player.players_to_json()) 
+        try:
+            limit, after = get_page_args(request.args, current_app.config)
+        except ValueError:
+            return jsonify(''), UNPROCESSABLE
+        return jsonify(Player.players_to_json(limit=limit, after=after))
 	
     if request.method == 'POST':
         pjson = request.get_json()
+
+        # many players can be created at once
+        player_items = get_from_dict(pjson, ['players'])
+        if player_items is not None:
+            return create_players(player_items)
+
         name = get_from_dict(pjson, ['player', 'name'])
         name = name if name is not None else "anonymous"        
 
         player = Player(name=name)
+        # assign the id for the token
+        db.session.flush()
+        player.create_token()
 
-        response = jsonify(player.to_json())
+        # the token is only ever sent to the created player
+        response = jsonify(player.to_json(with_token=True))
         response.status_code = RESOURCE_CREATED
         response.headers['location'] = 'players/player'+ str(player.id)
 
@@ -33,6 +49,33 @@ def players():
 
 
 
+def create_players(player_items):
+    """
+        Create the players of a bulk request with multi-row inserts,
+        see Player.new_players. Each item gets a status code of its own.
+    """
+    if not isinstance(player_items, list):
+        return jsonify('Players should be a list.'), UNPROCESSABLE
+
+    names = []
+    results = []
+    for item in player_items:
+        name = get_from_dict(item, ['player', 'name']) if isinstance(item, dict) else None
+        if isinstance(item, dict) and (name is None or isinstance(name, str)):
+            names.append(name if name is not None else "anonymous")
+            results.append(None)
+        else:
+            results.append({'status': UNPROCESSABLE})
+
+    players = iter(Player.new_players(names))
+    for i, result in enumerate(results):
+        if result is None:
+            player = next(players)
+            results[i] = dict(player.to_json(with_token=True), status=RESOURCE_CREATED)
+
+    return jsonify({'players': results}), SUCCESS
+
+
 @api_routes.route("/players/player<playerid>", methods=['PATCH'])
 def player(playerid):
 
@@ -42,12 +85,40 @@ def player(playerid):
     if request.method == 'PATCH':
         new_name = get_from_dict(rjson, ['player', 'name'])
 
-        # update requires player hash corresponding 
+        # update requires player token corresponding 
         # to the playerid and the new name
         if new_name is not None:
-            player = Player.query.filter_by(id=playerid).first()
+            player = Player.by_id(playerid)
+            if player is None:
+                return jsonify('No such player.'), UNPROCESSABLE
+            if not player.auth(request_token(rjson, ['player', 'token'])):
+                return jsonify('Invalid token.'), UNAUTHORIZED
             player.update_name(new_name)
             return jsonify(player.to_json()), SUCCESS			
         else:
             return jsonify('No name given.'), UNPROCESSABLE
 
+
+
+@api_routes.route("/players/player<playerid>/token", methods=['POST', 'DELETE'])
+def player_token(playerid):
+    """
+        Issue a new token for the player before the current one expires,
+        or revoke it with DELETE. Either way the token of the request
+        stops working.
+    """
+    rjson = request.get_json(silent=True)
+
+    player = Player.by_id(playerid)
+    if player is None:
+        return jsonify('No such player.'), UNPROCESSABLE
+    if not player.auth(request_token(rjson, ['player', 'token'])):
+        return jsonify('Invalid token.'), UNAUTHORIZED
+
+    if request.method == 'DELETE':
+        player.revoke_token()
+        return jsonify(player.to_json()), SUCCESS
+
+    player.create_token()
+    # the new token is only ever sent to the player
+    return jsonify(player.to_json(with_token=True)), SUCCESS
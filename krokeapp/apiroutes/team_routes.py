@@ -1,9 +1,12 @@
-from flask import jsonify, request, url_for, Response
+from flask import request, url_for, Response, current_app
 from krokeapp import db
 from krokeapp import logger
 from krokeapp.models import Player, Game, Team
+from krokeapp.authentication import request_token
+from krokeapp.cache import get_cache
+from krokeapp.serialization import jsonify
 from krokeapp.status_codes import *
-from krokeapp.utils import get_from_dict
+from krokeapp.utils import get_from_dict, get_page_args, conditional_response
 
 from krokeapp.apiroutes import api_routes
 
@@ -26,6 +29,9 @@ def teams(gameid):
         if player is None or game is None:
             return jsonify(''), UNPROCESSABLE
 
+        if not player.auth(request_token(rjson, ['player', 'token'])):
+            return jsonify(''), UNAUTHORIZED
+
         # player has to be in the game the team is being created
         if player.game is not game:
             return jsonify(''), PRECONDITION_FAILED
@@ -36,8 +42,12 @@ def teams(gameid):
 
 
     # get the teams
-    if request.method == 'GET':             
-        return jsonify(Team.teams_to_json(gameid=gameid))
+    if request.method == 'GET':
+        try:
+            limit, after = get_page_args(request.args, current_app.config)
+        except ValueError:
+            return jsonify(''), UNPROCESSABLE
+        return jsonify(Team.teams_to_json(gameid=gameid, limit=limit, after=after))
 
 @api_routes.route("/games/game<gameid>/teams/team<teamid>", methods=['PUT', 'PATCH', 'GET', 'DELETE'])
 def team(gameid, teamid):
@@ -60,15 +70,18 @@ def team(gameid, teamid):
         if player is None or game is None or team is None:
             return jsonify(), PRECONDITION_FAILED
 
-        # cannot add player twice
-        if player in team.players:
-            return jsonify(), PRECONDITION_FAILED
+        if not player.auth(request_token(rjson, ['player', 'token'])):
+            return jsonify(), UNAUTHORIZED
+
+        # the join is checked and done in one atomic update
+        if not team.add_player(player):
+            # cannot add player twice and only to team
+            # in the game they are in
+            if player.team_id == team.id or player.game_id != team.game_id:
+                return jsonify(), PRECONDITION_FAILED
+            # the team is full
+            return jsonify(), CONFLICT
 
-        # add player only to team in the game they are in
-        if player.game is not team.game:
-            return jsonify(), PRECONDITION_FAILED
-        
-        team.add_player(player)
         return jsonify(), SUCCESS
 
         
@@ -88,6 +101,10 @@ def team(gameid, teamid):
         player = Player.by_id(pid)
         if player is not None:
 
+            # players can only remove themselves
+            if not player.auth(request_token(rjson, ['del_player', 'token'])):
+                return jsonify(), UNAUTHORIZED
+
             # cannot leave from game or team player is not in
             if player.game is not game or player.team is not team:
                 return jsonify(), PRECONDITION_FAILED
@@ -105,9 +122,13 @@ def team(gameid, teamid):
 
     # return team info
     if request.method == 'GET':
-        team = Team.by_id(teamid)
-        if team is not None:
-            return jsonify(team.to_json())
+        # the team is served from the cache until it changes
+        # and on a miss the body is only built for clients without the current version
+        cached = get_cache().get_versioned(Team.cache_key(teamid), lambda: Team.current_etag(teamid),
+                                           lambda: Team.cached_json(teamid))
+        if cached is not None:
+            etag, make_json = cached
+            return conditional_response(etag, make_json)
         else:
             return jsonify(), UNPROCESSABLE
 
@@ -124,7 +145,7 @@ def team(gameid, teamid):
             return jsonify(), UNPROCESSABLE
 
         # only the owner can delete the game
-        if team.owner is not player:
+        if not player.auth(request_token(rjson, ['player', 'token'])) or team.owner is not player:
             return jsonify(), UNAUTHORIZED
 
         # finally delete the game
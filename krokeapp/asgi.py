@@ -0,0 +1,234 @@
+import asyncio
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from krokeapp import logger
+from krokeapp.background import stop_background_tasks
+from krokeapp.events import broker, format_event, keepalive_event
+from krokeapp.models import Game
+
+
+EVENTS_PATH = re.compile(r'^/games/game(?P<id>[^/]+)/events$')
+
+EVENT_STREAM_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+
+class AsyncStream:
+    """
+        Subscriber of the broker for a stream served on the event loop.
+        The events are published from the worker threads and handed
+        over to the loop.
+    """
+
+    def __init__(self, loop, maxsize):
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize)
+
+    def put_nowait(self, item):
+        try:
+            self._loop.call_soon_threadsafe(self._put, item)
+        except RuntimeError:
+            # the loop of a finished stream is closed
+            pass
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            logger.warning(f"Dropped {item[0]} event of a stalled stream")
+
+    async def get(self):
+        return await self._queue.get()
+
+
+def wsgi_environ(scope, body):
+    """
+        The WSGI environ of an ASGI http request
+    """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+
+    for name, value in scope['headers']:
+        name, value = name.decode('latin1'), value.decode('latin1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'content-length':
+            continue
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+
+    return environ
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class AsgiApp:
+    """
+        Serve the Flask app with an ASGI server. The lobby event streams
+        are served on the event loop, so an idle stream does not hold a
+        thread. The other requests run the Flask views in a pool of
+        ASGI_THREADS threads, one transaction each as under WSGI.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.executor = ThreadPoolExecutor(app.config['ASGI_THREADS'],
+                                           thread_name_prefix='krokeapp-asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(f"Unsupported connection type {scope['type']}")
+
+        match = EVENTS_PATH.match(scope['path'])
+        if match and scope['method'] == 'GET':
+            await self.game_events(match.group('id'), scope, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                stop_background_tasks(self.app)
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def in_app_context(self, function, *args):
+        with self.app.app_context():
+            return function(*args)
+
+    def run_wsgi(self, environ):
+        """
+            Run the Flask app on the request, in a worker thread
+        """
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin1'), value.encode('latin1'))
+                                   for name, value in headers]
+
+        iterable = self.app.wsgi_app(environ, start_response)
+        try:
+            body = b''.join(iterable)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+        return response['status'], response['headers'], body
+
+    async def wsgi(self, scope, receive, send):
+        body = await read_body(receive)
+        loop = asyncio.get_running_loop()
+        status, headers, body = await loop.run_in_executor(
+            self.executor, self.run_wsgi, wsgi_environ(scope, body))
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    def game_version(id):
+        game = Game.by_id(id)
+        return None if game is None else (game.id, game.version)
+
+    async def game_events(self, id, scope, receive, send):
+        """
+            The event stream of /games/game<id>/events served on the loop,
+            the same events as the Flask view sends
+        """
+        loop = asyncio.get_running_loop()
+        game = await loop.run_in_executor(self.executor, self.in_app_context, self.game_version, id)
+        if game is None:
+            # the error response of the Flask view
+            await self.wsgi(scope, receive, send)
+            return
+
+        game_id, known_version = game
+        keepalive = self.app.config['EVENTS_KEEPALIVE']
+        stream = AsyncStream(loop, broker.queue_size)
+        broker.subscribe(game_id, stream)
+        disconnected = asyncio.ensure_future(wait_disconnect(receive))
+
+        async def send_chunk(chunk):
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': EVENT_STREAM_HEADERS})
+            await send_chunk(format_event('hello', {'game': {'id': game_id, 'version': known_version}}))
+
+            while True:
+                getter = asyncio.ensure_future(stream.get())
+                done, pending = await asyncio.wait({getter, disconnected}, timeout=keepalive,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    getter.cancel()
+                    return
+
+                if getter not in done:
+                    getter.cancel()
+                    # check for changes made by the other workers
+                    chunk, known_version = await loop.run_in_executor(
+                        self.executor, self.in_app_context, keepalive_event, game_id, known_version)
+                    await send_chunk(chunk)
+                    if known_version is None:
+                        break
+                    continue
+
+                # known_version stays the version read from the database,
+                # the next keepalive reports the changes of the other workers
+                # made before this one too
+                event_type, data = getter.result()
+                await send_chunk(format_event(event_type, data))
+                if event_type == 'game_removed':
+                    break
+
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+            broker.unsubscribe(game_id, stream)
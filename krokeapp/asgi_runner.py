@@ -0,0 +1,10 @@
+from krokeapp.asgi import AsgiApp
+from krokeapp.runner import app as wsgi_app
+# Create an entry point for asgi servers, the lobby event streams
+# are kept open without holding a worker thread each.
+#
+# e.g. the application can be run with uvicorn with
+#
+#  $uvicorn krokeapp.asgi_runner:app
+
+app = AsgiApp(wsgi_app)
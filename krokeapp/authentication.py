@@ -1,7 +1,69 @@
+import base64
+import hashlib
+import hmac
+import secrets
+import time
+from datetime import datetime
 
-from 
+from flask import current_app, request
 
+from krokeapp.utils import get_from_dict
 
-def generate_player_token():
 
-    return ""
\ No newline at end of file
+def _signature(payload, secret):
+    digest = hmac.new(secret.encode(), payload.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:12]).decode()
+
+
+def generate_player_token(player_id):
+    """
+        Token of the form '<player id>.<expiry>.<nonce>.<signature>'
+        signed with the secret key of the app. The nonce keeps two
+        tokens issued in the same second apart. Returns the token and
+        the time it expires.
+    """
+    config = current_app.config
+    expires = int(time.time()) + config['TOKEN_EXPIRATION']
+    payload = f"{player_id}.{expires}.{secrets.token_urlsafe(6)}"
+
+    token = payload + "." + _signature(payload, config['SECRET_KEY'])
+    return token, datetime.utcfromtimestamp(expires)
+
+
+def verify_player_token(token):
+    """
+        Return the id of the player the token was issued to or None
+        for invalid and expired tokens. Only the signature is checked,
+        Player.auth also compares the token to the one stored for
+        the player.
+    """
+    if not isinstance(token, str):
+        return None
+
+    try:
+        player_id, expires, nonce, signature = token.split('.')
+        player_id = int(player_id)
+        expires = int(expires)
+    except ValueError:
+        return None
+
+    expected = _signature(f"{player_id}.{expires}.{nonce}", current_app.config['SECRET_KEY'])
+    if not hmac.compare_digest(signature, expected):
+        return None
+
+    if expires < time.time():
+        return None
+
+    return player_id
+
+
+def request_token(rjson, key_list):
+    """
+        The token of the request, given in the 'Authorization: Bearer'
+        header or in the request body under key_list
+    """
+    authorization = request.headers.get('Authorization', '')
+    if authorization.startswith('Bearer '):
+        return authorization[len('Bearer '):]
+
+    return get_from_dict(rjson, key_list)
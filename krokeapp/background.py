@@ -0,0 +1,70 @@
+import threading
+
+from krokeapp import logger
+
+
+class PeriodicTask(threading.Thread):
+    """
+        Run a function inside the app context every interval seconds
+        in a daemon thread. Errors are logged and the task keeps going.
+    """
+
+    def __init__(self, app, interval, function, name=None):
+        super().__init__(name=name or function.__name__, daemon=True)
+        self.app = app
+        self.interval = interval
+        self.function = function
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    self.function()
+            except Exception:
+                logger.exception(f"Background task {self.name} failed")
+
+    def stop(self):
+        self._stopped.set()
+
+
+def start_periodic_task(app, interval, function, name=None):
+    """
+        Start the task unless the interval is None. The running
+        tasks are kept in app.extensions['krokeapp_tasks'].
+    """
+    if interval is None:
+        return None
+
+    task = PeriodicTask(app, interval, function, name)
+    app.extensions.setdefault('krokeapp_tasks', []).append(task)
+    task.start()
+    return task
+
+
+def start_background_tasks(app):
+    """
+        Start the periodic tasks of a server, the apps of the scripts,
+        the tests and the benchmarks run without them
+    """
+    from krokeapp.matchmaking import tick
+    from krokeapp.models import Player
+    from krokeapp.reaper import reap
+
+    # clear the expired tokens
+    start_periodic_task(app, app.config['TOKEN_SWEEP_INTERVAL'], Player.clear_expired_tokens)
+    # reap the idle players and lobbies
+    start_periodic_task(app, app.config['REAP_INTERVAL'], reap)
+    # match the queued players in batches
+    start_periodic_task(app, app.config['MATCHMAKING_INTERVAL'], tick)
+
+
+def stop_background_tasks(app, timeout=None):
+    """
+        Stop the periodic tasks of the app and wait for the running ones
+    """
+    tasks = app.extensions.pop('krokeapp_tasks', [])
+    for task in tasks:
+        task.stop()
+    for task in tasks:
+        task.join(timeout)
@@ -0,0 +1,234 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context, request
+from sqlalchemy import event
+
+from krokeapp import db
+
+
+# returned by the backends for keys they do not have
+MISSING = object()
+
+
+class LRUCache:
+    """
+        Process local cache that drops the least recently used
+        entries when full and every entry after its time to live
+    """
+
+    name = 'local'
+
+    def __init__(self, max_entries=10000, ttl=10):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return MISSING
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    """
+        Cache shared by all the workers and nodes, stored in redis.
+        A local redis-server stands in for the shared one in development.
+    """
+
+    name = 'redis'
+
+    def __init__(self, url, ttl=10, prefix='krokeapp:'):
+        # only needed when the shared cache is used
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return MISSING
+        return json.loads(value)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def __len__(self):
+        return len(self.client.keys(self.prefix + '*'))
+
+
+class NullCache:
+    """
+        Backend of a disabled cache, everything is a miss
+    """
+
+    name = 'none'
+
+    def get(self, key):
+        return MISSING
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class ResourceCache:
+    """
+        Read-through cache of the serialized resources in front of
+        the database, counting the hits and misses
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        # the counters are shared by the threads of the process
+        self._lock = threading.Lock()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_or_build(self, key, build):
+        """
+            Return the cached value of the key or build it with build().
+            None values are not cached.
+        """
+        value = self.backend.get(key)
+        self._count(value is not MISSING)
+        if value is not MISSING:
+            return value
+
+        value = build()
+        if value is not None:
+            self.backend.set(key, value)
+        return value
+
+    def get_versioned(self, key, current_etag, build):
+        """
+            The ETag and a function returning the json of a resource
+            cached as (etag, json) by build(), None for missing ones.
+            On a miss of a conditional request only current_etag() is
+            read, the json is built and cached when the client does not
+            have that version.
+        """
+        value = self.backend.get(key)
+        self._count(value is not MISSING)
+        if value is MISSING and not request.if_none_match:
+            # the body is sent anyway
+            value = build()
+            if value is None:
+                return None
+            self.backend.set(key, value)
+        if value is not MISSING:
+            etag, resource_json = value
+            return etag, lambda: resource_json
+
+        etag = current_etag()
+        if etag is None:
+            return None
+
+        def make_json():
+            value = build()
+            if value is None:
+                # removed after the etag was read
+                return None
+            self.backend.set(key, value)
+            return value[1]
+
+        return etag, make_json
+
+    def invalidate(self, *keys):
+        self.backend.delete(*keys)
+
+    def stats(self):
+        return {
+            'backend': self.backend.name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.backend),
+        }
+
+
+def init_cache(app):
+    """
+        Create the cache of the app from the CACHE_* config
+    """
+    backend = app.config['CACHE_BACKEND']
+    if backend == 'local':
+        backend = LRUCache(app.config['CACHE_MAX_ENTRIES'], app.config['CACHE_TTL'])
+    elif backend == 'redis':
+        backend = RedisCache(app.config['CACHE_REDIS_URL'], app.config['CACHE_TTL'])
+    elif backend is None:
+        backend = NullCache()
+    else:
+        raise ValueError(f"Unknown cache backend {backend}")
+
+    app.extensions['krokeapp_cache'] = ResourceCache(backend)
+
+
+def get_cache():
+    return current_app.extensions['krokeapp_cache']
+
+
+def invalidate_after_commit(*keys):
+    """
+        Drop the cached keys now and once more after the session
+        commits, so a value cached by a concurrent read of the old
+        rows does not outlive the change
+    """
+    get_cache().invalidate(*keys)
+    db.session.info.setdefault('cache_invalidations', set()).update(keys)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_committed(session):
+    keys = session.info.pop('cache_invalidations', None)
+    if keys and has_app_context():
+        get_cache().invalidate(*keys)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_invalidations(session, previous_transaction):
+    session.info.pop('cache_invalidations', None)
@@ -3,7 +3,11 @@
 
 from krokeapp.models import Game,Player,Team
 from krokeapp import logger
-from sqlalchemy.exc import OperationalError
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import CreateIndex
 import os
 
 
@@ -13,19 +17,171 @@ def init_database(database, app):
 		database.create_all()
 		database.session.commit()
 
-def init_if_not_found(database,app):
+	# a new database needs none of the migrations
+	from krokeapp.migrations import latest_version, stamp
+	stamp(database.get_engine(app), latest_version())
+
+def create_missing_indexes(database, app):
+	"""
+		Create the indexes declared on the models that an existing
+		database does not have yet. Returns the names of the 
+		created indexes.
+	"""
+	engine = database.get_engine(app)
+	inspector = inspect(engine)
+	table_names = inspector.get_table_names()
+
+	created = []
+	for table in database.metadata.sorted_tables:
+		if table.name not in table_names:
+			continue
+		existing = {index['name'] for index in inspector.get_indexes(table.name)}
+		for index in table.indexes:
+			if index.name in existing:
+				continue
+			try:
+				create_index(engine, index)
+			except (OperationalError, ProgrammingError) as e:
+				# created by another process in the meantime
+				if 'already exists' not in str(e):
+					raise
+				continue
+			logger.info(f"Created index {index.name}")
+			created.append(index.name)
+
+	return created
+
+def create_index(engine, index):
+	"""
+		Create the index, on postgres without blocking the writes
+		to the table while it is built
+	"""
+	if engine.dialect.name != 'postgresql':
+		index.create(bind=engine)
+		return
+
+	statement = str(CreateIndex(index).compile(dialect=engine.dialect))
+	statement = statement.replace(' INDEX ', ' INDEX CONCURRENTLY ', 1)
+	# not allowed inside a transaction
+	with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+		connection.execute(text(statement))
+
+def configure_engine(database, app):
+	"""
+		Set up the database engine from the config. Server databases
+		get the DB_POOL_* pool settings. File based sqlite databases 
+		get a connection pool and the SQLITE_* pragmas are run on 
+		every new connection.
+	"""
+	uri = app.config['SQLALCHEMY_DATABASE_URI']
+	# heroku style urls are not understood by sqlalchemy
+	if uri.startswith('postgres://'):
+		uri = 'postgresql://' + uri[len('postgres://'):]
+		app.config['SQLALCHEMY_DATABASE_URI'] = uri
+	url = make_url(uri)
+
+	options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+
+	if url.drivername != 'sqlite':
+		options.setdefault('pool_size', app.config['DB_POOL_SIZE'])
+		options.setdefault('max_overflow', app.config['DB_MAX_OVERFLOW'])
+		options.setdefault('pool_recycle', app.config['DB_POOL_RECYCLE'])
+		options.setdefault('pool_pre_ping', app.config['DB_POOL_PRE_PING'])
+		app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+		return
+
+	in_memory = url.database in (None, '', ':memory:')
+	if app.config['SQLITE_POOL_SIZE'] and not in_memory:
+		options.setdefault('poolclass', QueuePool)
+		options.setdefault('pool_size', app.config['SQLITE_POOL_SIZE'])
+		# pooled connections are handed from thread to thread,
+		# a session still only uses one thread at a time
+		connect_args = dict(options.get('connect_args', {}))
+		connect_args.setdefault('check_same_thread', False)
+		options['connect_args'] = connect_args
+	app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+	pragmas = [
+		('journal_mode', app.config['SQLITE_JOURNAL_MODE']),
+		('synchronous', app.config['SQLITE_SYNCHRONOUS']),
+		('busy_timeout', app.config['SQLITE_BUSY_TIMEOUT']),
+		('mmap_size', app.config['SQLITE_MMAP_SIZE']),
+		('cache_size', app.config['SQLITE_CACHE_SIZE']),
+		('foreign_keys', app.config['SQLITE_FOREIGN_KEYS']),
+	]
+	pragmas = [f"PRAGMA {name} = {value}" for name, value in pragmas if value is not None]
+
+	def set_pragmas(dbapi_connection, connection_record):
+		cursor = dbapi_connection.cursor()
+		for pragma in pragmas:
+			cursor.execute(pragma)
+		cursor.close()
+
+	event.listen(database.get_engine(app), 'connect', set_pragmas)
+
+def register_request_transaction(database, app):
+	"""
+		Run each request in a single transaction. The changes are
+		committed once after a succesful response and rolled back
+		when the request fails or responds with an error code.
+	"""
+
+	@app.after_request
+	def commit_request(response):
+		if response.status_code < 400:
+			try:
+				database.session.commit()
+			except Exception:
+				# a failed commit turns into a server error
+				database.session.rollback()
+				raise
+		else:
+			database.session.rollback()
+		return response
+
+	@app.teardown_request
+	def rollback_request(exc):
+		if exc is not None:
+			database.session.rollback()
+
+def missing_tables(database, app):
+	"""
+		The tables of the models that the database does not have,
+		found from the table names without reading any rows
+	"""
+	table_names = set(inspect(database.get_engine(app)).get_table_names())
+	return [table for table in database.metadata.sorted_tables if table.name not in table_names]
 
-	try:
-		with app.app_context():		
-			Game.query.all()
-	except OperationalError:
+def init_if_not_found(database,app):
+	"""
+		Create the database, or the tables added by newer versions, when
+		missing. Only the schema is inspected, so starting a worker takes
+		the same time however much data there is.
+	"""
+	with app.app_context():
+		missing = missing_tables(database, app)
 
+	if len(missing) == len(database.metadata.sorted_tables):
 		logger.info("Database not found")
 		if app.config['AUTO_INIT_DB']:			
 			logger.info("Initializing database")
 			init_database(database, app)
 		else:
 			logger.info("Database not initialized, exiting.")
+		return
+
+	# add the tables of newer versions, e.g. name_sequence
+	if missing:
+		logger.info(f"Creating tables {', '.join(table.name for table in missing)}")
+		database.metadata.create_all(bind=database.get_engine(app), tables=missing)
+
+	# the columns and constraints of newer versions are added by the
+	# migrations, which are not run on startup
+	from krokeapp.migrations import latest_version, schema_version
+	version = schema_version(database.get_engine(app))
+	if version < latest_version():
+		logger.warning(f"The database schema is at version {version} of {latest_version()}, "
+		               "upgrade it with python run.py --migrate")
 
 def fill_database(database, app):
 
@@ -49,7 +205,10 @@ def fill_database(database, app):
 
 		database.session.add(game1)
 		database.session.add(game2)
+		database.session.flush()
 
+		# the players were added directly, count them for the summaries
+		Game.recount_players()
 		database.session.commit()
 
 		print(f"{game1}")
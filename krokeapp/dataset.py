@@ -0,0 +1,188 @@
+import math
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, select
+
+from krokeapp import db, logger
+from krokeapp.models import Game, NameSequence, Player, Team
+
+
+# rows per insert statement
+INSERT_BATCH = 10000
+
+# the capacities of the games and how common they are
+GAME_SIZES = (2, 4, 8, 16)
+GAME_SIZE_WEIGHTS = (0.2, 0.3, 0.3, 0.2)
+# share of the games that are full, the others are partly filled
+FULL_GAMES = 0.15
+# share of the players of a game that have picked a team
+PLAYERS_IN_TEAMS = 0.85
+
+# the games and the players were created during this many days
+HISTORY_DAYS = 30
+# hours since the last request of a player and minutes since the last
+# change of a game, well inside PLAYER_IDLE_TIMEOUT and GAME_IDLE_TIMEOUT.
+# The empty games are still reaped an hour after the generation, capacity
+# runs longer than that serve the dataset with REAP_INTERVAL=0
+MEAN_IDLE_HOURS = 6
+MAX_IDLE_HOURS = 24
+MAX_GAME_IDLE_MINUTES = 5
+
+
+def game_layout(rng, game_count):
+    """
+        The capacity, the number of players and the number of teams
+        of each game
+    """
+    capacities = rng.choices(GAME_SIZES, GAME_SIZE_WEIGHTS, k=game_count)
+    layout = []
+    for capacity in capacities:
+        if rng.random() < FULL_GAMES:
+            size = capacity
+        else:
+            # most games wait for a few more players
+            size = int(rng.betavariate(0.9, 1.3) * capacity)
+        if capacity < 4 or rng.random() < 0.3:
+            teams = 0
+        elif capacity == 16 and rng.random() < 0.3:
+            teams = 4
+        else:
+            teams = 2
+        layout.append((capacity, size, teams))
+    return layout
+
+
+def _insert(table, rows):
+    for first in range(0, len(rows), INSERT_BATCH):
+        db.session.execute(table.insert(), rows[first:first + INSERT_BATCH])
+
+
+def _set_owners(table, owners):
+    """
+        Set the owners by row id, the owners are inserted after
+        the games and the teams they own
+    """
+    statement = table.update().where(table.c.id == bindparam('row_id')).values(owner_id=bindparam('owner'))
+    for first in range(0, len(owners), INSERT_BATCH):
+        db.session.execute(statement, owners[first:first + INSERT_BATCH])
+
+
+def _sync_id_sequences(tables):
+    """
+        Move the id sequences of server databases past the inserted ids,
+        the rows were inserted with ids of their own. Sqlite takes the
+        next id from the table.
+    """
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return
+    for table in tables:
+        db.session.execute(f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), max(id)) "
+                           f"FROM {table.name} HAVING max(id) IS NOT NULL")
+
+
+def generate_dataset(player_count, game_count, seed=0, now=None):
+    """
+        Bulk load players, games and teams into an empty database, inside
+        the app context. The memberships are drawn from the seed, the same
+        seed always gives the same rows. Only the times move with now.
+        Returns the number of rows of each table.
+    """
+    if db.session.query(Player.id).first() or db.session.query(Game.id).first():
+        raise ValueError("The dataset is generated into an empty database")
+
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+
+    def created_time():
+        return now - timedelta(seconds=rng.random() * HISTORY_DAYS * 24 * 60 * 60)
+
+    def last_active():
+        hours = min(rng.expovariate(1 / MEAN_IDLE_HOURS), MAX_IDLE_HOURS)
+        return now - timedelta(hours=hours)
+
+    layout = game_layout(rng, game_count)
+    next_player = 1
+    next_team = 1
+    counts = {'players': 0, 'games': 0, 'teams': 0}
+
+    for first in range(0, game_count, INSERT_BATCH):
+        games, teams, players = [], [], []
+        game_owners, team_owners = [], []
+
+        for index in range(first, min(first + INSERT_BATCH, game_count)):
+            capacity, size, team_count = layout[index]
+            game_id = index + 1
+            # the last games stay empty when the players run out
+            size = min(size, player_count - next_player + 1)
+            members = list(range(next_player, next_player + size))
+            next_player += size
+
+            games.append({'id': game_id, 'name': 'game' + str(game_id), 'created_time': created_time(),
+                          'max_players': capacity, 'player_count': size, 'version': 1,
+                          'last_active': now - timedelta(minutes=rng.random() * MAX_GAME_IDLE_MINUTES)})
+            if members:
+                game_owners.append({'row_id': game_id, 'owner': members[0]})
+
+            # the teams are made by the players in the game
+            if not members:
+                team_count = 0
+            team_ids = list(range(next_team, next_team + team_count))
+            next_team += team_count
+            for team_id in team_ids:
+                teams.append({'id': team_id, 'name': 'team' + str(team_id), 'created_time': games[-1]['created_time'],
+                              'game_id': game_id, 'max_players': math.ceil(capacity / team_count), 'version': 1})
+
+            # the players that picked a team take turns in the teams
+            owners = {}
+            in_team = 0
+            for player_id in members:
+                team_id = None
+                if team_ids and rng.random() < PLAYERS_IN_TEAMS:
+                    team_id = team_ids[in_team % len(team_ids)]
+                    owners.setdefault(team_id, player_id)
+                    in_team += 1
+                players.append({'id': player_id, 'name': 'player' + str(player_id),
+                                'created_time': created_time(), 'last_active': last_active(),
+                                'game_id': game_id, 'team_id': team_id})
+            # the teams nobody picked are owned by the owner of the game
+            team_owners.extend({'row_id': team_id, 'owner': owners.get(team_id, members[0])}
+                               for team_id in team_ids)
+
+        _insert(Game.__table__, games)
+        _insert(Team.__table__, teams)
+        _insert(Player.__table__, players)
+        _set_owners(Game.__table__, game_owners)
+        _set_owners(Team.__table__, team_owners)
+        db.session.commit()
+
+        counts['games'] += len(games)
+        counts['teams'] += len(teams)
+        counts['players'] += len(players)
+        logger.info(f"Generated {counts['games']} of {game_count} games")
+
+    # the players waiting in the lobby, in no game
+    for first in range(next_player, player_count + 1, INSERT_BATCH):
+        players = [{'id': player_id, 'name': 'player' + str(player_id),
+                    'created_time': created_time(), 'last_active': last_active()}
+                   for player_id in range(first, min(first + INSERT_BATCH, player_count + 1))]
+        _insert(Player.__table__, players)
+        db.session.commit()
+        counts['players'] += len(players)
+
+    _sync_id_sequences((Game.__table__, Team.__table__, Player.__table__))
+
+    # the names of new games continue after the generated ones
+    sequence = NameSequence.__table__
+    current = db.session.execute(select([sequence.c.next_value])
+                                 .where(sequence.c.name == 'game_name')).scalar()
+    if current is None:
+        db.session.execute(sequence.insert().values(name='game_name', next_value=game_count + 1))
+    elif current <= game_count:
+        db.session.execute(sequence.update().where(sequence.c.name == 'game_name')
+                                   .values(next_value=game_count + 1))
+    db.session.commit()
+
+    logger.info(f"Generated {counts['players']} players, {counts['games']} games "
+                f"and {counts['teams']} teams")
+    return counts
@@ -0,0 +1,103 @@
+import json
+import queue
+import threading
+from collections import defaultdict
+
+from sqlalchemy import event
+
+from krokeapp import db, logger
+
+
+class EventBroker:
+    """
+        In-process publish/subscribe of lobby changes.
+        Each game is a channel and every subscriber of the
+        channel gets its own queue of (event type, data) tuples.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._channels = defaultdict(set)
+
+    def subscribe(self, game_id, stream=None):
+        """
+            Subscribe a new queue, or any stream with a put_nowait,
+            to the events of the game
+        """
+        if stream is None:
+            stream = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._channels[game_id].add(stream)
+        return stream
+
+    def unsubscribe(self, game_id, stream):
+        with self._lock:
+            subscribers = self._channels.get(game_id)
+            if subscribers is not None:
+                subscribers.discard(stream)
+                if not subscribers:
+                    del self._channels[game_id]
+
+    def subscriber_count(self, game_id):
+        with self._lock:
+            return len(self._channels.get(game_id, ()))
+
+    def publish(self, game_id, event_type, data):
+        with self._lock:
+            subscribers = list(self._channels.get(game_id, ()))
+
+        for stream in subscribers:
+            try:
+                stream.put_nowait((event_type, data))
+            except queue.Full:
+                # a stalled client does not hold up the publisher,
+                # it will notice the change from the game version
+                logger.warning(f"Dropped {event_type} event of game {game_id}")
+
+
+# the broker shared by the whole process
+broker = EventBroker()
+
+
+def queue_event(game_id, event_type, data):
+    """
+        Queue an event to be published once the current
+        database session commits. Events of rolled back
+        changes are never published.
+    """
+    db.session.info.setdefault('pending_events', []).append((game_id, event_type, data))
+
+
+def format_event(event_type, data):
+    """
+        Format an event in the text/event-stream wire format
+    """
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+def keepalive_event(game_id, known_version):
+    """
+        Check the game version for the changes made by the other workers,
+        inside the app context. Returns the chunk to send and the current
+        version, which is None when the game was removed.
+    """
+    from krokeapp.models import Game
+
+    current_version = db.session.query(Game.version).filter_by(id=game_id).scalar()
+    if current_version is None:
+        return format_event('game_removed', {'game': {'id': game_id}}), None
+    if current_version != known_version:
+        return format_event('changed', {'game': {'id': game_id, 'version': current_version}}), current_version
+    return ": keepalive\n\n", current_version
+
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_pending(session):
+    for game_id, event_type, data in session.info.pop('pending_events', ()):
+        broker.publish(game_id, event_type, data)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    session.info.pop('pending_events', None)
@@ -0,0 +1,222 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from krokeapp import db, logger
+from krokeapp.models import Game, Player, Team
+from krokeapp.sequence import next_value
+
+
+class MatchmakingQueue:
+    """
+        The players waiting for a match, in a heap ordered by their
+        priority and then by the time they joined the queue. Leaving
+        the queue only marks the entry, it is skipped when popped.
+    """
+
+    def __init__(self, max_results=10000):
+        self._heap = []
+        self._entries = {}
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        # the matches of the players until they ask for them
+        self._results = OrderedDict()
+        self.max_results = max_results
+
+        self.ticks = 0
+        self.matched = 0
+        self.wait_total = 0.0
+        self.waits = []
+
+    def join(self, playerid, priority=0):
+        """
+            Queue the player, a higher priority gets matched sooner.
+            Returns False for players already in the queue.
+        """
+        with self._lock:
+            if playerid in self._entries:
+                return False
+            # the player has left the game of the earlier match
+            self._results.pop(playerid, None)
+            entry = [-priority, time.monotonic(), next(self._order), playerid]
+            self._entries[playerid] = entry
+            heapq.heappush(self._heap, entry)
+
+            # drop the entries of the players that left the queue
+            if len(self._heap) > 2 * len(self._entries) + 64:
+                self._heap = list(self._entries.values())
+                heapq.heapify(self._heap)
+            return True
+
+    def leave(self, playerid):
+        """
+            Return whether the player was in the queue
+        """
+        with self._lock:
+            return self._remove(playerid)
+
+    def _remove(self, playerid):
+        entry = self._entries.pop(playerid, None)
+        if entry is None:
+            return False
+        # skipped when it comes up in the heap
+        entry[-1] = None
+        return True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def status(self, playerid, game_id=None):
+        """
+            The match of the player, how long they have waited
+            in the queue or None for players not in the queue. The
+            match is kept while the player is in its game, game_id.
+        """
+        with self._lock:
+            result = self._results.get(playerid)
+            if result is not None:
+                if result['game']['id'] == game_id:
+                    return {'match': result}
+                # the player has left the game of the match
+                del self._results[playerid]
+            entry = self._entries.get(playerid)
+            if entry is None:
+                return None
+            return {'queued': {'waited': time.monotonic() - entry[1]}}
+
+    def pop_matches(self, size, max_matches):
+        """
+            Take the players of up to max_matches full matches
+            from the front of the queue
+        """
+        matches = []
+        with self._lock:
+            while len(self._entries) >= size and len(matches) < max_matches:
+                match = []
+                while len(match) < size:
+                    entry = heapq.heappop(self._heap)
+                    if entry[-1] is not None:
+                        del self._entries[entry[-1]]
+                        match.append(entry)
+                matches.append(match)
+        return matches
+
+    def requeue(self, entries):
+        """
+            Put the entries of a failed match back as they were
+        """
+        with self._lock:
+            for entry in entries:
+                if entry[-1] not in self._entries:
+                    self._entries[entry[-1]] = entry
+                    heapq.heappush(self._heap, entry)
+
+    def record(self, entries, results):
+        """
+            Store the matches of the players, by player id,
+            and their time in the queue
+        """
+        now = time.monotonic()
+        with self._lock:
+            for entry in entries:
+                self._results[entry[-1]] = results[entry[-1]]
+                waited = now - entry[1]
+                self.wait_total += waited
+                self.waits.append(waited)
+                self.matched += 1
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+            # only the recent waits are kept for the statistics
+            del self.waits[:-self.max_results]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'waiting': len(self._entries),
+                'matched': self.matched,
+                'ticks': self.ticks,
+                'mean_wait': self.wait_total / self.matched if self.matched else None,
+            }
+
+
+def init_matchmaking(app):
+    app.extensions['krokeapp_matchmaking'] = MatchmakingQueue(app.config['MATCHMAKING_MAX_RESULTS'])
+
+
+def get_queue():
+    return current_app.extensions['krokeapp_matchmaking']
+
+
+def form_match(entries, teams, name):
+    """
+        Create a game for the players and split them into balanced
+        teams, the players take turns picking a team in the order
+        they were queued. Returns the ids of the game and the teams
+        by player id.
+    """
+    playerids = [entry[-1] for entry in entries]
+    # locked until the commit, a concurrent tick waits and then sees them in the game
+    players = {player.id: player
+               for player in Player.query.filter(Player.id.in_(playerids)).with_for_update()}
+    # players deleted while waiting drop out of the match, as do the
+    # ones that joined a game meanwhile, e.g. through another worker
+    players = [players[playerid] for playerid in playerids
+               if playerid in players and players[playerid].game_id is None]
+    if not players:
+        return {}
+
+    game = Game.new_game(players[0], name=name)
+    game.max_players = len(entries)
+    players = game.add_players(players)
+
+    result = {player.id: {'game': {'id': game.id}, 'team': None} for player in players}
+    for i in range(min(teams, len(players))):
+        members = players[i::teams]
+        team = Team.new_team(game, members[0], name=f"team{i + 1}")
+        # the team has room for its share of the match
+        team.max_players = len(members)
+        for player in team.add_players(members):
+            result[player.id]['team'] = {'id': team.id}
+    return result
+
+
+def tick():
+    """
+        Form the matches of the queued players in batches,
+        committing all the matches of a tick at once. The queue and
+        the matches are kept in the memory of the process, the
+        matchmaking runs in a single worker.
+    """
+    queue = get_queue()
+    config = current_app.config
+    size = config['MATCH_SIZE']
+
+    matches = queue.pop_matches(size, config['MATCHMAKING_MAX_MATCHES'])
+    queue.ticks += 1
+    if not matches:
+        return 0
+
+    # all the game names before the session writes anything, the
+    # sequence reserves its blocks on a connection of its own
+    names = ["game" + str(next_value('game_name')) for entries in matches]
+
+    results = []
+    try:
+        for entries, name in zip(matches, names):
+            results.append((entries, form_match(entries, config['MATCH_TEAMS'], name)))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        for entries in matches:
+            queue.requeue(entries)
+        raise
+
+    for entries, result in results:
+        queue.record([entry for entry in entries if entry[-1] in result], result)
+
+    logger.info(f"Matched {len(matches)} games of {size} players")
+    return len(matches)
@@ -0,0 +1,157 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+from krokeapp import logger
+
+
+# upper bounds of the buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """
+        Cumulative histogram in the style of Prometheus
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def exposition(self, name, labels):
+        """
+            The lines of the histogram in the Prometheus text format
+        """
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class RequestMetrics:
+    """
+        The latencies, the query counts and the database time
+        of the requests by route, and the count of slow queries
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.queries = {}
+        self.db_time = {}
+        self.responses = {}
+        self.slow_queries = 0
+
+    def record(self, method, endpoint, status, seconds, queries, db_seconds):
+        route = (method, endpoint)
+        with self._lock:
+            if route not in self.latency:
+                self.latency[route] = Histogram(LATENCY_BUCKETS)
+                self.queries[route] = Histogram(QUERY_COUNT_BUCKETS)
+                self.db_time[route] = Histogram(LATENCY_BUCKETS)
+            self.latency[route].observe(seconds)
+            self.queries[route].observe(queries)
+            self.db_time[route].observe(db_seconds)
+            self.responses[route + (status,)] = self.responses.get(route + (status,), 0) + 1
+
+    def record_slow_query(self):
+        with self._lock:
+            self.slow_queries += 1
+
+    def exposition(self):
+        """
+            All the metrics in the Prometheus text format
+        """
+        histograms = (
+            ('krokeapp_request_duration_seconds', 'Time taken by the requests', self.latency),
+            ('krokeapp_request_queries', 'SQL statements sent by the requests', self.queries),
+            ('krokeapp_request_db_seconds', 'Time the requests spent in the database', self.db_time),
+        )
+
+        with self._lock:
+            lines = []
+            for name, description, by_route in histograms:
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+                for (method, endpoint), histogram in sorted(by_route.items()):
+                    lines.extend(histogram.exposition(name, f'method="{method}",endpoint="{endpoint}"'))
+
+            lines.append('# HELP krokeapp_responses_total Responses by route and status code')
+            lines.append('# TYPE krokeapp_responses_total counter')
+            for (method, endpoint, status), count in sorted(self.responses.items()):
+                lines.append(f'krokeapp_responses_total{{method="{method}",endpoint="{endpoint}",'
+                             f'status="{status}"}} {count}')
+
+            lines.append('# HELP krokeapp_slow_queries_total SQL statements slower than the threshold')
+            lines.append('# TYPE krokeapp_slow_queries_total counter')
+            lines.append(f'krokeapp_slow_queries_total {self.slow_queries}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def init_metrics(database, app):
+    """
+        Time the requests and their SQL statements when METRICS_ENABLED
+        is set and serve the results at /metrics. Nothing is hooked
+        into the app or the engine otherwise.
+    """
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    metrics = RequestMetrics()
+    app.extensions['krokeapp_metrics'] = metrics
+    slow_query_threshold = app.config['SLOW_QUERY_THRESHOLD']
+
+    engine = database.get_engine(app)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('krokeapp_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['krokeapp_query_start'].pop()
+
+        if slow_query_threshold is not None and elapsed >= slow_query_threshold:
+            metrics.record_slow_query()
+            logger.warning(f"Slow query ({elapsed:.3f}s): {statement}")
+
+        # queries of the background tasks are not counted to any request
+        if has_request_context() and 'metrics_start' in g:
+            g.metrics_queries += 1
+            g.metrics_db_time += elapsed
+
+    @app.before_request
+    def start_request():
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_db_time = 0.0
+
+    # registered before the request transaction so the commit is timed as well
+    @app.after_request
+    def end_request(response):
+        if 'metrics_start' in g:
+            metrics.record(request.method, request.endpoint or 'unknown', response.status_code,
+                           time.perf_counter() - g.metrics_start,
+                           g.metrics_queries, g.metrics_db_time)
+        return response
+
+    def metrics_endpoint():
+        return Response(metrics.exposition(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
@@ -0,0 +1,317 @@
+from collections import namedtuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from krokeapp import db, logger
+from krokeapp.database import create_missing_indexes
+from krokeapp.models import Game, NameSequence, Player, SchemaVersion, Team
+
+
+Migration = namedtuple('Migration', 'version description function')
+
+# the migrations in the order of their versions
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """
+        Register the decorated function as the migration to the version.
+        It is called with the engine, the app and the batch size
+        and must leave an already migrated database as it is, databases
+        without a schema version may have any of the changes already.
+    """
+    def register(function):
+        assert not MIGRATIONS or MIGRATIONS[-1].version < version
+        MIGRATIONS.append(Migration(version, description, function))
+        return function
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1].version
+
+
+def schema_version(engine):
+    """
+        The version of the database, 0 when it has not been versioned
+    """
+    if not SchemaVersion.__table__.exists(bind=engine):
+        return 0
+    with engine.connect() as connection:
+        version = connection.execute(SchemaVersion.__table__.select()).first()
+    return version.version if version is not None else 0
+
+
+def stamp(engine, version):
+    """
+        Record the version of the schema
+    """
+    table = SchemaVersion.__table__
+    table.create(bind=engine, checkfirst=True)
+    with engine.begin() as connection:
+        if connection.execute(table.update().where(table.c.id == 1).values(version=version)).rowcount == 0:
+            connection.execute(table.insert().values(id=1, version=version))
+
+
+def migrate(database, app, batch_size=None):
+    """
+        Bring the database to the latest version. Each migration runs
+        in short transactions of its own, the rows of large tables are
+        changed a batch at a time, so the app keeps serving during the
+        upgrade. Returns the versions applied.
+    """
+    engine = database.get_engine(app)
+    batch_size = batch_size or app.config['MIGRATION_BATCH_SIZE']
+
+    applied = []
+    current = schema_version(engine)
+    for step in MIGRATIONS:
+        if step.version <= current:
+            continue
+        logger.info(f"Migrating to version {step.version}: {step.description}")
+        step.function(engine, app, batch_size)
+        stamp(engine, step.version)
+        applied.append(step.version)
+
+    return applied
+
+
+def column_names(engine, table):
+    return {column['name'] for column in inspect(engine).get_columns(table.name)}
+
+
+def add_column(engine, table, name, definition):
+    """
+        Add the column of the model unless the table has it,
+        definition is the sql after the type, e.g. NOT NULL DEFAULT 1
+    """
+    if name in column_names(engine, table):
+        return
+    column_type = table.c[name].type.compile(dialect=engine.dialect)
+    with engine.begin() as connection:
+        connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type} {definition}"))
+
+
+def update_in_batches(engine, table, statement, batch_size):
+    """
+        Run the statement over the rows of the table a range of ids at
+        a time, the statement gets the range as :first and :last. Each
+        batch commits on its own, the writes of the app go in between.
+    """
+    with engine.connect() as connection:
+        first_id, last_id = connection.execute(text(f"SELECT min(id), max(id) FROM {table.name}")).first()
+    if first_id is None:
+        return
+
+    for first in range(first_id, last_id + 1, batch_size):
+        with engine.begin() as connection:
+            connection.execute(text(statement), {'first': first, 'last': first + batch_size - 1})
+
+
+@migration(1, "Add the versions and the capacities of games and teams")
+def add_versions_and_capacities(engine, app, batch_size):
+    # constant defaults are added without rewriting the tables
+    add_column(engine, Game.__table__, 'version', "NOT NULL DEFAULT 1")
+    add_column(engine, Game.__table__, 'max_players', f"NOT NULL DEFAULT {int(app.config['GAME_MAX_PLAYERS'])}")
+    add_column(engine, Team.__table__, 'version', "NOT NULL DEFAULT 1")
+    add_column(engine, Team.__table__, 'max_players', f"NOT NULL DEFAULT {int(app.config['TEAM_MAX_PLAYERS'])}")
+
+
+@migration(2, "Count the players of the games")
+def add_player_counts(engine, app, batch_size):
+    add_column(engine, Game.__table__, 'player_count', "NOT NULL DEFAULT 0")
+    update_in_batches(engine, Game.__table__, """
+        UPDATE game SET player_count = (SELECT count(*) FROM player WHERE player.game_id = game.id)
+        WHERE game.id BETWEEN :first AND :last
+    """, batch_size)
+
+
+@migration(3, "Track the activity of players and games")
+def add_last_active(engine, app, batch_size):
+    # the reaper counts from the creation time while these are null
+    add_column(engine, Player.__table__, 'last_active', "")
+    add_column(engine, Game.__table__, 'last_active', "")
+
+
+@migration(4, "Widen the player tokens")
+def widen_player_tokens(engine, app, batch_size):
+    # sqlite does not enforce the length
+    if engine.dialect.name != 'postgresql':
+        return
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE player ALTER COLUMN token TYPE VARCHAR(64)"))
+
+
+@migration(5, "Add the name sequences")
+def add_name_sequences(engine, app, batch_size):
+    NameSequence.__table__.create(bind=engine, checkfirst=True)
+
+
+@migration(6, "Index the foreign keys and the listings")
+def add_indexes(engine, app, batch_size):
+    create_missing_indexes(db, app)
+
+
+def foreign_key_rules(engine, table):
+    """
+        The ON DELETE rules of the foreign keys of the table in
+        the database, by column
+    """
+    if engine.dialect.name == 'sqlite':
+        # not reflected by sqlalchemy for sqlite
+        with engine.connect() as connection:
+            rows = connection.execute(text(f"PRAGMA foreign_key_list({table.name})")).fetchall()
+        return {row[3]: None if row[6] == 'NO ACTION' else row[6] for row in rows}
+
+    return {fk['constrained_columns'][0]: fk['options'].get('ondelete')
+            for fk in inspect(engine).get_foreign_keys(table.name)}
+
+
+SQLITE_COPY_TRIGGERS = ('insert', 'update', 'delete')
+
+
+def drop_sqlite_copy(engine, table):
+    """
+        Drop the copy of the table and the triggers that fill it
+    """
+    new_name = '_migrate_' + table.name
+    with engine.begin() as connection:
+        for operation in SQLITE_COPY_TRIGGERS:
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {new_name}_{operation}"))
+        connection.execute(text(f"DROP TABLE IF EXISTS {new_name}"))
+
+
+def rebuild_sqlite_table(engine, table, batch_size):
+    """
+        Recreate the table as the model declares it, sqlite cannot
+        change the constraints of a table in place. The rows are copied
+        a range of ids at a time while triggers mirror the writes of the
+        app into the copy, the writes only wait for the final swap.
+    """
+    new_name = '_migrate_' + table.name
+    create_table = str(CreateTable(table).compile(dialect=engine.dialect))
+    create_table = create_table.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {new_name} ", 1)
+    columns = ', '.join(column.name for column in table.columns)
+    new_values = ', '.join('NEW.' + column.name for column in table.columns)
+    mirror = f"INSERT OR REPLACE INTO {new_name} ({columns}) VALUES ({new_values});"
+    triggers = {
+        'insert': mirror,
+        'update': f"DELETE FROM {new_name} WHERE id = OLD.id; {mirror}",
+        'delete': f"DELETE FROM {new_name} WHERE id = OLD.id;",
+    }
+
+    # left over by an interrupted migration
+    drop_sqlite_copy(engine, table)
+    with engine.begin() as connection:
+        connection.execute(text(create_table))
+        for operation in SQLITE_COPY_TRIGGERS:
+            connection.execute(text(f"CREATE TRIGGER {new_name}_{operation} AFTER {operation.upper()} "
+                                    f"ON {table.name} BEGIN {triggers[operation]} END"))
+
+    try:
+        # the rows the triggers already copied are newer
+        update_in_batches(engine, table, f"""
+            INSERT OR IGNORE INTO {new_name} ({columns}) SELECT {columns} FROM {table.name}
+            WHERE id BETWEEN :first AND :last
+        """, batch_size)
+        swap_sqlite_copy(engine, table)
+    except Exception:
+        # the triggers would keep failing the writes of the app
+        drop_sqlite_copy(engine, table)
+        raise
+
+
+def swap_sqlite_copy(engine, table):
+    """
+        Replace the table with its copy in one short transaction
+    """
+    new_name = '_migrate_' + table.name
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        foreign_keys = cursor.execute("PRAGMA foreign_keys").fetchone()[0]
+        # the references to the table would be checked while it is gone
+        cursor.execute("PRAGMA foreign_keys = OFF")
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            # the triggers go with the table
+            cursor.execute(f"DROP TABLE {table.name}")
+            cursor.execute(f"ALTER TABLE {new_name} RENAME TO {table.name}")
+            for index in table.indexes:
+                cursor.execute(str(CreateIndex(index).compile(dialect=engine.dialect)))
+            violations = cursor.execute(f"PRAGMA foreign_key_check({table.name})").fetchall()
+            if violations:
+                raise ValueError(f"{len(violations)} rows of {table.name} break its foreign keys")
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+            cursor.close()
+    finally:
+        connection.close()
+
+
+# the references left behind by deleting games and teams without
+# their members, in the order they are cleared
+DANGLING_REFERENCES = (
+    (Player.__table__, """
+        UPDATE player SET team_id = NULL WHERE id BETWEEN :first AND :last AND team_id IS NOT NULL
+        AND team_id NOT IN (SELECT team.id FROM team JOIN game ON game.id = team.game_id)
+    """),
+    (Team.__table__, """
+        DELETE FROM team WHERE id BETWEEN :first AND :last AND game_id NOT IN (SELECT id FROM game)
+    """),
+    (Player.__table__, """
+        UPDATE player SET game_id = NULL WHERE id BETWEEN :first AND :last AND game_id IS NOT NULL
+        AND game_id NOT IN (SELECT id FROM game)
+    """),
+    (Game.__table__, """
+        UPDATE game SET owner_id = NULL WHERE id BETWEEN :first AND :last AND owner_id IS NOT NULL
+        AND owner_id NOT IN (SELECT id FROM player)
+    """),
+    (Team.__table__, """
+        UPDATE team SET owner_id = NULL WHERE id BETWEEN :first AND :last AND owner_id IS NOT NULL
+        AND owner_id NOT IN (SELECT id FROM player)
+    """),
+)
+
+
+def replace_foreign_key(engine, table, foreign_key):
+    """
+        Replace the constraint without blocking the writes, the rows
+        are validated after the new constraint is in place
+    """
+    name = next(fk['name'] for fk in inspect(engine).get_foreign_keys(table.name)
+                if fk['constrained_columns'] == [foreign_key.parent.name])
+    with engine.begin() as connection:
+        connection.execute(text(f"ALTER TABLE {table.name} DROP CONSTRAINT {name}"))
+        connection.execute(text(
+            f"ALTER TABLE {table.name} ADD CONSTRAINT {name} FOREIGN KEY ({foreign_key.parent.name}) "
+            f"REFERENCES {foreign_key.column.table.name} ({foreign_key.column.name}) "
+            f"ON DELETE {foreign_key.ondelete} NOT VALID"))
+    with engine.begin() as connection:
+        connection.execute(text(f"ALTER TABLE {table.name} VALIDATE CONSTRAINT {name}"))
+
+
+@migration(7, "Let the database cascade the deletes")
+def add_delete_rules(engine, app, batch_size):
+    # the new constraints are checked against the existing rows
+    for table, statement in DANGLING_REFERENCES:
+        update_in_batches(engine, table, statement, batch_size)
+
+    for table in (Game.__table__, Team.__table__, Player.__table__):
+        rules = foreign_key_rules(engine, table)
+        outdated = [fk for fk in table.foreign_keys
+                    if (rules.get(fk.parent.name) or '').upper() != (fk.ondelete or '').upper()]
+        if not outdated:
+            continue
+
+        logger.info(f"Replacing the foreign keys of {table.name}")
+        if engine.dialect.name == 'sqlite':
+            rebuild_sqlite_table(engine, table, batch_size)
+        else:
+            for foreign_key in outdated:
+                replace_foreign_key(engine, table, foreign_key)
@@ -1,89 +1,371 @@
 
 
+import hmac
+from collections import Counter
 from datetime import datetime
 
-from flask import url_for
+from flask import current_app
+from sqlalchemy.orm import joinedload, selectinload
 
 from krokeapp import db
-from krokeapp.authentication import generate_player_token
+from krokeapp.authentication import generate_player_token, verify_player_token
+from krokeapp.cache import invalidate_after_commit
+from krokeapp.events import queue_event
+from krokeapp.utils import paginate_query, to_id, url_template
+
+
+# rows per multi-row insert, within the bound parameters sqlite allows
+INSERT_BATCH = 250
 
 
 class Game(db.Model):
     # __tablename__ = 'right'
 
-    counter = 0
+    __table_args__ = (
+        # the games of an owner, a page at a time
+        db.Index('ix_game_owner_id_id', 'owner_id', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    created_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
     name = db.Column(db.String(30), unique=False, nullable=False)
 
-    owner_id = db.Column(db.Integer, db.ForeignKey('player.id', use_alter=True, name='fk_owner_id'))
+    # the capacity of the game, defaults to the application config
+    max_players = db.Column(db.Integer, nullable=False,
+                            default=lambda: current_app.config['GAME_MAX_PLAYERS'])
+
+    # bumped on every change to the game, used as the ETag
+    version = db.Column(db.Integer, nullable=False, default=1)
+    # the players in the game, kept up to date by the join and leave
+    # paths for the lobby summaries, see games_summary_json
+    player_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # the last change to the game, idle empty games are reaped
+    last_active = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    owner_id = db.Column(db.Integer, db.ForeignKey('player.id', use_alter=True, name='fk_owner_id',
+                                                   ondelete='SET NULL'))
     owner = db.relationship('Player', foreign_keys=owner_id, post_update=True)
     
     # set the teams under games
-    teams = db.relationship('Team', backref='game')
+    # the database deletes the teams with the game, see remove_game
+    teams = db.relationship('Team', backref='game', passive_deletes=True)
 
     def to_json(self):
         game_json ={
                 'game': {                   
                         'id': self.id,
                         'name': self.name,
-                        'url': url_for('api.game', id=self.id),
-                        'owner': self.owner.to_json(),
-                        'players' : []        
+                        'url': url_template('api.game', 'id').format(id=self.id),
+                        'max_players': self.max_players,
+                        # the owner is gone when reaped, see krokeapp.reaper
+                        'owner': self.owner.to_json() if self.owner is not None else None,
+                        'players' : Player.list_json(self.players)
                         }
                 }
-        # add the players
-        for player in self.players:
-            game_json['game']['players'].append(player.to_json())
-
         return game_json
 
     def add_player(self, player):
         """
-            Return whether player addition was succesful
+            Return whether player addition was succesful. The player
+            joins with one conditional update that only goes through
+            while the player is not in the game and the game has room.
         """        
         if player is None:
             return False
-        
-        self.players.append(player)        
-        db.session.commit()
+
+        old_game = player.game
+        old_team_id = player.team_id
+        if not self.lock():
+            return False
+
+        members = db.aliased(Player)
+        player_count = db.session.query(db.func.count(members.id)) \
+                                 .filter(members.game_id == self.id).as_scalar()
+        capacity = db.session.query(Game.max_players).filter(Game.id == self.id).as_scalar()
+        # the team of the old game is left as well
+        joined = Player.query.filter(Player.id == player.id,
+                                     db.or_(Player.game_id.is_(None), Player.game_id != self.id),
+                                     player_count < capacity) \
+                             .update({Player.game_id: self.id, Player.team_id: None},
+                                     synchronize_session=False)
+
+        db.session.expire(player, ['game_id', 'game', 'team_id', 'team'])
+        if not joined:
+            return False
+
+        self.player_count = Game.player_count + 1
+        # the game and the team the player switches from change as well
+        if old_team_id is not None:
+            Team.touch_ids([old_team_id])
+            queue_event(old_game.id, 'team_left', dict(player.to_json(), team={'id': old_team_id}))
+        if old_game is not None:
+            old_game.touch()
+            old_game.player_count = Game.player_count - 1
+            queue_event(old_game.id, 'player_left', player.to_json())
+        queue_event(self.id, 'player_joined', player.to_json())
+        return True
+
+    def add_players(self, players):
+        """
+            Add many players at once with set-based updates
+            instead of one statement per player. Players are added
+            in order while there is room, returns the ones that joined.
+        """
+        if not players or not self.lock():
+            return []
+
+        player_count = db.session.query(db.func.count(Player.id)) \
+                                 .filter(Player.game_id == self.id).scalar()
+        players = players[:max(self.max_players - player_count, 0)]
+        if not players:
+            return []
+
+        player_ids = [player.id for player in players]
+
+        # the games and the teams the players switch from change as well
+        old_game_ids = {player.game_id for player in players} - {None, self.id}
+        Game.touch_ids(old_game_ids)
+        leaving = Counter(player.game_id for player in players if player.game_id in old_game_ids)
+        Game.count_players({gameid: -count for gameid, count in leaving.items()})
+        Team.touch_ids({player.team_id for player in players
+                        if player.game_id in old_game_ids and player.team_id is not None})
+
+        for player in players:
+            if player.game_id in old_game_ids:
+                if player.team_id is not None:
+                    queue_event(player.game_id, 'team_left',
+                                dict(player.to_json(), team={'id': player.team_id}))
+                queue_event(player.game_id, 'player_left', player.to_json())
+            queue_event(self.id, 'player_joined', player.to_json())
+
+        joined = Player.query.filter(Player.id.in_(player_ids),
+                                     db.or_(Player.game_id.is_(None), Player.game_id != self.id)) \
+                             .update({Player.game_id: self.id, Player.team_id: None},
+                                     synchronize_session=False)
+        self.player_count = Game.player_count + joined
+
+        # the loaded players are out of date now
+        for player in players:
+            db.session.expire(player, ['game_id', 'game', 'team_id', 'team'])
+        return players
+
+    def lock(self):
+        """
+            Bump the version of the game right away. The update locks
+            the row of the game (the whole database with sqlite) until
+            the request ends, so the joins to a game take turns and
+            count the players committed before them. Returns whether
+            the game still exists.
+        """
+        locked = Game.query.filter_by(id=self.id) \
+                           .update({Game.version: Game.version + 1, Game.last_active: datetime.utcnow()},
+                                   synchronize_session=False)
+        db.session.expire(self, ['version', 'last_active', 'max_players', 'players'])
+        invalidate_after_commit(Game.cache_key(self.id))
+        return locked == 1
+
+    def touch(self):
+        """
+            Bump the version of the game. The increment is done
+            in SQL so concurrent changes are never lost.
+        """
+        self.version = Game.version + 1
+        self.last_active = datetime.utcnow()
+        if self.id is not None:
+            invalidate_after_commit(Game.cache_key(self.id))
+
+    @staticmethod
+    def touch_ids(gameids):
+        """
+            Bump the versions of many games with one update
+        """
+        if not gameids:
+            return
+        Game.query.filter(Game.id.in_(gameids)) \
+                  .update({Game.version: Game.version + 1, Game.last_active: datetime.utcnow()},
+                          synchronize_session=False)
+        invalidate_after_commit(*[Game.cache_key(gameid) for gameid in gameids])
+
+    @staticmethod
+    def count_players(changes):
+        """
+            Add the changes in the number of players, a dict of
+            game id to change, with an update per distinct change
+        """
+        by_change = {}
+        for gameid, change in changes.items():
+            if change:
+                by_change.setdefault(change, []).append(gameid)
+        for change, gameids in by_change.items():
+            Game.query.filter(Game.id.in_(gameids)) \
+                      .update({Game.player_count: Game.player_count + change},
+                              synchronize_session=False)
+
+    @staticmethod
+    def recount_players(gameids=None):
+        """
+            Recompute the player counts from the players, for the
+            games given or all of them
+        """
+        counted = db.session.query(db.func.count(Player.id)) \
+                            .filter(Player.game_id == Game.id).as_scalar()
+        games = Game.query
+        if gameids is not None:
+            games = games.filter(Game.id.in_(gameids))
+        games.update({Game.player_count: counted}, synchronize_session=False)
+
+    @property
+    def etag(self):
+        return f"game{self.id}-v{self.version}"
+
+    @staticmethod
+    def cache_key(gameid):
+        return f"game:{to_id(gameid)}"
+
+    @staticmethod
+    def current_etag(gameid):
+        """
+            The ETag of the game read without loading it,
+            None for missing games
+        """
+        gameid = to_id(gameid)
+        version = db.session.query(Game.version).filter_by(id=gameid).scalar()
+        if version is None:
+            return None
+        return f"game{gameid}-v{version}"
+
+    @staticmethod
+    def cached_json(gameid):
+        """
+            The ETag and the json of a game for the cache,
+            None for missing games
+        """
+        game = Game.by_id(gameid, with_members=True)
+        if game is None:
+            return None
+        return game.etag, game.to_json()
 
     @staticmethod
     def remove_game(game):      
         """
             All the teams under the game are considered 
             the games property and are removed as well.
+            The database deletes the teams and detaches the
+            players with the ON DELETE rules of the foreign keys.
         """          
-        for team in game.teams:
-            db.session.delete(team)
+        teamids = [teamid for teamid, in db.session.query(Team.id).filter_by(game_id=game.id)]
+        invalidate_after_commit(*[Team.cache_key(teamid) for teamid in teamids])
+        invalidate_after_commit(Game.cache_key(game.id))
+        queue_event(game.id, 'game_removed', {'game': {'id': game.id}})
         db.session.delete(game)
-        db.session.commit()
 
     @staticmethod
-    def games_to_json():
-        games = Game.query.all()
-        games_dict = { 'games': [] 	}
-        for game in games:
-            games_dict['games'].append(game.to_json())
-        return games_dict
+    def games_to_json(limit=None, after=None, not_full=False,
+                      created_after=None, owner_id=None):
+        """
+            A page of games after the cursor 'after', optionally
+            only games with room left, created after the given
+            time or owned by the given player
+        """
+        games = Game.query_with_members()
+
+        if not_full:
+            player_count = db.session.query(db.func.count(Player.id)) \
+                                     .filter(Player.game_id == Game.id) \
+                                     .correlate(Game).as_scalar()
+            games = games.filter(player_count < Game.max_players)
+        games = Game.filter_games(games, created_after, owner_id)
+
+        games, next_cursor = paginate_query(games, Game.id, limit, after)
+
+        return {'games': [game.to_json() for game in games], 'next': next_cursor}
 
     @staticmethod
-    def by_id(gameid):
-        return Game.query.filter_by(id=gameid).first()		
+    def games_summary_json(limit=None, after=None, not_full=False,
+                           created_after=None, owner_id=None):
+        """
+            A page of game summaries, the name of the owner and the
+            number of players instead of the full objects, in one query.
+            The players are counted with GROUP BY or read from the
+            player_count column, as GAME_SUMMARY_SOURCE says.
+        """
+        owner = db.aliased(Player)
+        columns = [Game.id, Game.name, Game.max_players, owner.name.label('owner_name')]
+
+        if current_app.config['GAME_SUMMARY_SOURCE'] == 'column':
+            games = db.session.query(*columns, Game.player_count.label('player_count'))
+            if not_full:
+                games = games.filter(Game.player_count < Game.max_players)
+        else:
+            members = db.aliased(Player)
+            player_count = db.func.count(members.id)
+            games = db.session.query(*columns, player_count.label('player_count')) \
+                              .outerjoin(members, members.game_id == Game.id) \
+                              .group_by(Game.id, Game.name, Game.max_players, owner.name)
+            if not_full:
+                games = games.having(player_count < Game.max_players)
+
+        games = games.outerjoin(owner, owner.id == Game.owner_id)
+        games = Game.filter_games(games, created_after, owner_id)
+
+        games, next_cursor = paginate_query(games, Game.id, limit, after)
+
+        url = url_template('api.game', 'id')
+        return {'games': [{'game': {'id': game.id,
+                                    'name': game.name,
+                                    'url': url.format(id=game.id),
+                                    'owner_name': game.owner_name,
+                                    'player_count': game.player_count,
+                                    'max_players': game.max_players}}
+                          for game in games],
+                'next': next_cursor}
+
+    @staticmethod
+    def filter_games(games, created_after=None, owner_id=None):
+        """
+            The filters shared by the game listings
+        """
+        if created_after is not None:
+            games = games.filter(Game.created_time > created_after)
+        if owner_id is not None:
+            games = games.filter(Game.owner_id == owner_id)
+        return games
+
+    @staticmethod
+    def query_with_members():
+        """
+            Query the games with the owner and the players
+            loaded up front so that serializing any number of
+            games takes a fixed number of queries.
+        """
+        return Game.query.options(joinedload(Game.owner),
+                                  selectinload(Game.players))
+
+    @staticmethod
+    def by_id(gameid, with_members=False):
+        gameid = to_id(gameid)
+        if gameid is None:
+            return None
+        if not with_members:
+            # served from the session without a query when already loaded
+            return Game.query.get(gameid)
+        return Game.query_with_members().filter_by(id=gameid).first()
 
     @classmethod
     def new_game(cls, creator, name=""):
 
-        Game.counter += 1
-
         if not name:
-            name = "game" + str(Game.counter)
+            # numbered from a sequence shared by all the workers, taken
+            # before the session writes anything, see krokeapp.sequence
+            from krokeapp.sequence import next_value
+            name = "game" + str(next_value('game_name'))
 
         game = cls(name=name, owner=creator)
 
         db.session.add(game)
-        db.session.commit()
+        # assign the id, the request commits the game
+        db.session.flush()
 
         return game
 
@@ -95,15 +377,30 @@ class Game(db.Model):
 
 
 class Team(db.Model):
+
+    __table_args__ = (
+        # the teams of a game, a page at a time
+        db.Index('ix_team_game_id_id', 'game_id', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     created_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     name = db.Column(db.String(30), unique=False, nullable=False)
+
+    # the capacity of the team, defaults to the application config
+    max_players = db.Column(db.Integer, nullable=False,
+                            default=lambda: current_app.config['TEAM_MAX_PLAYERS'])
+
+    # bumped on every change to the team, used as the ETag
+    version = db.Column(db.Integer, nullable=False, default=1)
     
     # each team is under a single game
-    game_id = db.Column(db.Integer, db.ForeignKey('game.id'), nullable=False)
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id', ondelete='CASCADE'), nullable=False)
 
     # one-to-one map
-    owner_id = db.Column(db.Integer, db.ForeignKey('player.id', use_alter=True, name='fk_team_owner_id'))
+    owner_id = db.Column(db.Integer, db.ForeignKey('player.id', use_alter=True, name='fk_team_owner_id',
+                                                   ondelete='SET NULL'),
+                         index=True)
     owner = db.relationship('Player', foreign_keys=owner_id, post_update=True)
 
 
@@ -113,60 +410,180 @@ class Team(db.Model):
         team = cls(name=name, game=game, owner=owner)
         
         db.session.add(team)
-        db.session.commit()
+        db.session.flush()
+        queue_event(game.id, 'team_created', {'team': {'id': team.id, 'name': team.name}})
 
         return team
     
     def add_player(self, player):
         """
-            Return whether player addition was succesful
+            Return whether player addition was succesful. Only players
+            of the game of the team join, with one conditional update
+            like in Game.add_player.
         """        
         if player is None:
             raise RuntimeError('player argument not defined')
 
-        self.players.append(player)
-        db.session.commit()
+        old_team = player.team
+        if not self.lock():
+            return False
+
+        members = db.aliased(Player)
+        player_count = db.session.query(db.func.count(members.id)) \
+                                 .filter(members.team_id == self.id).as_scalar()
+        capacity = db.session.query(Team.max_players).filter(Team.id == self.id).as_scalar()
+        joined = Player.query.filter(Player.id == player.id,
+                                     Player.game_id == self.game_id,
+                                     db.or_(Player.team_id.is_(None), Player.team_id != self.id),
+                                     player_count < capacity) \
+                             .update({Player.team_id: self.id}, synchronize_session=False)
+
+        db.session.expire(player, ['team_id', 'team'])
+        if not joined:
+            return False
+
+        # the team the player switches from changes as well
+        if old_team is not None:
+            old_team.touch()
+        queue_event(self.game_id, 'team_joined', dict(player.to_json(), team={'id': self.id}))
+        return True
+
+    def add_players(self, players):
+        """
+            Add many players of the game at once with set-based updates,
+            in order while there is room, see Game.add_players. Returns
+            the players admitted to the team.
+        """
+        if not players or not self.lock():
+            return []
+
+        player_count = db.session.query(db.func.count(Player.id)) \
+                                 .filter(Player.team_id == self.id).scalar()
+        players = players[:max(self.max_players - player_count, 0)]
+        if not players:
+            return []
+
+        # the teams the players switch from change as well
+        Team.touch_ids({player.team_id for player in players} - {None, self.id})
+        for player in players:
+            queue_event(self.game_id, 'team_joined', dict(player.to_json(), team={'id': self.id}))
+
+        Player.query.filter(Player.id.in_([player.id for player in players]),
+                            Player.game_id == self.game_id) \
+                    .update({Player.team_id: self.id}, synchronize_session=False)
+
+        for player in players:
+            db.session.expire(player, ['team_id', 'team'])
+        return players
+
+    def lock(self):
+        """
+            Bump the version of the team right away, see Game.lock
+        """
+        locked = Team.query.filter_by(id=self.id) \
+                           .update({Team.version: Team.version + 1}, synchronize_session=False)
+        db.session.expire(self, ['version', 'max_players', 'players'])
+        invalidate_after_commit(Team.cache_key(self.id))
+        return locked == 1
+
+    def touch(self):
+        """
+            Bump the version of the team, see Game.touch
+        """
+        self.version = Team.version + 1
+        if self.id is not None:
+            invalidate_after_commit(Team.cache_key(self.id))
+
+    @staticmethod
+    def touch_ids(teamids):
+        """
+            Bump the versions of many teams with one update
+        """
+        if not teamids:
+            return
+        Team.query.filter(Team.id.in_(teamids)) \
+                  .update({Team.version: Team.version + 1}, synchronize_session=False)
+        invalidate_after_commit(*[Team.cache_key(teamid) for teamid in teamids])
+
+    @property
+    def etag(self):
+        return f"team{self.id}-v{self.version}"
+
+    @staticmethod
+    def cache_key(teamid):
+        return f"team:{to_id(teamid)}"
+
+    @staticmethod
+    def current_etag(teamid):
+        """
+            The ETag of the team read without loading it,
+            None for missing teams
+        """
+        teamid = to_id(teamid)
+        version = db.session.query(Team.version).filter_by(id=teamid).scalar()
+        if version is None:
+            return None
+        return f"team{teamid}-v{version}"
+
+    @staticmethod
+    def cached_json(teamid):
+        """
+            The ETag and the json of a team for the cache,
+            None for missing teams
+        """
+        team = Team.by_id(teamid, with_members=True)
+        if team is None:
+            return None
+        return team.etag, team.to_json()
 
 
     def to_json(self):
         team_dict = {'team': {
                             'id': self.id,
                             'name': self.name,
-                            'url': url_for('api.team', gameid=self.game.id, teamid=self.id),
-                            'owner': self.owner.to_json(),
-                            'players': []
+                            'url': url_template('api.team', 'gameid', 'teamid').format(
+                                gameid=self.game_id, teamid=self.id),
+                            'max_players': self.max_players,
+                            'owner': self.owner.to_json() if self.owner is not None else None,
+                            'players': Player.list_json(self.players)
                         }}
-        for player in self.players:
-            team_dict['team']['players'].append(player.to_json())
-
         return team_dict
 
     @staticmethod
     def remove_team(team):
+        team.game.touch()
+        invalidate_after_commit(Team.cache_key(team.id))
+        queue_event(team.game_id, 'team_removed', {'team': {'id': team.id}})
         db.session.delete(team)
-        db.session.commit()
 
     @staticmethod
-    def by_id(teamid):
-        return Team.query.filter_by(id=teamid).first()
+    def query_with_members():
+        """
+            Query the teams with the owner and the players
+            loaded up front, see Game.query_with_members
+        """
+        return Team.query.options(joinedload(Team.owner),
+                                  selectinload(Team.players))
 
     @staticmethod
-    def teams_to_json(gameid=None): 
-        teams = Team.query
-        if gameid is None:
-            teams = teams.all()
-        else:
-            game = Game.query.filter_by(id=gameid).first()
-            if game is not None:
-                teams = teams.filter_by(game=game).all()
-            else: 
-                teams = []
+    def by_id(teamid, with_members=False):
+        teamid = to_id(teamid)
+        if teamid is None:
+            return None
+        if not with_members:
+            return Team.query.get(teamid)
+        return Team.query_with_members().filter_by(id=teamid).first()
 
-        team_dict = {'teams': []}
-        for team in teams:
-            team_dict['teams'].append(team.to_json())
+    @staticmethod
+    def teams_to_json(gameid=None, limit=None, after=None): 
+        teams = Team.query_with_members()
+        if gameid is not None:
+            # teams of a nonexisting game come out empty
+            teams = teams.filter_by(game_id=to_id(gameid))
 
-        return team_dict
+        teams, next_cursor = paginate_query(teams, Team.id, limit, after)
+
+        return {'teams': [team.to_json() for team in teams], 'next': next_cursor}
 
     def __repr__(self):
         return f"Team {self.name}"
@@ -178,26 +595,37 @@ class Player(db.Model):
 
     # __tablename__ = 'left'  
 
+    __table_args__ = (
+        # the players of a game, a page at a time
+        db.Index('ix_player_game_id_id', 'game_id', 'id'),
+    )
+
 
     id = db.Column(db.Integer, primary_key=True)
     created_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     name = db.Column(db.String(30), unique=False, nullable=False)
 
     # store the user access token
-    token = db.Column(db.String(32), index=True, unique=True)
-    token_expiration = db.Column(db.DateTime)
+    token = db.Column(db.String(64), index=True, unique=True)
+    token_expiration = db.Column(db.DateTime, index=True)
+
+    # the last authenticated request of the player, idle players are reaped
+    last_active = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     # a foreign key for the Team owner relationship
-    team_id = db.Column(db.Integer, db.ForeignKey(Team.id))
+    team_id = db.Column(db.Integer, db.ForeignKey(Team.id, ondelete='SET NULL'), index=True)
 
     # player team many-to-one
-    team = db.relationship(Team, foreign_keys=team_id, backref='players')
+    # the database detaches the players of deleted teams and games
+    team = db.relationship(Team, foreign_keys=team_id,
+                           backref=db.backref('players', passive_deletes=True))
 
     # a foreign key for the Game owner relationship
-    game_id = db.Column(db.Integer, db.ForeignKey(Game.id))
+    game_id = db.Column(db.Integer, db.ForeignKey(Game.id, ondelete='SET NULL'))
 
     # player game many-to-one
-    game = db.relationship(Game, foreign_keys=game_id, backref='players')
+    game = db.relationship(Game, foreign_keys=game_id,
+                           backref=db.backref('players', passive_deletes=True))
 
 
     def __init__(self, name="", **kwargs):
@@ -207,8 +635,8 @@ class Player(db.Model):
         kwargs['name'] = name
         super().__init__(**kwargs)
 
+        # the player is committed with the rest of the request
         db.session.add(self)
-        db.session.commit()
 
     def to_json(self, with_token=False):
         resp = { 'player': {
@@ -220,51 +648,157 @@ class Player(db.Model):
             resp['player']['token'] = self.token
         return resp
 
-    def create_token():
-        self.token = generate_player_token()        
+    @staticmethod
+    def list_json(players):
+        """
+            The json of many players, built inline as it is
+            the bulk of the game and team listings
+        """
+        return [{'player': {'id': player.id, 'name': player.name}} for player in players]
+
+    def create_token(self):
+        """
+            Issue a new signed token for the player, the player
+            needs an id so it has to be flushed first. The earlier
+            token of the player stops working.
+        """
+        self.token, self.token_expiration = generate_player_token(self.id)
+        return self.token
+
+    def revoke_token(self):
+        self.token = None
+        self.token_expiration = None
 
     @staticmethod
-    def players_to_json():
-        players = Player.query.all()
-        pdict = {'players': []}
-        for player in players:
-            pdict['players'].append(player.to_json())
+    def clear_expired_tokens(batch_size=1000):
+        """
+            Clear the expired tokens a batch at a time, committing
+            each batch. Returns the number of tokens cleared.
+        """
+        cleared = 0
+        while True:
+            expired = [playerid for playerid, in 
+                       db.session.query(Player.id)
+                                 .filter(Player.token_expiration < datetime.utcnow())
+                                 .limit(batch_size)]
+            if not expired:
+                return cleared
+
+            Player.query.filter(Player.id.in_(expired)) \
+                        .update({Player.token: None, Player.token_expiration: None},
+                                synchronize_session=False)
+            db.session.commit()
+            cleared += len(expired)
+
+    @staticmethod
+    def new_players(names):
+        """
+            Create many players with multi-row inserts and issue their
+            tokens with one more statement. Returns the players in the
+            order of the names.
+        """
+        table = Player.__table__
+        now = datetime.utcnow()
+        rows = [{'name': name or "anonymous", 'created_time': now, 'last_active': now} for name in names]
+
+        if not rows:
+            return []
+
+        returning = db.session.get_bind().dialect.name == 'postgresql'
+        ids = []
+        for first in range(0, len(rows), INSERT_BATCH):
+            batch = rows[first:first + INSERT_BATCH]
+            insert = table.insert().values(batch)
+            if returning:
+                # the serial ids are drawn in the order of the rows
+                ids.extend(sorted(playerid for playerid, in db.session.execute(insert.returning(table.c.id))))
+            else:
+                # sqlite numbers the rows of one statement one after
+                # another, the write lock is held until the commit
+                last_id = db.session.execute(insert).lastrowid
+                ids.extend(range(last_id - len(batch) + 1, last_id + 1))
+
+        tokens = [dict(zip(('token', 'expiration'), generate_player_token(playerid)), playerid=playerid)
+                  for playerid in ids]
+        db.session.execute(table.update().where(table.c.id == db.bindparam('playerid'))
+                                         .values(token=db.bindparam('token'),
+                                                 token_expiration=db.bindparam('expiration')),
+                           tokens)
+
+        players = {player.id: player for player in Player.by_ids(ids)}
+        return [players[playerid] for playerid in ids]
 
-        return pdict
+    @staticmethod
+    def players_to_json(limit=None, after=None):
+        players, next_cursor = paginate_query(Player.query, Player.id, limit, after)
+        return {'players': Player.list_json(players), 'next': next_cursor}
 
     @staticmethod
     def by_id(playerid):
-        return Player.query.filter_by(id=playerid).first()
+        playerid = to_id(playerid)
+        if playerid is None:
+            return None
+        return Player.query.get(playerid)
+
+    @staticmethod
+    def by_ids(playerids):
+        """
+            Load many players in one query, missing ids are skipped
+        """
+        if not playerids:
+            return []
+        return Player.query.filter(Player.id.in_(playerids)).all()
 
 
     def update_name(self, new_name):
         self.name = new_name
-        db.session.commit()
+
+        # the player is shown in the games and teams they are in
+        # and in the ones they own
+        if self.game is not None:
+            self.game.touch()
+            queue_event(self.game_id, 'player_renamed', self.to_json())
+        if self.team is not None:
+            self.team.touch()
+        Game.touch_ids([gameid for gameid, in 
+                        db.session.query(Game.id).filter_by(owner_id=self.id)])
+        Team.touch_ids([teamid for teamid, in 
+                        db.session.query(Team.id).filter_by(owner_id=self.id)])
 
     def leave_team(self):        
 
         if self.team is not None:            
+            self.team.touch()
+            queue_event(self.team.game_id, 'team_left', 
+                        dict(self.to_json(), team={'id': self.team.id}))
             self.team = None
-
-        db.session.commit()
         
     def leave_game(self):
 
         if self.game is not None:
+            self.game.touch()
+            self.game.player_count = Game.player_count - 1
+            queue_event(self.game.id, 'player_left', self.to_json())
             self.game = None
-
-        db.session.commit()
  	
-    def auth(self, pid, hash_val):
-        """Check if the hash corresponds to the given id
-        	(At the moment hash = player id
+    def auth(self, token):
         """
-        player = Player.query.filter_by(id=hash_val).first()
-        if player is not None:
-            return player.id == pid
-        else:
+            Check that the token is the current token of this player
+            and has not expired. Refreshed, revoked and swept tokens
+            are refused. The activity of the player is recorded at
+            most once per PLAYER_ACTIVITY_RESOLUTION.
+        """
+        if verify_player_token(token) != self.id:
+            return False
+        if self.token is None or not hmac.compare_digest(self.token, token):
             return False
 
+        now = datetime.utcnow()
+        resolution = current_app.config['PLAYER_ACTIVITY_RESOLUTION']
+        if self.last_active is None or (now - self.last_active).total_seconds() >= resolution:
+            self.last_active = now
+        return True
+
 
 
     def __repr__(self):
@@ -282,3 +816,22 @@ class Token(db.Model):
     token = db.Column(db.String(32), index=True, unique=True)
     token_expiration = db.Column(db.DateTime)
 
+
+class NameSequence(db.Model):
+    """
+        Named counters shared by all the processes, handed
+        out a block at a time by krokeapp.sequence
+    """
+
+    name = db.Column(db.String(30), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False)
+
+
+class SchemaVersion(db.Model):
+    """
+        The version of the database schema, a single row. The
+        migrations of krokeapp.migrations up to it have been applied.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
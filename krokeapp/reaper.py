@@ -0,0 +1,117 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from krokeapp import db, logger
+from krokeapp.cache import invalidate_after_commit
+from krokeapp.events import queue_event
+from krokeapp.models import Game, Player, Team
+
+
+def _batches(query, batch_size):
+    """
+        The ids of the query a batch at a time. Each batch is
+        handled and committed before the next one is selected.
+    """
+    while True:
+        ids = [rowid for rowid, in query.limit(batch_size)]
+        if not ids:
+            return
+        yield ids
+        db.session.commit()
+
+
+def reap_players(cutoff, batch_size):
+    """
+        Delete the players without an authenticated request since the
+        cutoff. The games and teams they owned are left without an owner
+        by the ON DELETE rules of the foreign keys.
+    """
+    last_active = db.func.coalesce(Player.last_active, Player.created_time)
+    idle = db.session.query(Player.id).filter(last_active < cutoff).order_by(Player.id)
+
+    reaped = 0
+    for ids in _batches(idle, batch_size):
+        players = db.session.query(Player.id, Player.game_id, Player.team_id) \
+                            .filter(Player.id.in_(ids)).all()
+        for playerid, gameid, teamid in players:
+            if gameid is not None:
+                queue_event(gameid, 'player_left', {'player': {'id': playerid}})
+
+        owned_games = [gameid for gameid, in db.session.query(Game.id).filter(Game.owner_id.in_(ids))]
+        owned_teams = [teamid for teamid, in db.session.query(Team.id).filter(Team.owner_id.in_(ids))]
+        Game.touch_ids({gameid for playerid, gameid, teamid in players if gameid is not None} | set(owned_games))
+        leaving = Counter(gameid for playerid, gameid, teamid in players if gameid is not None)
+        Game.count_players({gameid: -count for gameid, count in leaving.items()})
+        Team.touch_ids({teamid for playerid, gameid, teamid in players if teamid is not None} | set(owned_teams))
+
+        Player.query.filter(Player.id.in_(ids)).delete(synchronize_session=False)
+        reaped += len(ids)
+
+    return reaped
+
+
+def reap_teams(batch_size):
+    """
+        Delete the teams left without an owner
+    """
+    ownerless = db.session.query(Team.id).filter(Team.owner_id.is_(None)).order_by(Team.id)
+
+    reaped = 0
+    for ids in _batches(ownerless, batch_size):
+        teams = db.session.query(Team.id, Team.game_id).filter(Team.id.in_(ids)).all()
+        for teamid, gameid in teams:
+            queue_event(gameid, 'team_removed', {'team': {'id': teamid}})
+        Game.touch_ids({gameid for teamid, gameid in teams})
+
+        # the players stay in the game
+        invalidate_after_commit(*[Team.cache_key(teamid) for teamid in ids])
+        Team.query.filter(Team.id.in_(ids)).delete(synchronize_session=False)
+        reaped += len(ids)
+
+    return reaped
+
+
+def reap_games(cutoff, batch_size):
+    """
+        Delete the games without players that have not
+        changed since the cutoff, the database deletes their teams
+    """
+    has_players = db.session.query(Player.id).filter(Player.game_id == Game.id).exists()
+    last_active = db.func.coalesce(Game.last_active, Game.created_time)
+    empty = db.session.query(Game.id).filter(~has_players, last_active < cutoff).order_by(Game.id)
+
+    reaped = 0
+    for ids in _batches(empty, batch_size):
+        teamids = [teamid for teamid, in db.session.query(Team.id).filter(Team.game_id.in_(ids))]
+        invalidate_after_commit(*[Team.cache_key(teamid) for teamid in teamids])
+
+        for gameid in ids:
+            queue_event(gameid, 'game_removed', {'game': {'id': gameid}})
+        invalidate_after_commit(*[Game.cache_key(gameid) for gameid in ids])
+        Game.query.filter(Game.id.in_(ids)).delete(synchronize_session=False)
+        reaped += len(ids)
+
+    return reaped
+
+
+def reap(batch_size=None):
+    """
+        Reap the idle players, then the teams and the empty games they
+        left behind, committing a batch at a time. Returns the number
+        of rows reaped from each table.
+    """
+    config = current_app.config
+    batch_size = batch_size or config['REAP_BATCH_SIZE']
+    now = datetime.utcnow()
+
+    reaped = {
+        'players': reap_players(now - timedelta(seconds=config['PLAYER_IDLE_TIMEOUT']), batch_size),
+        'teams': reap_teams(batch_size),
+        'games': reap_games(now - timedelta(seconds=config['GAME_IDLE_TIMEOUT']), batch_size),
+    }
+    if any(reaped.values()):
+        logger.info(f"Reaped {reaped['players']} players, {reaped['teams']} teams "
+                    f"and {reaped['games']} games")
+    return reaped
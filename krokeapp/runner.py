@@ -1,4 +1,8 @@
+import atexit
+import os
+
 from krokeapp import db, create_app
+from krokeapp.background import start_background_tasks, stop_background_tasks
 from krokeapp.config import Config
 from krokeapp.database import init_if_not_found
 # Create an entry point for wsgi server used in production.
@@ -8,10 +12,15 @@ from krokeapp.database import init_if_not_found
 #  $gunicorn krokeapp.runner:app
 
 class DeploymentConfiguration(Config):
-    SQLALCHEMY_DATABASE_URI = "sqlite:///production.db"
+    # set DATABASE_URL to run against a database server
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', "sqlite:///production.db")
 
 
 app = create_app(DeploymentConfiguration())
 
 # initialize db if not already done
 init_if_not_found(db, app)
+
+# sweep the tokens, reap the idle lobbies and tick the matchmaking
+start_background_tasks(app)
+atexit.register(stop_background_tasks, app)
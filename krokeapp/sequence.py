@@ -0,0 +1,98 @@
+import os
+import threading
+
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from krokeapp import db
+from krokeapp.models import Game, NameSequence
+
+
+def _first_game_name(connection):
+    # the games named before the sequence existed were numbered by a
+    # counter of each process, which never got past the game ids
+    return (connection.execute(select([func.max(Game.id)])).scalar() or 0) + 1
+
+
+# the first values of the sequences that continue numbering
+# that started before them, the others start at 1
+FIRST_VALUES = {'game_name': _first_game_name}
+
+
+class BlockAllocator:
+    """
+        Hands out the values of a sequence stored in the database.
+        Each process reserves a block of values in a short transaction
+        of its own and serves the block from memory, so most values
+        need no database round trip and no two processes or nodes
+        ever get the same value.
+
+        The reservation runs on its own connection. With sqlite it has
+        to happen before the calling session writes anything, otherwise
+        it waits for the lock held by that very session.
+    """
+
+    def __init__(self, name, block_size, first_value=None):
+        self.name = name
+        self.block_size = block_size
+        # called with the connection when the sequence is created
+        self.first_value = first_value
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self._pid = os.getpid()
+
+    def next_value(self, engine):
+        with self._lock:
+            # a forked worker must not serve the block of its parent
+            if self._pid != os.getpid():
+                self._next = self._end = 0
+                self._pid = os.getpid()
+
+            if self._next >= self._end:
+                self._next, self._end = self._reserve(engine)
+
+            value = self._next
+            self._next += 1
+            return value
+
+    def _reserve(self, engine):
+        """
+            Reserve the next block, returns its first value
+            and the value after its last one
+        """
+        table = NameSequence.__table__
+        while True:
+            try:
+                with engine.begin() as connection:
+                    # the update locks the row before it is read
+                    updated = connection.execute(
+                        table.update()
+                             .where(table.c.name == self.name)
+                             .values(next_value=table.c.next_value + self.block_size))
+                    if updated.rowcount == 0:
+                        # the first block of a new sequence
+                        first = self.first_value(connection) if self.first_value else 1
+                        connection.execute(table.insert().values(name=self.name,
+                                                                 next_value=first + self.block_size))
+                    end = connection.execute(
+                        select([table.c.next_value]).where(table.c.name == self.name)).scalar()
+            except IntegrityError:
+                # another process created the sequence first
+                continue
+
+            return end - self.block_size, end
+
+
+def next_value(name):
+    """
+        The next value of the named sequence of the current app
+    """
+    allocators = current_app.extensions.setdefault('krokeapp_sequences', {})
+    allocator = allocators.get(name)
+    if allocator is None:
+        allocator = allocators.setdefault(
+            name, BlockAllocator(name, current_app.config['SEQUENCE_BLOCK_SIZE'], FIRST_VALUES.get(name)))
+
+    return allocator.next_value(db.get_engine(current_app))
@@ -0,0 +1,60 @@
+from flask import current_app, json as flask_json
+
+
+def _orjson_dumps(sort_keys):
+    # only needed when orjson is installed
+    import orjson
+
+    option = orjson.OPT_SORT_KEYS if sort_keys else 0
+    return lambda data: orjson.dumps(data, option=option)
+
+
+def _stdlib_dumps(data):
+    # the encoder of the app, without the whitespace
+    return flask_json.dumps(data, separators=(',', ':')).encode()
+
+
+def init_json(app):
+    """
+        Choose the encoder of the responses from JSON_BACKEND, 'orjson',
+        'json' for the standard library or 'auto' for orjson when it
+        is installed
+    """
+    backend = app.config['JSON_BACKEND']
+    # the keys are ordered the same with both, as JSON_SORT_KEYS says
+    sort_keys = app.config['JSON_SORT_KEYS']
+    if backend == 'auto':
+        try:
+            dumps, backend = _orjson_dumps(sort_keys), 'orjson'
+        except ImportError:
+            dumps, backend = _stdlib_dumps, 'json'
+    elif backend == 'orjson':
+        dumps = _orjson_dumps(sort_keys)
+    elif backend == 'json':
+        dumps = _stdlib_dumps
+    else:
+        raise ValueError(f"Unknown json backend {backend}")
+
+    app.extensions['krokeapp_json'] = (backend, dumps)
+
+
+def dumps(data):
+    """
+        The data as compact json bytes
+    """
+    return current_app.extensions['krokeapp_json'][1](data)
+
+
+def jsonify(*args, **kwargs):
+    """
+        Drop-in for flask.jsonify that encodes with the backend of
+        the app and never pretty-prints
+    """
+    if args and kwargs:
+        raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+    if len(args) == 1:
+        data = args[0]
+    else:
+        data = args or kwargs
+
+    return current_app.response_class(dumps(data), mimetype=current_app.config['JSONIFY_MIMETYPE'])
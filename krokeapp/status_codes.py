@@ -2,6 +2,8 @@
 # HTTP response codes
 SUCCESS = 200
 RESOURCE_CREATED = 201
+NOT_MODIFIED = 304
 UNPROCESSABLE = 422
 UNAUTHORIZED = 401
-PRECONDITION_FAILED = 412
\ No newline at end of file
+PRECONDITION_FAILED = 412
+CONFLICT = 409
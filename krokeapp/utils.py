@@ -1,5 +1,7 @@
+from flask import g, request, url_for, Response
 
-
+from krokeapp.serialization import jsonify
+from krokeapp.status_codes import NOT_MODIFIED
 
 
 def get_from_dict(d, key_list):
@@ -16,4 +18,90 @@ def get_from_dict(d, key_list):
         if d_inner is None:
             return None
 
-    return d_inner
\ No newline at end of file
+    return d_inner
+
+
+def to_id(value):
+    """
+        Convert an id from an url or a request body to an integer,
+        None for anything that cannot be an id. Server databases
+        do not accept strings in integer comparisons like sqlite.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def url_template(endpoint, *names):
+    """
+        The url of the endpoint as a format string with a field for
+        each of the url arguments in names, e.g. '/games/game{id}'.
+        The url is built once per request and formatted for each
+        object, url_for would match the rule again every time.
+    """
+    templates = g.setdefault('url_templates', {})
+    key = (endpoint,) + names
+    template = templates.get(key)
+    if template is None:
+        # markers that url_for leaves as they are
+        url = url_for(endpoint, **{name: f'__{name}__' for name in names})
+        template = url.replace('{', '{{').replace('}', '}}')
+        for name in names:
+            template = template.replace(f'__{name}__', '{' + name + '}')
+        templates[key] = template
+    return template
+
+
+def get_page_args(args, config):
+    """
+        Read the cursor pagination arguments ?limit= and ?after=
+        from the request arguments. Raises ValueError for 
+        malformed values.
+    """
+    limit = int(args.get('limit', config['PAGE_SIZE']))
+    if limit < 1:
+        raise ValueError(f"Invalid page size {limit}")
+    limit = min(limit, config['MAX_PAGE_SIZE'])
+
+    after = args.get('after')
+    if after is not None:
+        after = int(after)
+
+    return limit, after
+
+
+def paginate_query(query, column, limit=None, after=None):
+    """
+        Keyset pagination over an indexed column. Returns the
+        items of the page and the cursor for the next page, 
+        which is None on the last page.
+    """
+    if after is not None:
+        query = query.filter(column > after)
+    query = query.order_by(column)
+
+    if limit is None:
+        return query.all(), None
+
+    # fetch one extra row to know whether there is a next page
+    items = query.limit(limit + 1).all()
+    if len(items) > limit:
+        items = items[:limit]
+        return items, getattr(items[-1], column.key)
+
+    return items, None
+
+
+def conditional_response(etag, make_json):
+    """
+        Respond with 304 Not Modified when the client already has
+        the current version of the resource, so the body is only
+        built with make_json() when it has changed
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=NOT_MODIFIED)
+    else:
+        response = jsonify(make_json())
+    response.set_etag(etag)
+    return response
@@ -1,7 +1,10 @@
 
 
 from krokeapp import db, create_app
-from krokeapp.database import fill_database, init_database
+from krokeapp.background import start_background_tasks
+from krokeapp.database import fill_database, init_database, create_missing_indexes
+from krokeapp.migrations import migrate
+from krokeapp.dataset import generate_dataset
 from krokeapp.config import Config
 
 if __name__ == "__main__":
@@ -14,6 +17,14 @@ if __name__ == "__main__":
 	                    help='Initialize database')	
 	parser.add_argument('--init_data', action='store_true',	                    
 	                    help='Initialize database with dummy data')
+	parser.add_argument('--create_indexes', action='store_true',
+	                    help='Add the missing indexes to an existing database')
+	parser.add_argument('--migrate', action='store_true',
+	                    help='Upgrade the schema of an existing database')
+	parser.add_argument('--generate', type=int, nargs=2, metavar=('PLAYERS', 'GAMES'),
+	                    help='Bulk load a synthetic dataset into an empty database')
+	parser.add_argument('--seed', type=int, default=0,
+	                    help='Seed of the generated dataset')
 	args = parser.parse_args()
 
 	# init the application config
@@ -28,5 +39,16 @@ if __name__ == "__main__":
 	if args.init_data:
 		fill_database(db, app)
 
-	# run app
+	if args.create_indexes:
+		create_missing_indexes(db, app)
+
+	if args.migrate:
+		migrate(db, app)
+
+	if args.generate:
+		with app.app_context():
+			print(generate_dataset(*args.generate, seed=args.seed))
+
+	# run app, with the periodic tasks of a server
+	start_background_tasks(app)
 	app.run()
\ No newline at end of file
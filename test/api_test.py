@@ -14,21 +14,27 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from krokeapp import db, create_app
 from krokeapp.config import Config
 from krokeapp.database import fill_database, init_database
+from krokeapp.models import Game
 from krokeapp import logger
 from krokeapp.utils import get_from_dict
 from krokeapp.status_codes import *
 
+from database_setup import database_uri, remove_database
+
 TEST_DATABASE = "test.db"
 
 # helper methods for api calls, these should be combined with the main app
+# the tokens of the players created by the tests
+TOKENS = {}
+
 def player_payload(name="", pid=""):
-	return json.dumps({"player": {"name": name, "id": pid}})
+	return json.dumps({"player": {"name": name, "id": pid, "token": TOKENS.get(pid)}})
 
 
 
 class TestConfig(Config):
 	
-	SQLALCHEMY_DATABASE_URI = "sqlite:///" + TEST_DATABASE
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
 
 class TestApi(unittest.TestCase):
 
@@ -40,6 +46,7 @@ class TestApi(unittest.TestCase):
 		res = self.client().post('players',
 			data=data, content_type='application/json')	
 		player_id = get_from_dict(res.json, ['player', 'id'])
+		TOKENS[player_id] = get_from_dict(res.json, ['player', 'token'])
 
 		return res, player_id
 
@@ -110,11 +117,7 @@ class TestApi(unittest.TestCase):
 	@classmethod
 	def tearDownClass(cls):
 		# after running the tests, delete the test database
-		# will run to file path problems at some point
-		try:
-			os.remove('krokeapp/' + TEST_DATABASE)
-		except FileNotFoundError:
-			logger.warning("Cannot remove test database, did not find it.")
+		remove_database(cls.app)
 			
 
 	def test_create_player(self):		
@@ -407,6 +410,156 @@ class TestApi(unittest.TestCase):
 	def test_delete_team(self):
 		pass
 
+	def test_game_etag(self):
+		res, player_id = self.create_player('etag owner')
+		res, game_id = self.create_game(player_id)
+		url = 'games/game' + str(game_id)
+
+		res = self.client().get(url)
+		etag = res.headers.get('ETag')
+		self.assertNotEqual(etag, None)
+
+		# unchanged game is not sent again
+		res = self.client().get(url, headers={'If-None-Match': etag})
+		self.assertEqual(res.status_code, NOT_MODIFIED)
+		self.assertEqual(res.data, b'')
+
+		# joining the game changes the version
+		self.join_game(player_id, game_id)
+		res = self.client().get(url, headers={'If-None-Match': etag})
+		self.assertEqual(res.status_code, SUCCESS)
+		self.assertNotEqual(res.headers.get('ETag'), etag)
+		etag = res.headers.get('ETag')
+
+		# so does renaming a player in the game
+		self.client().patch('/players/player' + str(player_id),
+			data=player_payload(name='renamed', pid=player_id), content_type='application/json')
+		res = self.client().get(url, headers={'If-None-Match': etag})
+		self.assertEqual(res.status_code, SUCCESS)
+		self.assertEqual(get_from_dict(res.json, ['game', 'owner', 'player', 'name']), 'renamed')
+
+	def test_team_etag(self):
+		res, player_id = self.create_player('etag team owner')
+		res, game_id = self.create_game(player_id)
+		self.join_game(player_id, game_id)
+		res, team_id = self.create_team(game_id, player_id)
+		url = 'games/game' + str(game_id) + '/teams/team' + str(team_id)
+
+		res = self.client().get(url)
+		etag = res.headers.get('ETag')
+		res = self.client().get(url, headers={'If-None-Match': etag})
+		self.assertEqual(res.status_code, NOT_MODIFIED)
+
+		self.join_team(game_id, team_id, player_id)
+		res = self.client().get(url, headers={'If-None-Match': etag})
+		self.assertEqual(res.status_code, SUCCESS)
+		self.assertEqual(len(get_from_dict(res.json, ['team', 'players'])), 1)
+
+	def test_bulk_create_players(self):
+		data = json.dumps({'players': [{'player': {'name': 'bulk1'}},
+									   {'player': {'name': 5}},
+									   {'player': {}}]})
+		res = self.client().post('players', data=data, content_type='application/json')
+		self.assertEqual(res.status_code, SUCCESS)
+
+		results = res.json['players']
+		self.assertEqual([result['status'] for result in results],
+						 [RESOURCE_CREATED, UNPROCESSABLE, RESOURCE_CREATED])
+		self.assertEqual(get_from_dict(results[0], ['player', 'name']), 'bulk1')
+		self.assertEqual(get_from_dict(results[2], ['player', 'name']), 'anonymous')
+		self.assertNotEqual(get_from_dict(results[2], ['player', 'id']), None)
+
+	def test_bulk_join_game(self):
+		res, owner_id = self.create_player('bulk owner')
+		res, game_id = self.create_game(owner_id)
+		self.join_game(owner_id, game_id)
+		res, other_id = self.create_player('bulk joiner')
+		res, tokenless_id = self.create_player('bulk tokenless')
+
+		data = json.dumps({'players': [{'player': {'id': other_id, 'token': TOKENS[other_id]}},
+									   {'player': {'id': owner_id, 'token': TOKENS[owner_id]}},
+									   {'player': {'id': 0}},
+									   {'player': {'id': other_id, 'token': TOKENS[other_id]}},
+									   {'player': {'id': tokenless_id, 'token': TOKENS[other_id]}}]})
+		res = self.client().put('games/game' + str(game_id),
+								data=data, content_type='application/json')
+		self.assertEqual(res.status_code, SUCCESS)
+
+		# only the new player joins, the rest fail like single joins would
+		statuses = [result['status'] for result in res.json['players']]
+		self.assertEqual(statuses, [SUCCESS, UNPROCESSABLE, UNPROCESSABLE, UNPROCESSABLE, UNAUTHORIZED])
+
+		res = self.client().get('games/game' + str(game_id))
+		player_ids = [get_from_dict(player, ['player', 'id']) 
+					  for player in get_from_dict(res.json, ['game', 'players'])]
+		self.assertEqual(sorted(player_ids), sorted([owner_id, other_id]))
+
+	def test_games_pagination(self):
+		# make sure there are a few games to page through
+		res, player_id = self.create_player('pager')
+		for i in range(3):
+			self.create_game(player_id)
+
+		# walk the pages two games at a time
+		seen_ids = []
+		url = '/games?limit=2'
+		while True:
+			res = self.client().get(url)
+			self.assertEqual(res.status_code, SUCCESS)
+			games = get_from_dict(res.json, ['games'])
+			self.assertLessEqual(len(games), 2)
+			seen_ids.extend(get_from_dict(game, ['game', 'id']) for game in games)
+
+			cursor = res.json['next']
+			if cursor is None:
+				break
+			url = '/games?limit=2&after=' + str(cursor)
+
+		# every game is listed once in ascending order
+		res = self.client().get('/games?limit=1000')
+		all_ids = [get_from_dict(game, ['game', 'id']) for game in res.json['games']]
+		self.assertEqual(seen_ids, all_ids)
+		self.assertEqual(seen_ids, sorted(seen_ids))
+
+		# malformed cursors are rejected
+		res = self.client().get('/games?after=first')
+		self.assertEqual(res.status_code, UNPROCESSABLE)
+
+	def test_games_filters(self):
+		res, owner_id = self.create_player('filter owner')
+		res, full_id = self.create_game(owner_id)
+		res, open_id = self.create_game(owner_id)
+
+		# fill one of the games up
+		with self.app.app_context():
+			Game.by_id(full_id).max_players = 1
+			db.session.commit()
+		self.join_game(owner_id, full_id)
+
+		res = self.client().get('/games?owner=' + str(owner_id))
+		game_ids = [get_from_dict(game, ['game', 'id']) for game in res.json['games']]
+		self.assertEqual(game_ids, [full_id, open_id])
+
+		res = self.client().get('/games?not_full=1&owner=' + str(owner_id))
+		game_ids = [get_from_dict(game, ['game', 'id']) for game in res.json['games']]
+		self.assertEqual(game_ids, [open_id])
+
+		# no games are created in the future
+		res = self.client().get('/games?created_after=2999-01-01T00:00:00')
+		self.assertEqual(res.json['games'], [])
+
+	def test_players_pagination(self):
+		self.create_player('first')
+		self.create_player('second')
+
+		res = self.client().get('/players?limit=1')
+		self.assertEqual(len(res.json['players']), 1)
+		cursor = res.json['next']
+		self.assertEqual(cursor, get_from_dict(res.json['players'][0], ['player', 'id']))
+
+		res = self.client().get('/players?limit=1&after=' + str(cursor))
+		self.assertGreater(get_from_dict(res.json['players'][0], ['player', 'id']), cursor)
+
 
 
 if __name__ == '__main__':
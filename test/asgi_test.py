@@ -0,0 +1,249 @@
+import asyncio
+import unittest
+import sys
+import os
+import json
+from functools import partial
+from urllib.parse import urlsplit
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.asgi import AsgiApp
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.events import broker
+from krokeapp.utils import get_from_dict
+from krokeapp.status_codes import *
+
+from database_setup import database_uri, remove_database
+
+# imported as a module so its tests are not collected twice
+import api_test
+
+TEST_DATABASE = "asgi_test.db"
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+	EVENTS_KEEPALIVE = 0.05
+	ASGI_THREADS = 4
+
+
+async def call(asgi, method, url, body=b'', headers=()):
+	"""
+		Send one request through the asgi app,
+		returns the status, the headers and the body
+	"""
+	url = urlsplit(url)
+	path = url.path if url.path.startswith('/') else '/' + url.path
+	scope = {'type': 'http', 'method': method, 'path': path, 'root_path': '',
+	         'query_string': url.query.encode(), 'http_version': '1.1', 'scheme': 'http',
+	         'server': ('localhost', 80), 'client': ('127.0.0.1', 1234),
+	         'headers': [(name.lower().encode(), value.encode()) for name, value in headers]}
+	messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+	response = {'body': b''}
+
+	async def receive():
+		if messages:
+			return messages.pop()
+		# the client stays connected
+		await asyncio.Event().wait()
+
+	async def send(message):
+		if message['type'] == 'http.response.start':
+			response['status'] = message['status']
+			response['headers'] = message['headers']
+		else:
+			response['body'] += message.get('body', b'')
+
+	await asgi(scope, receive, send)
+	return response['status'], response['headers'], response['body']
+
+
+class AsgiClient:
+	"""
+		The requests of the Flask test client sent through the asgi app
+	"""
+
+	def __init__(self, app, asgi):
+		self.app = app
+		self.asgi = asgi
+
+	def open(self, url, method='GET', data=None, content_type=None, headers=None):
+		headers = list((headers or {}).items())
+		if content_type:
+			headers.append(('Content-Type', content_type))
+		body = data.encode() if isinstance(data, str) else data or b''
+
+		status, headers, body = asyncio.run(call(self.asgi, method, url, body, headers))
+		return self.app.response_class(body, status=status,
+			headers=[(name.decode(), value.decode()) for name, value in headers])
+
+	def get(self, url, **kwargs):
+		return self.open(url, method='GET', **kwargs)
+
+	def post(self, url, **kwargs):
+		return self.open(url, method='POST', **kwargs)
+
+	def put(self, url, **kwargs):
+		return self.open(url, method='PUT', **kwargs)
+
+	def patch(self, url, **kwargs):
+		return self.open(url, method='PATCH', **kwargs)
+
+	def delete(self, url, **kwargs):
+		return self.open(url, method='DELETE', **kwargs)
+
+
+class TestAsgiApi(api_test.TestApi):
+	"""
+		The api tests run against the asgi app
+	"""
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+		cls.asgi = AsgiApp(cls.app)
+		cls.client = partial(AsgiClient, cls.app, cls.asgi)
+
+		with cls.app.app_context():
+			init_database(db, cls.app)
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.asgi.executor.shutdown()
+		remove_database(cls.app)
+
+
+class TestAsgiEvents(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+		cls.asgi = AsgiApp(cls.app)
+		cls.client = partial(AsgiClient, cls.app, cls.asgi)
+
+		with cls.app.app_context():
+			init_database(db, cls.app)
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.asgi.executor.shutdown()
+		remove_database(cls.app)
+
+	def create_player(self):
+		res = self.client().post('/players', data=json.dumps({'player': {'name': 'player'}}),
+			content_type='application/json')
+		return get_from_dict(res.json, ['player', 'id']), get_from_dict(res.json, ['player', 'token'])
+
+	def create_game(self, player_id, token):
+		res = self.client().post('/games', data=json.dumps({'player': {'id': player_id, 'token': token}}),
+			content_type='application/json')
+		return get_from_dict(res.json, ['game', 'id'])
+
+	def test_event_stream(self):
+		player_id, token = self.create_player()
+		game_id = self.create_game(player_id, token)
+		payload = json.dumps({'player': {'id': player_id, 'token': token}}).encode()
+		json_headers = [('Content-Type', 'application/json')]
+
+		async def scenario():
+			events = asyncio.Queue()
+			disconnect = asyncio.Event()
+			requested = []
+			started = {}
+
+			async def receive():
+				if not requested:
+					requested.append(True)
+					return {'type': 'http.request', 'body': b''}
+				await disconnect.wait()
+				return {'type': 'http.disconnect'}
+
+			async def send(message):
+				if message['type'] == 'http.response.start':
+					started.update(message)
+				elif message.get('body', b'').startswith(b'event:'):
+					await events.put(message['body'].decode())
+
+			scope = {'type': 'http', 'method': 'GET', 'path': '/games/game' + str(game_id) + '/events',
+			         'query_string': b'', 'headers': []}
+			stream = asyncio.ensure_future(self.asgi(scope, receive, send))
+
+			hello = await asyncio.wait_for(events.get(), 5)
+			self.assertEqual(started['status'], SUCCESS)
+			self.assertIn((b'content-type', b'text/event-stream; charset=utf-8'), started['headers'])
+			self.assertTrue(hello.startswith('event: hello'))
+
+			status, headers, body = await call(self.asgi, 'PUT', '/games/game' + str(game_id),
+			                                   payload, json_headers)
+			self.assertEqual(status, SUCCESS)
+			joined = await asyncio.wait_for(events.get(), 5)
+			self.assertTrue(joined.startswith('event: player_joined'))
+
+			# the stream is closed when the client goes away
+			disconnect.set()
+			await asyncio.wait_for(stream, 5)
+
+		asyncio.run(scenario())
+		self.assertEqual(broker.subscriber_count(game_id), 0)
+
+	def test_event_stream_of_removed_game(self):
+		player_id, token = self.create_player()
+		game_id = self.create_game(player_id, token)
+
+		async def scenario():
+			stream = asyncio.ensure_future(call(self.asgi, 'GET', '/games/game' + str(game_id) + '/events'))
+			# wait for the stream to subscribe
+			while broker.subscriber_count(game_id) == 0:
+				await asyncio.sleep(0.01)
+
+			# removed without an event of this process, noticed on the keepalive
+			loop = asyncio.get_running_loop()
+			await loop.run_in_executor(None, self.delete_game, game_id)
+			return await asyncio.wait_for(stream, 5)
+
+		status, headers, body = asyncio.run(scenario())
+		self.assertEqual(status, SUCCESS)
+		self.assertTrue(body.decode().startswith('event: hello'))
+		self.assertIn('event: game_removed', body.decode())
+		self.assertEqual(broker.subscriber_count(game_id), 0)
+
+	def test_streams_do_not_hold_threads(self):
+		player_id, token = self.create_player()
+		game_id = self.create_game(player_id, token)
+		stream_count = 50 * TestConfig.ASGI_THREADS
+
+		async def scenario():
+			streams = [asyncio.ensure_future(call(self.asgi, 'GET', '/games/game' + str(game_id) + '/events'))
+			           for i in range(stream_count)]
+			while broker.subscriber_count(game_id) < stream_count:
+				await asyncio.sleep(0.01)
+
+			# the threads are free for the other requests
+			status, headers, body = await call(self.asgi, 'GET', '/games/game' + str(game_id))
+			self.assertEqual(status, SUCCESS)
+
+			loop = asyncio.get_running_loop()
+			await loop.run_in_executor(None, self.delete_game, game_id)
+			return await asyncio.wait_for(asyncio.gather(*streams), 10)
+
+		results = asyncio.run(scenario())
+		self.assertEqual(len(results), stream_count)
+		self.assertEqual(broker.subscriber_count(game_id), 0)
+
+	def delete_game(self, game_id):
+		with self.app.app_context():
+			db.session.execute('DELETE FROM game WHERE id = :id', {'id': game_id})
+			db.session.commit()
+
+	def test_event_stream_of_missing_game(self):
+		res = self.client().get('/games/game0/events')
+		self.assertEqual(res.status_code, UNPROCESSABLE)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+import sys
+import os
+import json
+from datetime import datetime, timedelta
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.authentication import generate_player_token, verify_player_token
+from krokeapp.database import init_database
+from krokeapp.models import Player
+from krokeapp.utils import get_from_dict
+from krokeapp.status_codes import *
+
+from database_setup import database_uri, remove_database
+
+TEST_DATABASE = "authentication_test.db"
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+	TOKEN_SWEEP_INTERVAL = None
+
+
+class TestAuthentication(unittest.TestCase):
+
+	def create_player(self, name):
+		res = self.client().post('players',
+			data=json.dumps({'player': {'name': name}}), content_type='application/json')
+		return get_from_dict(res.json, ['player', 'id']), get_from_dict(res.json, ['player', 'token'])
+
+	def rename(self, player_id, token=None, headers=None):
+		data = json.dumps({'player': {'name': 'renamed', 'token': token}})
+		return self.client().patch('/players/player' + str(player_id),
+			data=data, content_type='application/json', headers=headers)
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+		cls.client = cls.app.test_client
+
+		with cls.app.app_context():
+			init_database(db, cls.app)
+
+	@classmethod
+	def tearDownClass(cls):
+		remove_database(cls.app)
+
+	def test_token_roundtrip(self):
+		with self.app.app_context():
+			token, expiration = generate_player_token(42)
+			self.assertEqual(verify_player_token(token), 42)
+			self.assertGreater(expiration, datetime.utcnow())
+
+			# the signature covers the player id, the expiry and the nonce
+			player_id, expires, nonce, signature = token.split('.')
+			self.assertEqual(verify_player_token('.'.join(['43', expires, nonce, signature])), None)
+			self.assertEqual(verify_player_token('.'.join([player_id, str(int(expires) + 1), nonce, signature])), None)
+			self.assertEqual(verify_player_token('.'.join([player_id, expires, nonce + 'x', signature])), None)
+
+			# tokens issued in the same second differ
+			self.assertNotEqual(generate_player_token(42)[0], token)
+			self.assertEqual(verify_player_token('garbage'), None)
+			self.assertEqual(verify_player_token(None), None)
+
+	def test_expired_token(self):
+		self.app.config['TOKEN_EXPIRATION'] = -1
+		try:
+			with self.app.app_context():
+				token, expiration = generate_player_token(42)
+				self.assertEqual(verify_player_token(token), None)
+		finally:
+			self.app.config['TOKEN_EXPIRATION'] = Config.TOKEN_EXPIRATION
+
+	def test_mutation_requires_token(self):
+		player_id, token = self.create_player('authenticated')
+		other_id, other_token = self.create_player('other')
+
+		self.assertEqual(self.rename(player_id).status_code, UNAUTHORIZED)
+		self.assertEqual(self.rename(player_id, token=other_token).status_code, UNAUTHORIZED)
+		self.assertEqual(self.rename(player_id, token=token).status_code, SUCCESS)
+
+		# the token can also be sent in the header
+		res = self.rename(other_id, headers={'Authorization': 'Bearer ' + other_token})
+		self.assertEqual(res.status_code, SUCCESS)
+
+	def test_refresh_token(self):
+		player_id, token = self.create_player('refreshing')
+		url = '/players/player' + str(player_id) + '/token'
+
+		self.assertEqual(self.client().post(url).status_code, UNAUTHORIZED)
+		res = self.client().post(url, headers={'Authorization': 'Bearer ' + token})
+		self.assertEqual(res.status_code, SUCCESS)
+		new_token = get_from_dict(res.json, ['player', 'token'])
+
+		# only the new token works
+		self.assertNotEqual(new_token, token)
+		self.assertEqual(self.rename(player_id, token=token).status_code, UNAUTHORIZED)
+		self.assertEqual(self.rename(player_id, token=new_token).status_code, SUCCESS)
+
+	def test_revoke_token(self):
+		player_id, token = self.create_player('revoking')
+		url = '/players/player' + str(player_id) + '/token'
+
+		res = self.client().delete(url, headers={'Authorization': 'Bearer ' + token})
+		self.assertEqual(res.status_code, SUCCESS)
+		self.assertEqual(self.rename(player_id, token=token).status_code, UNAUTHORIZED)
+		self.assertEqual(self.client().post(url, headers={'Authorization': 'Bearer ' + token}).status_code,
+		                 UNAUTHORIZED)
+
+	def test_clear_expired_tokens(self):
+		player_id, token = self.create_player('expiring')
+		with self.app.app_context():
+			Player.by_id(player_id).token_expiration = datetime.utcnow() - timedelta(seconds=1)
+			db.session.commit()
+
+			self.assertGreaterEqual(Player.clear_expired_tokens(batch_size=1), 1)
+			player = Player.by_id(player_id)
+			self.assertEqual(player.token, None)
+			self.assertEqual(player.token_expiration, None)
+
+		# a swept token is refused
+		self.assertEqual(self.rename(player_id, token=token).status_code, UNAUTHORIZED)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,147 @@
+import unittest
+import sys
+import os
+import json
+import time
+
+from sqlalchemy import event
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.cache import LRUCache, MISSING, get_cache
+from krokeapp.database import init_database
+from krokeapp.utils import get_from_dict
+from krokeapp.status_codes import *
+
+from database_setup import database_uri, remove_database
+
+TEST_DATABASE = "cache_test.db"
+
+
+# the tokens of the players created by the tests
+TOKENS = {}
+
+def player_payload(name="", pid=""):
+	return json.dumps({"player": {"name": name, "id": pid, "token": TOKENS.get(pid)}})
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+
+
+class NoCacheConfig(TestConfig):
+
+	CACHE_BACKEND = None
+
+
+class TestLRUCache(unittest.TestCase):
+
+	def test_least_recently_used_is_dropped(self):
+		cache = LRUCache(max_entries=2, ttl=60)
+		cache.set('a', 1)
+		cache.set('b', 2)
+		cache.get('a')
+		cache.set('c', 3)
+
+		self.assertEqual(cache.get('a'), 1)
+		self.assertIs(cache.get('b'), MISSING)
+		self.assertEqual(cache.get('c'), 3)
+
+	def test_entries_expire(self):
+		cache = LRUCache(max_entries=2, ttl=0.01)
+		cache.set('a', 1)
+		time.sleep(0.02)
+		self.assertIs(cache.get('a'), MISSING)
+		self.assertEqual(len(cache), 0)
+
+
+class TestResourceCache(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+		cls.client = cls.app.test_client
+
+		with cls.app.app_context():
+			init_database(db, cls.app)
+
+		cls.statements = 0
+
+		def count(*args):
+			cls.statements += 1
+
+		event.listen(db.get_engine(cls.app), 'before_cursor_execute', count)
+
+	@classmethod
+	def tearDownClass(cls):
+		remove_database(cls.app)
+
+	def test_game_is_served_from_cache(self):
+		res = self.client().post('players',
+			data=player_payload(name='cached'), content_type='application/json')
+		player_id = get_from_dict(res.json, ['player', 'id'])
+		TOKENS[player_id] = get_from_dict(res.json, ['player', 'token'])
+		res = self.client().post('/games',
+			data=player_payload(pid=player_id), content_type='application/json')
+		game_id = get_from_dict(res.json, ['game', 'id'])
+		url = '/games/game' + str(game_id)
+
+		self.client().get(url)
+		hits = self.client().get('/cache').json['cache']['hits']
+
+		# the second read does not touch the database
+		statements = self.statements
+		res = self.client().get(url)
+		self.assertEqual(res.status_code, SUCCESS)
+		self.assertEqual(self.statements, statements)
+		self.assertEqual(self.client().get('/cache').json['cache']['hits'], hits + 1)
+
+		# joining the game invalidates the cached game
+		self.client().put(url, data=player_payload(pid=player_id), content_type='application/json')
+		res = self.client().get(url)
+		self.assertEqual(len(get_from_dict(res.json, ['game', 'players'])), 1)
+
+	def test_current_version_is_not_built_on_a_miss(self):
+		res = self.client().post('players',
+			data=player_payload(name='uncached'), content_type='application/json')
+		player_id = get_from_dict(res.json, ['player', 'id'])
+		TOKENS[player_id] = get_from_dict(res.json, ['player', 'token'])
+		res = self.client().post('/games',
+			data=player_payload(pid=player_id), content_type='application/json')
+		game_id = get_from_dict(res.json, ['game', 'id'])
+		url = '/games/game' + str(game_id)
+
+		# every read misses without a cache
+		app = create_app(NoCacheConfig())
+		etag = app.test_client().get(url).headers['ETag']
+
+		statements = []
+
+		def record(conn, cursor, statement, *args):
+			statements.append(statement)
+
+		event.listen(db.get_engine(app), 'before_cursor_execute', record)
+		try:
+			res = app.test_client().get(url, headers={'If-None-Match': etag})
+		finally:
+			event.remove(db.get_engine(app), 'before_cursor_execute', record)
+			db.get_engine(app).dispose()
+
+		# only the version is read
+		self.assertEqual(res.status_code, NOT_MODIFIED)
+		self.assertEqual(len(statements), 1)
+		self.assertNotIn('player', statements[0])
+
+	def test_missing_game_is_not_cached(self):
+		res = self.client().get('/games/game0')
+		self.assertEqual(res.status_code, UNPROCESSABLE)
+		with self.app.app_context():
+			self.assertIs(get_cache().backend.get('game:0'), MISSING)
+
+
+if __name__ == '__main__':
+	unittest.main()
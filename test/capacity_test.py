@@ -0,0 +1,167 @@
+import unittest
+import sys
+import os
+import multiprocessing
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.models import Game, Player, Team
+from krokeapp.status_codes import *
+
+from database_setup import database_uri, remove_database
+
+TEST_DATABASE = "capacity_test.db"
+
+PROCESSES = 4
+JOINS_PER_PROCESS = 5
+CAPACITY = 8
+# the lobby is nearly full when the joins start
+ROOM_LEFT = 2
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+	TOKEN_SWEEP_INTERVAL = None
+
+
+def join_all(url, players, start, results):
+	"""
+		Join the players one request at a time in a worker of its own
+	"""
+	app = create_app(TestConfig())
+	client = app.test_client()
+
+	start.wait()
+	statuses = []
+	for pid, token in players:
+		res = client.put(url, json={'player': {'id': pid, 'token': token}})
+		statuses.append(res.status_code)
+
+	db.get_engine(app).dispose()
+	results.put(statuses)
+
+
+class TestCapacity(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+		init_database(db, cls.app)
+
+	@classmethod
+	def tearDownClass(cls):
+		remove_database(cls.app)
+
+	def new_players(self, count, **kwargs):
+		"""
+			Committed players with their tokens
+		"""
+		with self.app.app_context():
+			players = [Player(name="player", **kwargs) for i in range(count)]
+			db.session.flush()
+			credentials = [(player.id, player.create_token()) for player in players]
+			db.session.commit()
+		return credentials
+
+	def new_game(self):
+		"""
+			A game with room for ROOM_LEFT more players,
+			returns the ids of the game and its team
+		"""
+		with self.app.app_context():
+			owner = Player(name="owner")
+			game = Game(name="full", owner=owner, max_players=CAPACITY)
+			team = Team(name="team", game=game, owner=owner, max_players=CAPACITY)
+			for i in range(CAPACITY - ROOM_LEFT):
+				player = Player(name="member", game=game)
+				team.players.append(player)
+			db.session.commit()
+			return game.id, team.id
+
+	def run_joins(self, url, credentials):
+		"""
+			Fire the joins from parallel processes at once
+		"""
+		# the workers must not share the connections of this process
+		db.get_engine(self.app).dispose()
+
+		context = multiprocessing.get_context('fork')
+		start = context.Barrier(PROCESSES)
+		results = context.Queue()
+		processes = [context.Process(target=join_all, args=(url, credentials[i::PROCESSES], start, results))
+					 for i in range(PROCESSES)]
+		for process in processes:
+			process.start()
+
+		statuses = [status for process in processes for status in results.get(timeout=60)]
+		for process in processes:
+			process.join()
+
+		return statuses
+
+	def test_parallel_game_joins_never_overfill(self):
+		game_id, team_id = self.new_game()
+		credentials = self.new_players(PROCESSES * JOINS_PER_PROCESS)
+
+		statuses = self.run_joins('/games/game' + str(game_id), credentials)
+
+		self.assertEqual(statuses.count(SUCCESS), ROOM_LEFT)
+		self.assertEqual(statuses.count(CONFLICT), len(statuses) - ROOM_LEFT)
+		with self.app.app_context():
+			self.assertEqual(Player.query.filter_by(game_id=game_id).count(), CAPACITY)
+
+	def test_parallel_team_joins_never_overfill(self):
+		game_id, team_id = self.new_game()
+		with self.app.app_context():
+			game = Game.by_id(game_id)
+			game.max_players = CAPACITY + PROCESSES * JOINS_PER_PROCESS
+			db.session.commit()
+		credentials = self.new_players(PROCESSES * JOINS_PER_PROCESS, game_id=game_id)
+
+		statuses = self.run_joins(f'/games/game{game_id}/teams/team{team_id}', credentials)
+
+		self.assertEqual(statuses.count(SUCCESS), ROOM_LEFT)
+		self.assertEqual(statuses.count(CONFLICT), len(statuses) - ROOM_LEFT)
+		with self.app.app_context():
+			self.assertEqual(Player.query.filter_by(team_id=team_id).count(), CAPACITY)
+
+	def test_bulk_join_fills_the_room_left(self):
+		game_id, team_id = self.new_game()
+		credentials = self.new_players(ROOM_LEFT + 1)
+
+		items = [{'player': {'id': pid, 'token': token}} for pid, token in credentials]
+		res = self.app.test_client().put('/games/game' + str(game_id), json={'players': items})
+
+		statuses = [item['status'] for item in res.json['players']]
+		self.assertEqual(statuses, [SUCCESS] * ROOM_LEFT + [CONFLICT])
+		with self.app.app_context():
+			self.assertEqual(Player.query.filter_by(game_id=game_id).count(), CAPACITY)
+
+	def test_switching_games_leaves_the_team(self):
+		old_game_id, old_team_id = self.new_game()
+		(single, token), *bulk = self.new_players(2, game_id=old_game_id, team_id=old_team_id)
+		game_id, team_id = self.new_game()
+		with self.app.app_context():
+			team_version = Team.by_id(old_team_id).version
+
+		client = self.app.test_client()
+		res = client.put('/games/game' + str(game_id), json={'player': {'id': single, 'token': token}})
+		self.assertEqual(res.status_code, SUCCESS)
+		items = [{'player': {'id': pid, 'token': token}} for pid, token in bulk]
+		res = client.put('/games/game' + str(game_id), json={'players': items})
+		self.assertEqual([item['status'] for item in res.json['players']], [SUCCESS])
+
+		# the slots of the old team are free again
+		with self.app.app_context():
+			self.assertEqual(Player.query.filter_by(team_id=old_team_id).count(), CAPACITY - ROOM_LEFT)
+			self.assertEqual([player.team_id for player in Player.by_ids([single, bulk[0][0]])], [None, None])
+			self.assertEqual(Team.by_id(old_team_id).version, team_version + 2)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import sys
+import os
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.models import Game, Player, Team
+from krokeapp.status_codes import *
+
+from database_setup import database_uri, remove_database
+
+TEST_DATABASE = "cascade_test.db"
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+	TOKEN_SWEEP_INTERVAL = None
+	REAP_INTERVAL = None
+
+
+class TestCascade(unittest.TestCase):
+	"""
+		Deleting games and teams takes a fixed number of
+		statements, the database deletes the teams and
+		detaches the players
+	"""
+
+	@contextmanager
+	def count_queries(self):
+		statements = []
+
+		def before_cursor_execute(conn, cursor, statement, *args):
+			statements.append(statement)
+
+		engine = db.get_engine(self.app)
+		event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+		try:
+			yield statements
+		finally:
+			event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+		init_database(db, cls.app)
+
+	@classmethod
+	def tearDownClass(cls):
+		remove_database(cls.app)
+
+	def add_game(self, team_count, players_per_team):
+		"""
+			A game full of teams and players, returns the
+			ids and the token of the owner
+		"""
+		with self.app.app_context():
+			owner = Player(name="owner")
+			game = Game(name="big", owner=owner, max_players=team_count * players_per_team + 1)
+			owner.game = game
+			for i in range(team_count):
+				team = Team(name="team", game=game, owner=owner)
+				for j in range(players_per_team):
+					Player(name="member", game=game, team=team)
+			db.session.flush()
+			token = owner.create_token()
+			db.session.commit()
+			return game.id, owner.id, token
+
+	def delete_game(self, game_id, owner_id, token):
+		with self.count_queries() as statements:
+			res = self.app.test_client().delete('/games/game' + str(game_id),
+				json={'player': {'id': owner_id, 'token': token}})
+		self.assertEqual(res.status_code, SUCCESS)
+		return len(statements)
+
+	def test_game_delete_is_set_based(self):
+		small = self.delete_game(*self.add_game(2, 2))
+		game_id, owner_id, token = self.add_game(20, 10)
+		with self.app.app_context():
+			team_ids = [team.id for team in Team.query.filter_by(game_id=game_id)]
+			player_ids = [player.id for player in Player.query.filter_by(game_id=game_id)]
+
+		big = self.delete_game(game_id, owner_id, token)
+
+		# the statements do not grow with the teams and the players
+		self.assertEqual(small, big)
+		self.assertLessEqual(big, 5)
+
+		with self.app.app_context():
+			self.assertIsNone(Game.by_id(game_id))
+			self.assertEqual(Team.query.filter(Team.id.in_(team_ids)).count(), 0)
+			# the players are kept but detached from the game and the teams
+			players = Player.by_ids(player_ids)
+			self.assertEqual(len(players), 201)
+			self.assertTrue(all(player.game_id is None and player.team_id is None for player in players))
+
+	def test_deleted_owner_leaves_games_and_teams(self):
+		game_id, owner_id, token = self.add_game(1, 1)
+
+		with self.app.app_context():
+			Player.query.filter_by(id=owner_id).delete()
+			db.session.commit()
+
+			self.assertIsNone(Game.by_id(game_id).owner_id)
+			self.assertIsNone(Team.query.filter_by(game_id=game_id).one().owner_id)
+
+
+if __name__ == '__main__':
+	unittest.main()
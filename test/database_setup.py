@@ -0,0 +1,38 @@
+import os
+
+from krokeapp import db, logger
+
+# the tests use sqlite files by default, set e.g.
+# TEST_DATABASE_URL=postgresql://localhost/krokeapp_test
+# to run them against a database server instead
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+
+
+def database_uri(sqlite_file):
+	"""
+		The database url of a test module
+	"""
+	return TEST_DATABASE_URL or "sqlite:///" + sqlite_file
+
+def uses_sqlite():
+	return database_uri('').startswith('sqlite')
+
+def remove_database(app):
+	"""
+		Drop the tables of a database server or
+		remove the sqlite file after the tests
+	"""
+	if not uses_sqlite():
+		with app.app_context():
+			db.session.remove()
+			db.drop_all()
+		db.get_engine(app).dispose()
+		return
+
+	# close the pooled connections before removing the database
+	db.get_engine(app).dispose()
+	path = app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+	try:
+		os.remove(os.path.join(app.root_path, path))
+	except FileNotFoundError:
+		logger.warning("Cannot remove test database, did not find it.")
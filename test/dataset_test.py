@@ -0,0 +1,117 @@
+import unittest
+import sys
+import os
+import json
+from datetime import datetime, timedelta
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.dataset import generate_dataset
+from krokeapp.models import Game, Player, Team
+from krokeapp.reaper import reap
+from krokeapp.sequence import next_value
+from krokeapp.status_codes import *
+from krokeapp.utils import get_from_dict
+
+from database_setup import database_uri, remove_database
+
+TEST_DATABASE = "dataset_test.db"
+
+NOW = datetime(2020, 1, 1)
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+	REAP_INTERVAL = None
+
+
+class TestDataset(unittest.TestCase):
+
+	def setUp(self):
+		self.app = create_app(TestConfig())
+		init_database(db, self.app)
+
+	def tearDown(self):
+		with self.app.app_context():
+			db.session.remove()
+		remove_database(self.app)
+
+	def memberships(self):
+		with self.app.app_context():
+			players = db.session.query(Player.id, Player.game_id, Player.team_id).order_by(Player.id).all()
+			games = db.session.query(Game.id, Game.owner_id, Game.max_players, Game.player_count) \
+			                  .order_by(Game.id).all()
+			teams = db.session.query(Team.id, Team.game_id, Team.owner_id, Team.max_players) \
+			                  .order_by(Team.id).all()
+		return players, games, teams
+
+	def test_generate_dataset(self):
+		with self.app.app_context():
+			counts = generate_dataset(2000, 300, seed=1, now=NOW)
+
+		players, games, teams = self.memberships()
+		self.assertEqual(counts, {'players': 2000, 'games': 300, 'teams': len(teams)})
+		self.assertEqual(len(players), 2000)
+		self.assertEqual(len(games), 300)
+		self.assertTrue(teams)
+
+		members = {}
+		team_members = {}
+		for player_id, game_id, team_id in players:
+			members.setdefault(game_id, []).append(player_id)
+			if team_id is not None:
+				team_members.setdefault(team_id, []).append(player_id)
+		# some players wait in the lobby
+		self.assertIn(None, members)
+
+		for game_id, owner_id, max_players, player_count in games:
+			self.assertEqual(player_count, len(members.get(game_id, [])))
+			self.assertLessEqual(player_count, max_players)
+			if player_count:
+				self.assertIn(owner_id, members[game_id])
+
+		for team_id, game_id, owner_id, max_players in teams:
+			self.assertLessEqual(len(team_members.get(team_id, [])), max_players)
+			self.assertIn(owner_id, members[game_id])
+
+		# the names of new games continue after the generated ones
+		with self.app.app_context():
+			self.assertEqual(next_value('game_name'), 301)
+
+		# and the ids of new rows after the generated ones
+		res = self.app.test_client().post('/players', data=json.dumps({'player': {'name': 'new'}}),
+			content_type='application/json')
+		self.assertEqual(res.status_code, RESOURCE_CREATED)
+		self.assertEqual(get_from_dict(res.json, ['player', 'id']), 2001)
+
+	def test_reaper_keeps_the_dataset(self):
+		# generated most of the idle timeout of the games ago
+		with self.app.app_context():
+			generate_dataset(500, 100, seed=3, now=datetime.utcnow() - timedelta(minutes=50))
+			self.assertEqual(reap(), {'players': 0, 'teams': 0, 'games': 0})
+
+	def test_same_seed_same_rows(self):
+		with self.app.app_context():
+			generate_dataset(500, 100, seed=7, now=NOW)
+		first = self.memberships()
+
+		self.tearDown()
+		self.setUp()
+		with self.app.app_context():
+			generate_dataset(500, 100, seed=7, now=NOW)
+		self.assertEqual(self.memberships(), first)
+
+	def test_database_must_be_empty(self):
+		with self.app.app_context():
+			generate_dataset(10, 2)
+			with self.assertRaises(ValueError):
+				generate_dataset(10, 2)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,166 @@
+import unittest
+import sys
+import os
+import json
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.events import broker
+from krokeapp import logger
+from krokeapp.utils import get_from_dict
+from krokeapp.status_codes import *
+
+from database_setup import database_uri, remove_database
+
+TEST_DATABASE = "events_test.db"
+
+
+# the tokens of the players created by the tests
+TOKENS = {}
+
+def player_payload(name="", pid=""):
+	return json.dumps({"player": {"name": name, "id": pid, "token": TOKENS.get(pid)}})
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+	EVENTS_KEEPALIVE = 0.05
+
+
+class TestEvents(unittest.TestCase):
+
+	def create_player(self, name=""):
+		res = self.client().post('players',
+			data=player_payload(name=name), content_type='application/json')
+		player_id = get_from_dict(res.json, ['player', 'id'])
+		TOKENS[player_id] = get_from_dict(res.json, ['player', 'token'])
+		return player_id
+
+	def create_game(self, owner_id):
+		res = self.client().post('/games',
+			data=player_payload(pid=owner_id), content_type='application/json')
+		return get_from_dict(res.json, ['game', 'id'])
+
+	def join_game(self, player_id, game_id):
+		return self.client().put('games/game'+str(game_id),
+			data=player_payload(pid=player_id), content_type='application/json')
+
+	def read_event(self, chunks):
+		"""
+			Read the next event from the stream skipping the keepalives
+		"""
+		for chunk in chunks:
+			chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+			if chunk.startswith(':'):
+				continue
+			lines = chunk.strip().split('\n')
+			event_type = lines[0][len('event: '):]
+			data = json.loads(lines[1][len('data: '):])
+			return event_type, data
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+		cls.client = cls.app.test_client
+
+		with cls.app.app_context():
+			init_database(db, cls.app)
+
+	@classmethod
+	def tearDownClass(cls):
+		# after running the tests, delete the test database
+		remove_database(cls.app)
+
+	def test_join_is_published(self):
+		owner_id = self.create_player('owner')
+		game_id = self.create_game(owner_id)
+
+		stream = broker.subscribe(game_id)
+		try:
+			self.join_game(owner_id, game_id)
+			event_type, data = stream.get(timeout=1)
+		finally:
+			broker.unsubscribe(game_id, stream)
+
+		self.assertEqual(event_type, 'player_joined')
+		self.assertEqual(get_from_dict(data, ['player', 'id']), owner_id)
+		self.assertEqual(broker.subscriber_count(game_id), 0)
+
+	def test_event_stream(self):
+		owner_id = self.create_player('owner')
+		game_id = self.create_game(owner_id)
+
+		res = self.client().get('/games/game' + str(game_id) + '/events')
+		self.assertEqual(res.status_code, SUCCESS)
+		self.assertEqual(res.mimetype, 'text/event-stream')
+		chunks = iter(res.response)
+
+		event_type, data = self.read_event(chunks)
+		self.assertEqual(event_type, 'hello')
+		self.assertEqual(get_from_dict(data, ['game', 'id']), game_id)
+
+		self.join_game(owner_id, game_id)
+		event_type, data = self.read_event(chunks)
+		self.assertEqual(event_type, 'player_joined')
+
+		# the stream ends when the game is removed
+		self.client().delete('games/game' + str(game_id),
+			data=player_payload(pid=owner_id), content_type='application/json')
+		event_type, data = self.read_event(chunks)
+		self.assertEqual(event_type, 'game_removed')
+		self.assertEqual(list(chunks), [])
+		self.assertEqual(broker.subscriber_count(game_id), 0)
+
+	def test_changes_of_other_workers(self):
+		owner_id = self.create_player('owner')
+		game_id = self.create_game(owner_id)
+
+		res = self.client().get('/games/game' + str(game_id) + '/events')
+		chunks = iter(res.response)
+		self.read_event(chunks)
+
+		# a change that did not go through the broker of this process
+		with self.app.app_context():
+			db.session.execute('UPDATE game SET version = version + 1 WHERE id = :id',
+							   {'id': game_id})
+			db.session.commit()
+
+		event_type, data = self.read_event(chunks)
+		self.assertEqual(event_type, 'changed')
+		self.assertEqual(get_from_dict(data, ['game', 'version']), 2)
+		res.close()
+
+	def test_changes_of_other_workers_before_a_local_change(self):
+		owner_id = self.create_player('owner')
+		game_id = self.create_game(owner_id)
+
+		res = self.client().get('/games/game' + str(game_id) + '/events')
+		chunks = iter(res.response)
+		self.read_event(chunks)
+
+		# another worker changes the game before the next keepalive
+		with self.app.app_context():
+			db.session.execute('UPDATE game SET version = version + 1 WHERE id = :id',
+							   {'id': game_id})
+			db.session.commit()
+		self.join_game(owner_id, game_id)
+
+		event_type, data = self.read_event(chunks)
+		self.assertEqual(event_type, 'player_joined')
+		event_type, data = self.read_event(chunks)
+		self.assertEqual(event_type, 'changed')
+		self.assertEqual(get_from_dict(data, ['game', 'version']), 3)
+		res.close()
+
+	def test_event_stream_of_missing_game(self):
+		res = self.client().get('/games/game0/events')
+		self.assertEqual(res.status_code, UNPROCESSABLE)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import sys
+import os
+
+from sqlalchemy import inspect
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database, create_missing_indexes
+from krokeapp.models import Player, Team
+
+from database_setup import database_uri, remove_database
+
+TEST_DATABASE = "index_test.db"
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+
+
+class TestIndexes(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+		init_database(db, cls.app)
+
+	@classmethod
+	def tearDownClass(cls):
+		remove_database(cls.app)
+
+	def index_names(self, table):
+		inspector = inspect(db.get_engine(self.app))
+		return {index['name'] for index in inspector.get_indexes(table.name)}
+
+	def test_foreign_keys_are_indexed(self):
+		self.assertIn('ix_player_game_id_id', self.index_names(Player.__table__))
+		self.assertIn('ix_player_team_id', self.index_names(Player.__table__))
+		self.assertIn('ix_team_game_id_id', self.index_names(Team.__table__))
+
+	def test_create_missing_indexes(self):
+		# a database created before the index was declared
+		engine = db.get_engine(self.app)
+		for index in Team.__table__.indexes:
+			if index.name == 'ix_team_game_id_id':
+				index.drop(bind=engine)
+		self.assertNotIn('ix_team_game_id_id', self.index_names(Team.__table__))
+
+		created = create_missing_indexes(db, self.app)
+
+		self.assertEqual(created, ['ix_team_game_id_id'])
+		self.assertIn('ix_team_game_id_id', self.index_names(Team.__table__))
+
+		# nothing left to do on the second run
+		self.assertEqual(create_missing_indexes(db, self.app), [])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,175 @@
+import unittest
+import sys
+import os
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.matchmaking import MatchmakingQueue, init_matchmaking, tick
+from krokeapp.models import Game, Player, Team
+from krokeapp.utils import get_from_dict
+from krokeapp.status_codes import *
+
+from database_setup import database_uri, remove_database
+
+TEST_DATABASE = "matchmaking_test.db"
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+	TOKEN_SWEEP_INTERVAL = None
+	REAP_INTERVAL = None
+	# the tests tick the queue themselves
+	MATCHMAKING_INTERVAL = None
+	MATCH_SIZE = 4
+	MATCH_TEAMS = 2
+
+
+class TestMatchmakingQueue(unittest.TestCase):
+
+	def test_priority_then_arrival_order(self):
+		queue = MatchmakingQueue()
+		for playerid in range(1, 6):
+			queue.join(playerid)
+		queue.join(6, priority=1)
+		queue.leave(2)
+
+		matches = queue.pop_matches(2, 10)
+
+		self.assertEqual([[entry[-1] for entry in match] for match in matches], [[6, 1], [3, 4]])
+		self.assertEqual(len(queue), 1)
+
+	def test_requeued_players_keep_their_place(self):
+		queue = MatchmakingQueue()
+		for playerid in range(1, 4):
+			queue.join(playerid)
+
+		match, = queue.pop_matches(2, 10)
+		queue.requeue(match)
+
+		self.assertEqual([entry[-1] for entry in queue.pop_matches(3, 10)[0]], [1, 2, 3])
+
+
+class TestMatchmaking(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+		cls.client = cls.app.test_client
+		init_database(db, cls.app)
+
+	@classmethod
+	def tearDownClass(cls):
+		remove_database(cls.app)
+
+	def setUp(self):
+		# an empty queue for each test
+		init_matchmaking(self.app)
+
+	def create_player(self, name):
+		res = self.client().post('/players', json={'player': {'name': name}})
+		return res.json['player']
+
+	def status(self, player, token=None):
+		return self.client().get('/matchmaking/player' + str(player['id']),
+			headers={'Authorization': 'Bearer ' + (token or player['token'])})
+
+	def test_queued_players_are_matched_in_balanced_teams(self):
+		players = [self.create_player('queued') for i in range(9)]
+		for player in players:
+			res = self.client().post('/matchmaking', json={'player': player})
+			self.assertEqual(res.status_code, SUCCESS)
+
+		self.assertIn('queued', self.status(players[0]).json)
+
+		with self.app.app_context():
+			self.assertEqual(tick(), 2)
+
+		matches = [self.status(player).json for player in players[:8]]
+		game_ids = {get_from_dict(match, ['match', 'game', 'id']) for match in matches}
+		self.assertEqual(len(game_ids), 2)
+		# the last one waits for more players
+		self.assertIn('queued', self.status(players[8]).json)
+
+		with self.app.app_context():
+			for game_id in game_ids:
+				game = Game.by_id(game_id)
+				self.assertEqual(len(game.players), 4)
+				self.assertEqual(game.player_count, 4)
+				self.assertEqual(game.max_players, 4)
+				self.assertEqual(sorted(len(team.players) for team in game.teams), [2, 2])
+				self.assertIn(game.owner, game.players)
+
+		# the match is kept for the player only
+		self.assertEqual(self.status(players[0]).json, matches[0])
+		self.assertEqual(self.status(players[0], token=players[1]['token']).status_code, UNAUTHORIZED)
+
+		# until they leave its game
+		game_id = get_from_dict(matches[0], ['match', 'game', 'id'])
+		self.client().patch('/games/game' + str(game_id), json={'del_player': players[0]})
+		self.assertEqual(self.status(players[0]).status_code, UNPROCESSABLE)
+
+		res = self.client().get('/matchmaking')
+		self.assertEqual(get_from_dict(res.json, ['matchmaking', 'waiting']), 1)
+		self.assertEqual(get_from_dict(res.json, ['matchmaking', 'matched']), 8)
+
+		res = self.client().delete('/matchmaking', json={'player': players[8]})
+		self.assertEqual(res.status_code, SUCCESS)
+		res = self.client().delete('/matchmaking', json={'player': players[8]})
+		self.assertEqual(res.status_code, PRECONDITION_FAILED)
+
+	def test_players_are_queued_once(self):
+		players = [self.create_player('twice') for i in range(4)]
+		for player in players:
+			self.client().post('/matchmaking', json={'player': player})
+
+		# queued already
+		res = self.client().post('/matchmaking', json={'player': players[0]})
+		self.assertEqual(res.status_code, CONFLICT)
+
+		# a player joins a game through another worker while queued
+		res = self.client().post('/games', json={'player': players[0]})
+		other_game = get_from_dict(res.json, ['game', 'id'])
+		self.client().put('/games/game' + str(other_game), json={'player': players[0]})
+
+		with self.app.app_context():
+			tick()
+			self.assertEqual(Player.by_id(players[0]['id']).game_id, other_game)
+			self.assertEqual(len(Game.by_id(get_from_dict(self.status(players[1]).json,
+			                                              ['match', 'game', 'id'])).players), 3)
+		self.assertEqual(self.status(players[0]).status_code, UNPROCESSABLE)
+
+		# players in a game are not queued
+		res = self.client().post('/matchmaking', json={'player': players[1]})
+		self.assertEqual(res.status_code, CONFLICT)
+
+	def test_teams_take_their_share_of_the_match(self):
+		self.app.config['TEAM_MAX_PLAYERS'] = 1
+		try:
+			players = [self.create_player('crowded') for i in range(4)]
+			for player in players:
+				self.client().post('/matchmaking', json={'player': player})
+			with self.app.app_context():
+				tick()
+		finally:
+			self.app.config['TEAM_MAX_PLAYERS'] = TestConfig.TEAM_MAX_PLAYERS
+
+		with self.app.app_context():
+			for player in players:
+				team_id = get_from_dict(self.status(player).json, ['match', 'team', 'id'])
+				self.assertEqual(Player.by_id(player['id']).team_id, team_id)
+				self.assertEqual(len(Team.by_id(team_id).players), 2)
+
+	def test_queueing_requires_token(self):
+		player = self.create_player('unauthorized')
+		res = self.client().post('/matchmaking', json={'player': {'id': player['id']}})
+		self.assertEqual(res.status_code, UNAUTHORIZED)
+		self.assertEqual(self.status(player).status_code, UNPROCESSABLE)
+
+
+if __name__ == '__main__':
+	unittest.main()
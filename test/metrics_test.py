@@ -0,0 +1,99 @@
+import unittest
+import sys
+import os
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.metrics import Histogram
+from krokeapp.status_codes import *
+
+from database_setup import database_uri, remove_database
+
+TEST_DATABASE = "metrics_test.db"
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+	METRICS_ENABLED = True
+	# every statement counts as slow
+	SLOW_QUERY_THRESHOLD = 0
+
+
+class DisabledConfig(TestConfig):
+
+	METRICS_ENABLED = False
+
+
+class TestHistogram(unittest.TestCase):
+
+	def test_buckets_are_cumulative(self):
+		histogram = Histogram((1, 2))
+		for value in (0.5, 1, 1.5, 3):
+			histogram.observe(value)
+
+		lines = histogram.exposition('latency', 'route="a"')
+		self.assertEqual(lines, [
+			'latency_bucket{route="a",le="1"} 2',
+			'latency_bucket{route="a",le="2"} 3',
+			'latency_bucket{route="a",le="+Inf"} 4',
+			'latency_sum{route="a"} 6.0',
+			'latency_count{route="a"} 4',
+		])
+
+
+class TestMetrics(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+		cls.client = cls.app.test_client
+		init_database(db, cls.app)
+
+	@classmethod
+	def tearDownClass(cls):
+		remove_database(cls.app)
+
+	def metric_values(self):
+		res = self.client().get('/metrics')
+		self.assertEqual(res.status_code, SUCCESS)
+		self.assertTrue(res.content_type.startswith('text/plain'))
+
+		values = {}
+		for line in res.get_data(as_text=True).splitlines():
+			if not line.startswith('#'):
+				name, value = line.rsplit(' ', 1)
+				values[name] = float(value)
+		return values
+
+	def test_requests_are_timed_and_their_queries_counted(self):
+		self.client().post('/players', json={'player': {'name': 'timed'}})
+		self.client().get('/players')
+
+		values = self.metric_values()
+
+		route = 'method="POST",endpoint="api.players"'
+		self.assertEqual(values['krokeapp_request_duration_seconds_count{' + route + '}'], 1)
+		self.assertGreater(values['krokeapp_request_duration_seconds_sum{' + route + '}'], 0)
+		# the insert at least
+		self.assertGreaterEqual(values['krokeapp_request_queries_sum{' + route + '}'], 1)
+		self.assertGreater(values['krokeapp_request_db_seconds_sum{' + route + '}'], 0)
+		self.assertEqual(values['krokeapp_responses_total{' + route + ',status="201"}'], 1)
+
+		self.assertEqual(values['krokeapp_request_duration_seconds_count{method="GET",endpoint="api.players"}'], 1)
+		self.assertGreater(values['krokeapp_slow_queries_total'], 0)
+
+	def test_disabled_metrics_are_not_served(self):
+		app = create_app(DisabledConfig())
+
+		self.assertEqual(app.test_client().get('/metrics').status_code, 404)
+		self.assertNotIn('krokeapp_metrics', app.extensions)
+		db.get_engine(app).dispose()
+
+
+if __name__ == '__main__':
+	unittest.main()
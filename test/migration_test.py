@@ -0,0 +1,191 @@
+import unittest
+import sys
+import os
+
+from sqlalchemy import event, inspect
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.migrations import latest_version, migrate, schema_version
+from krokeapp.models import Game, Player, Team
+from krokeapp.sequence import next_value
+
+from database_setup import database_uri, remove_database, uses_sqlite
+
+TEST_DATABASE = "migration_test.db"
+
+# the schema of the first release
+FIRST_RELEASE_SCHEMA = [
+	"""CREATE TABLE player (id INTEGER NOT NULL, created_time DATETIME NOT NULL,
+		name VARCHAR(30) NOT NULL, token VARCHAR(32), token_expiration DATETIME,
+		team_id INTEGER, game_id INTEGER, PRIMARY KEY (id),
+		FOREIGN KEY(team_id) REFERENCES team (id), FOREIGN KEY(game_id) REFERENCES game (id))""",
+	"CREATE UNIQUE INDEX ix_player_token ON player (token)",
+	"""CREATE TABLE game (id INTEGER NOT NULL, created_time DATETIME NOT NULL,
+		name VARCHAR(30) NOT NULL, owner_id INTEGER, PRIMARY KEY (id),
+		CONSTRAINT fk_owner_id FOREIGN KEY(owner_id) REFERENCES player (id))""",
+	"""CREATE TABLE team (id INTEGER NOT NULL, created_time DATETIME NOT NULL,
+		name VARCHAR(30) NOT NULL, game_id INTEGER NOT NULL, owner_id INTEGER, PRIMARY KEY (id),
+		FOREIGN KEY(game_id) REFERENCES game (id),
+		CONSTRAINT fk_team_owner_id FOREIGN KEY(owner_id) REFERENCES player (id))""",
+	"""CREATE TABLE token (id INTEGER NOT NULL, created_time DATETIME NOT NULL,
+		token VARCHAR(32), token_expiration DATETIME, PRIMARY KEY (id))""",
+	"CREATE UNIQUE INDEX ix_token_token ON token (token)",
+]
+
+NOW = '2020-01-01 00:00:00.000000'
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+
+
+@unittest.skipUnless(uses_sqlite(), "the first release schema is written for sqlite")
+class TestMigrations(unittest.TestCase):
+
+	def setUp(self):
+		self.app = create_app(TestConfig())
+		self.engine = db.get_engine(self.app)
+
+	def tearDown(self):
+		remove_database(self.app)
+
+	def create_first_release(self):
+		with self.engine.begin() as connection:
+			for statement in FIRST_RELEASE_SCHEMA:
+				connection.execute(statement)
+			for pid in range(1, 8):
+				connection.execute("INSERT INTO player (id, created_time, name) VALUES (?, ?, 'player')",
+				                   (pid, NOW))
+			for gid in range(1, 4):
+				connection.execute("INSERT INTO game (id, created_time, name, owner_id) VALUES (?, ?, 'game', ?)",
+				                   (gid, NOW, gid))
+				connection.execute("INSERT INTO team (id, created_time, name, game_id, owner_id) "
+				                   "VALUES (?, ?, 'team', ?, ?)", (gid, NOW, gid, gid))
+			# three players in the first game, two in the second
+			connection.execute("UPDATE player SET game_id = 1, team_id = 1 WHERE id IN (1, 2, 3)")
+			connection.execute("UPDATE player SET game_id = 2 WHERE id IN (4, 5)")
+
+	def test_migrate_first_release(self):
+		self.create_first_release()
+		self.assertEqual(schema_version(self.engine), 0)
+
+		# batches smaller than the tables
+		applied = migrate(db, self.app, batch_size=2)
+
+		self.assertEqual(applied, list(range(1, latest_version() + 1)))
+		self.assertEqual(schema_version(self.engine), latest_version())
+		self.assertEqual(migrate(db, self.app), [])
+
+		inspector = inspect(self.engine)
+		for table in (Game.__table__, Team.__table__, Player.__table__):
+			columns = {column['name'] for column in inspector.get_columns(table.name)}
+			self.assertEqual(columns, {column.name for column in table.columns})
+			indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+			self.assertTrue({index.name for index in table.indexes} <= indexes)
+
+		with self.app.app_context():
+			self.assertEqual([game.player_count for game in Game.query.order_by(Game.id)], [3, 2, 0])
+			self.assertEqual(Game.by_id(1).max_players, self.app.config['GAME_MAX_PLAYERS'])
+			self.assertEqual(Player.by_id(1).team_id, 1)
+
+			# the names of new games continue after the existing ones
+			self.assertEqual(next_value('game_name'), 4)
+
+			# the deletes cascade as in a new database
+			db.session.execute('DELETE FROM game WHERE id = 1')
+			db.session.commit()
+			self.assertIsNone(Team.by_id(1))
+			self.assertIsNone(Player.by_id(2).game_id)
+			self.assertIsNone(Player.by_id(2).team_id)
+
+	def test_writes_during_the_copy_are_kept(self):
+		self.create_first_release()
+		copied = []
+
+		def write(conn, cursor, statement, parameters, context, executemany):
+			# after the players 3 and 4 are copied, before the later ones
+			if 'INTO _migrate_player' in statement and 3 in parameters and not copied:
+				copied.append(statement)
+				conn.execute("UPDATE player SET name = 'copied' WHERE id = 3")
+				conn.execute("DELETE FROM player WHERE id = 4")
+				conn.execute("UPDATE player SET name = 'not copied' WHERE id = 6")
+				conn.execute("DELETE FROM player WHERE id = 7")
+				conn.execute("INSERT INTO player (id, created_time, name) VALUES (8, ?, 'new')", (NOW,))
+
+		event.listen(self.engine, 'after_cursor_execute', write)
+		try:
+			migrate(db, self.app, batch_size=2)
+		finally:
+			event.remove(self.engine, 'after_cursor_execute', write)
+
+		self.assertTrue(copied)
+		with self.engine.connect() as connection:
+			names = dict(connection.execute('SELECT id, name FROM player').fetchall())
+			tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master").fetchall()}
+		self.assertEqual(names, {1: 'player', 2: 'player', 3: 'copied', 5: 'player',
+		                         6: 'not copied', 8: 'new'})
+		# the copy and its triggers are gone
+		self.assertFalse([name for name in tables if name.startswith('_migrate_')])
+
+	def test_dangling_references_are_cleared(self):
+		self.create_first_release()
+		with self.engine.connect() as connection:
+			# the first release did not enforce the foreign keys
+			connection.execute("PRAGMA foreign_keys = OFF")
+			with connection.begin():
+				# a team and a player of a deleted game
+				connection.execute("INSERT INTO team (id, created_time, name, game_id, owner_id) "
+				                   "VALUES (4, ?, 'team', 9, 6)", (NOW,))
+				connection.execute("UPDATE player SET game_id = 9, team_id = 4 WHERE id = 6")
+				# a deleted team and deleted owners
+				connection.execute("UPDATE player SET game_id = 3, team_id = 99 WHERE id = 7")
+				connection.execute("UPDATE game SET owner_id = 42 WHERE id = 3")
+				connection.execute("UPDATE team SET owner_id = 42 WHERE id = 3")
+			connection.execute("PRAGMA foreign_keys = ON")
+
+		migrate(db, self.app, batch_size=2)
+
+		self.assertEqual(schema_version(self.engine), latest_version())
+		with self.app.app_context():
+			self.assertIsNone(Team.by_id(4))
+			self.assertEqual((Player.by_id(6).game_id, Player.by_id(6).team_id), (None, None))
+			self.assertEqual((Player.by_id(7).game_id, Player.by_id(7).team_id), (3, None))
+			self.assertIsNone(Game.by_id(3).owner_id)
+			self.assertIsNone(Team.by_id(3).owner_id)
+
+	def test_failed_copy_is_dropped(self):
+		self.create_first_release()
+
+		def fail(conn, cursor, statement, parameters, context, executemany):
+			if 'INTO _migrate_player' in statement and 'SELECT' in statement:
+				raise RuntimeError("interrupted")
+
+		event.listen(self.engine, 'before_cursor_execute', fail)
+		try:
+			with self.assertRaises(Exception):
+				migrate(db, self.app, batch_size=2)
+		finally:
+			event.remove(self.engine, 'before_cursor_execute', fail)
+
+		with self.engine.begin() as connection:
+			tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master").fetchall()}
+			# the app keeps writing to the table
+			connection.execute("UPDATE player SET name = 'renamed' WHERE id = 1")
+		self.assertFalse([name for name in tables if name.startswith('_migrate_')])
+
+		self.assertEqual(migrate(db, self.app), [latest_version()])
+
+	def test_new_database_is_current(self):
+		init_database(db, self.app)
+		self.assertEqual(schema_version(self.engine), latest_version())
+		self.assertEqual(migrate(db, self.app), [])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,149 @@
+import unittest
+import sys
+import os
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.models import Game, Player, Team
+from krokeapp import logger
+from krokeapp.utils import get_from_dict
+from krokeapp.status_codes import *
+
+from database_setup import database_uri, remove_database
+
+TEST_DATABASE = "query_count_test.db"
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+
+
+class TestQueryCount(unittest.TestCase):
+	"""
+		Serializing the collections must take a fixed number
+		of queries no matter how many games, teams and players
+		there are in the database.
+	"""
+
+	@contextmanager
+	def count_queries(self):
+		"""
+			Count the statements sent to the database inside the block
+		"""
+		statements = []
+
+		def before_cursor_execute(conn, cursor, statement, *args):
+			statements.append(statement)
+
+		engine = db.get_engine(self.app)
+		event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+		try:
+			yield statements
+		finally:
+			event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+	def add_games(self, game_count, players_per_game):
+		"""
+			Create games with a team and some players in each one
+		"""
+		with self.app.app_context():
+			for i in range(game_count):
+				owner = Player(name="owner")
+				game = Game(name="game", owner=owner)
+				team = Team(name="team", game=game, owner=owner)
+				for j in range(players_per_game):
+					player = Player(name="player")
+					game.players.append(player)
+					team.players.append(player)
+				db.session.add(game)
+			db.session.commit()
+
+	def get_counted(self, url):
+		with self.count_queries() as statements:
+			res = self.client().get(url)
+		self.assertEqual(res.status_code, SUCCESS)
+		return res, len(statements)
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+		cls.client = cls.app.test_client
+
+		with cls.app.app_context():
+			init_database(db, cls.app)
+
+	@classmethod
+	def tearDownClass(cls):
+		# after running the tests, delete the test database
+		remove_database(cls.app)
+
+	def test_games_query_count(self):
+		self.add_games(2, 2)
+		res, few_count = self.get_counted('/games')
+
+		self.add_games(20, 5)
+		res, many_count = self.get_counted('/games')
+
+		# the listing grows but the number of queries does not
+		self.assertGreaterEqual(len(res.json['games']), 22)
+		self.assertEqual(few_count, many_count)
+		self.assertLessEqual(many_count, 2)
+
+	def test_game_query_count(self):
+		self.add_games(1, 10)
+		with self.app.app_context():
+			game_id = Game.query.order_by(Game.id.desc()).first().id
+
+		res, count = self.get_counted('/games/game' + str(game_id))
+
+		self.assertEqual(len(get_from_dict(res.json, ['game', 'players'])), 10)
+		self.assertLessEqual(count, 2)
+
+	def test_teams_query_count(self):
+		self.add_games(2, 2)
+		res, few_count = self.get_counted('/games/game1/teams')
+
+		self.add_games(10, 5)
+		with self.app.app_context():
+			game_id = Game.query.order_by(Game.id.desc()).first().id
+
+		res, many_count = self.get_counted('/games/game' + str(game_id) + '/teams')
+
+		teams = get_from_dict(res.json, ['teams'])
+		self.assertEqual(len(get_from_dict(teams[0], ['team', 'players'])), 5)
+		self.assertEqual(few_count, many_count)
+		self.assertLessEqual(many_count, 2)
+
+	def test_bulk_create_players_query_count(self):
+		items = [{'player': {'name': 'bulk' + str(i)}} for i in range(600)]
+		with self.count_queries() as statements:
+			res = self.client().post('/players', json={'players': items})
+		self.assertEqual(res.status_code, SUCCESS)
+
+		# the rows go in a few multi-row inserts, not one by one
+		inserts = [statement for statement in statements if statement.startswith('INSERT')]
+		self.assertEqual(len(inserts), 3)
+		self.assertLessEqual(len(statements), 6)
+
+		players = [item['player'] for item in res.json['players']]
+		self.assertEqual([player['name'] for player in players], ['bulk' + str(i) for i in range(600)])
+		self.assertEqual(len({player['id'] for player in players}), 600)
+		with self.app.app_context():
+			names = {player.id: player.name for player in Player.by_ids([player['id'] for player in players])}
+		self.assertEqual([names[player['id']] for player in players], [player['name'] for player in players])
+		# each player can use the token issued to them
+		res = self.client().patch('/players/player' + str(players[-1]['id']),
+			json={'player': {'name': 'renamed', 'token': players[-1]['token']}})
+		self.assertEqual(res.status_code, SUCCESS)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+import sys
+import os
+from datetime import datetime, timedelta
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.models import Game, Player, Team
+from krokeapp.reaper import reap
+from krokeapp.status_codes import *
+
+from database_setup import database_uri, remove_database
+
+TEST_DATABASE = "reaper_test.db"
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+	TOKEN_SWEEP_INTERVAL = None
+	REAP_INTERVAL = None
+
+
+def long_ago():
+	return datetime.utcnow() - timedelta(days=30)
+
+
+class TestReaper(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+		init_database(db, cls.app)
+
+	@classmethod
+	def tearDownClass(cls):
+		remove_database(cls.app)
+
+	def setUp(self):
+		# start every test from an empty database
+		with self.app.app_context():
+			Player.query.update({Player.team_id: None, Player.game_id: None})
+			Team.query.delete()
+			Game.query.delete()
+			Player.query.delete()
+			db.session.commit()
+
+	def test_active_lobbies_are_kept(self):
+		with self.app.app_context():
+			owner = Player(name="owner")
+			game = Game(name="game", owner=owner)
+			team = Team(name="team", game=game, owner=owner)
+			owner.game = game
+			owner.team = team
+			db.session.add(Game(name="new and empty", owner=owner))
+			db.session.commit()
+
+			self.assertEqual(reap(), {'players': 0, 'teams': 0, 'games': 0})
+			self.assertEqual(Game.query.count(), 2)
+
+	def test_idle_lobbies_are_reaped_in_batches(self):
+		with self.app.app_context():
+			idle_owner = Player(name="idle owner", last_active=long_ago())
+			active = Player(name="active")
+			game = Game(name="abandoned", owner=idle_owner, last_active=long_ago())
+			team = Team(name="team", game=game, owner=idle_owner)
+			idle_owner.game = game
+			idle_owner.team = team
+			active.game = game
+			active.team = team
+
+			kept = Game(name="kept", owner=active, last_active=long_ago())
+			Player(name="in kept", game=kept)
+			for i in range(5):
+				db.session.add(Game(name="empty", owner=active, last_active=long_ago()))
+			for i in range(5):
+				Player(name="idle", last_active=long_ago())
+			db.session.commit()
+			game_id, active_id = game.id, active.id
+
+			reaped = reap(batch_size=2)
+
+			self.assertEqual(reaped, {'players': 6, 'teams': 1, 'games': 5})
+			self.assertEqual(Player.query.count(), 2)
+			# the active player keeps the game alive, without its owner
+			game = Game.by_id(game_id)
+			self.assertIsNone(game.owner_id)
+			self.assertEqual(Player.by_id(active_id).game_id, game_id)
+			self.assertIsNone(Player.by_id(active_id).team_id)
+
+			# the game is reaped once the last player has left and it has been idle
+			Player.by_id(active_id).game = None
+			db.session.commit()
+			self.assertEqual(reap()['games'], 0)
+			Game.by_id(game_id).last_active = long_ago()
+			db.session.commit()
+			self.assertEqual(reap()['games'], 1)
+			self.assertIsNone(Game.by_id(game_id))
+			self.assertEqual([game.name for game in Game.query.all()], ["kept"])
+
+	def test_authentication_records_activity(self):
+		client = self.app.test_client()
+		res = client.post('/players', json={'player': {'name': 'active'}})
+		player = res.json['player']
+
+		with self.app.app_context():
+			Player.by_id(player['id']).last_active = long_ago()
+			db.session.commit()
+
+		res = client.post('/games', json={'player': player})
+		self.assertEqual(res.status_code, RESOURCE_CREATED)
+
+		with self.app.app_context():
+			self.assertGreater(Player.by_id(player['id']).last_active, long_ago())
+			self.assertEqual(reap()['players'], 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+import sys
+import os
+import multiprocessing
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.models import Game, Player
+from krokeapp.status_codes import *
+
+from database_setup import database_uri, remove_database
+
+TEST_DATABASE = "sequence_test.db"
+
+PROCESSES = 4
+GAMES_PER_PROCESS = 25
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+	# small blocks so the workers reserve many of them
+	SEQUENCE_BLOCK_SIZE = 3
+	TOKEN_SWEEP_INTERVAL = None
+
+
+def create_games(start, results):
+	"""
+		Create games with default names in a worker of its own
+	"""
+	app = create_app(TestConfig())
+	client = app.test_client()
+
+	res = client.post('/players', json={'player': {'name': "worker"}})
+	player = res.json['player']
+
+	start.wait()
+	statuses = []
+	for i in range(GAMES_PER_PROCESS):
+		res = client.post('/games', json={'player': {'name': "worker", 'id': player['id'],
+													 'token': player['token']}})
+		statuses.append(res.status_code)
+
+	db.get_engine(app).dispose()
+	results.put(statuses)
+
+
+class TestSequence(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+		init_database(db, cls.app)
+		# the workers must not share the connections of this process
+		db.get_engine(cls.app).dispose()
+
+	@classmethod
+	def tearDownClass(cls):
+		remove_database(cls.app)
+
+	def test_game_names_are_unique_across_processes(self):
+		context = multiprocessing.get_context('fork')
+		start = context.Barrier(PROCESSES)
+		results = context.Queue()
+		processes = [context.Process(target=create_games, args=(start, results))
+					 for i in range(PROCESSES)]
+		for process in processes:
+			process.start()
+
+		statuses = [status for process in processes for status in results.get(timeout=60)]
+		for process in processes:
+			process.join()
+
+		self.assertEqual(statuses, [RESOURCE_CREATED] * PROCESSES * GAMES_PER_PROCESS)
+
+		with self.app.app_context():
+			names = [game.name for game in Game.query.all()]
+
+		self.assertEqual(len(names), PROCESSES * GAMES_PER_PROCESS)
+		self.assertEqual(len(set(names)), len(names))
+
+	def test_game_names_continue_after_existing_games(self):
+		from krokeapp.models import NameSequence
+		from krokeapp.sequence import next_value
+
+		# a database with games named before the sequence existed
+		app = create_app(TestConfig())
+		with app.app_context():
+			owner = Player(name="owner")
+			db.session.add_all([Game(name="game" + str(i), owner=owner) for i in range(1, 4)])
+			db.session.commit()
+			last_id = db.session.query(db.func.max(Game.id)).scalar()
+			NameSequence.query.filter_by(name='game_name').delete()
+			db.session.commit()
+
+			self.assertEqual(next_value('game_name'), last_id + 1)
+			db.session.remove()
+		db.get_engine(app).dispose()
+
+	def test_blocks_are_not_shared_with_forked_workers(self):
+		from krokeapp.sequence import next_value
+
+		with self.app.app_context():
+			first = next_value('forked')
+
+		context = multiprocessing.get_context('fork')
+		results = context.Queue()
+
+		def child():
+			with self.app.app_context():
+				results.put(next_value('forked'))
+			db.get_engine(self.app).dispose()
+
+		process = context.Process(target=child)
+		process.start()
+		value = results.get(timeout=30)
+		process.join()
+
+		with self.app.app_context():
+			second = next_value('forked')
+
+		# the child reserved a block of its own
+		self.assertEqual(second, first + 1)
+		self.assertGreaterEqual(value, first + self.app.config['SEQUENCE_BLOCK_SIZE'])
+		db.get_engine(self.app).dispose()
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import sys
+import os
+import json
+
+from flask import url_for
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.serialization import jsonify
+from krokeapp.utils import url_template
+from krokeapp.status_codes import *
+
+from database_setup import database_uri, remove_database
+
+TEST_DATABASE = "serialization_test.db"
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+	JSON_BACKEND = 'json'
+	DEBUG = True
+
+
+class OrjsonConfig(TestConfig):
+
+	JSON_BACKEND = 'orjson'
+
+
+class TestSerialization(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+		init_database(db, cls.app)
+
+	@classmethod
+	def tearDownClass(cls):
+		remove_database(cls.app)
+
+	def test_jsonify_matches_flask(self):
+		with self.app.app_context():
+			self.assertEqual(jsonify('').get_data(), b'""')
+			self.assertEqual(json.loads(jsonify().get_data()), {})
+			self.assertEqual(json.loads(jsonify(a=1).get_data()), {'a': 1})
+			self.assertEqual(json.loads(jsonify(1, 2).get_data()), [1, 2])
+			self.assertEqual(jsonify({}).mimetype, 'application/json')
+
+	def test_url_templates_match_url_for(self):
+		with self.app.test_request_context():
+			for gameid, teamid in ((1, 2), (123, 45678)):
+				self.assertEqual(url_template('api.game', 'id').format(id=gameid),
+								 url_for('api.game', id=gameid))
+				self.assertEqual(url_template('api.team', 'gameid', 'teamid').format(gameid=gameid, teamid=teamid),
+								 url_for('api.team', gameid=gameid, teamid=teamid))
+
+		# under a prefix as well
+		with self.app.test_request_context(base_url='http://localhost/lobby/'):
+			self.assertEqual(url_template('api.game', 'id').format(id=7), '/lobby/games/game7')
+
+	def test_responses_are_compact_in_debug_mode(self):
+		client = self.app.test_client()
+		client.post('/players', json={'player': {'name': 'compact'}})
+
+		body = client.get('/players').get_data(as_text=True)
+		self.assertNotIn('\n', body)
+		self.assertNotIn(': ', body)
+
+	def test_backends_encode_the_same(self):
+		try:
+			import orjson
+		except ImportError:
+			self.skipTest("orjson is not installed")
+
+		client = self.app.test_client()
+		res = client.post('/players', json={'player': {'name': 'same'}})
+		client.post('/games', json={'player': res.json['player']})
+		stdlib_body = client.get('/games').get_data()
+
+		# the same database through the other encoder
+		orjson_app = create_app(OrjsonConfig())
+		orjson_body = orjson_app.test_client().get('/games').get_data()
+		db.get_engine(orjson_app).dispose()
+
+		self.assertEqual(orjson_app.extensions['krokeapp_json'][0], 'orjson')
+		self.assertEqual(orjson_body, stdlib_body)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import sys
+import os
+import time
+import multiprocessing
+
+from sqlalchemy.exc import OperationalError
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.models import Player
+from krokeapp import logger
+
+PROCESSES = 4
+WRITES_PER_PROCESS = 50
+
+
+class TunedConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = "sqlite:///sqlite_tuned_test.db"
+
+
+class DefaultConfig(Config):
+	"""
+		The sqlite defaults with no waiting on locks
+	"""
+
+	SQLALCHEMY_DATABASE_URI = "sqlite:///sqlite_default_test.db"
+	SQLITE_POOL_SIZE = 0
+	SQLITE_JOURNAL_MODE = 'DELETE'
+	SQLITE_SYNCHRONOUS = 'FULL'
+	SQLITE_BUSY_TIMEOUT = 0
+	SQLITE_MMAP_SIZE = None
+	SQLITE_CACHE_SIZE = None
+	SQLITE_FOREIGN_KEYS = None
+
+
+def write_players(config_class, start, results):
+	"""
+		Write players one transaction at a time and
+		count the writes failing on a locked database
+	"""
+	app = create_app(config_class())
+	lock_errors = 0
+
+	# start all the writers at once
+	start.wait()
+	for i in range(WRITES_PER_PROCESS):
+		with app.app_context():
+			Player(name="concurrent")
+			try:
+				db.session.commit()
+			except OperationalError as e:
+				if 'locked' not in str(e):
+					raise
+				db.session.rollback()
+				lock_errors += 1
+
+	db.get_engine(app).dispose()
+	results.put(lock_errors)
+
+
+class TestSqliteConcurrency(unittest.TestCase):
+
+	def run_writers(self, config_class):
+		"""
+			Returns the lock errors, the players written and the
+			write throughput of concurrent writer processes
+		"""
+		app = create_app(config_class())
+		init_database(db, app)
+		# the writers must not share the connections of this process
+		db.get_engine(app).dispose()
+
+		context = multiprocessing.get_context('fork')
+		start = context.Barrier(PROCESSES + 1)
+		results = context.Queue()
+		processes = [context.Process(target=write_players, args=(config_class, start, results))
+					 for i in range(PROCESSES)]
+		for process in processes:
+			process.start()
+
+		start.wait()
+		begin = time.perf_counter()
+		lock_errors = sum(results.get(timeout=60) for process in processes)
+		elapsed = time.perf_counter() - begin
+		for process in processes:
+			process.join()
+
+		with app.app_context():
+			written = Player.query.count()
+
+		db.get_engine(app).dispose()
+		os.remove(os.path.join(app.root_path, app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]))
+
+		return lock_errors, written, written / elapsed
+
+	def test_tuned_sqlite_has_no_lock_errors(self):
+		default_errors, default_written, default_throughput = self.run_writers(DefaultConfig)
+		tuned_errors, tuned_written, tuned_throughput = self.run_writers(TunedConfig)
+
+		logger.info(f"default sqlite: {default_errors} lock errors, {default_throughput:.0f} writes/s")
+		logger.info(f"tuned sqlite: {tuned_errors} lock errors, {tuned_throughput:.0f} writes/s")
+
+		# every write of the tuned database gets through
+		self.assertEqual(tuned_errors, 0)
+		self.assertEqual(tuned_written, PROCESSES * WRITES_PER_PROCESS)
+		self.assertLessEqual(tuned_errors, default_errors)
+		self.assertEqual(default_written + default_errors, PROCESSES * WRITES_PER_PROCESS)
+
+
+if __name__ == '__main__':
+	unittest.main()
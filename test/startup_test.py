@@ -0,0 +1,84 @@
+import unittest
+import sys
+import os
+
+from sqlalchemy import event, inspect
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.background import start_background_tasks, stop_background_tasks
+from krokeapp.config import Config
+from krokeapp.database import fill_database, init_if_not_found
+from krokeapp.models import NameSequence
+
+from database_setup import database_uri, remove_database
+
+TEST_DATABASE = "startup_test.db"
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+
+
+class TestStartup(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+
+	@classmethod
+	def tearDownClass(cls):
+		remove_database(cls.app)
+
+	def table_names(self):
+		return set(inspect(db.get_engine(self.app)).get_table_names())
+
+	def statements_of_init(self):
+		statements = []
+		engine = db.get_engine(self.app)
+
+		def record(conn, cursor, statement, parameters, context, executemany):
+			statements.append(statement)
+
+		event.listen(engine, 'before_cursor_execute', record)
+		try:
+			init_if_not_found(db, self.app)
+		finally:
+			event.remove(engine, 'before_cursor_execute', record)
+		return statements
+
+	def test_init_if_not_found(self):
+		# creates the missing database
+		init_if_not_found(db, self.app)
+		self.assertTrue({table.name for table in db.metadata.sorted_tables} <= self.table_names())
+		fill_database(db, self.app)
+
+		# the rows of an existing database are not read
+		statements = self.statements_of_init()
+		self.assertFalse([statement for statement in statements if 'FROM game' in statement])
+		self.assertFalse([statement for statement in statements if 'CREATE' in statement])
+
+		# a table added by a newer version is created
+		NameSequence.__table__.drop(bind=db.get_engine(self.app))
+		self.assertNotIn('name_sequence', self.table_names())
+		init_if_not_found(db, self.app)
+		self.assertIn('name_sequence', self.table_names())
+
+	def test_background_tasks_are_started_by_the_servers(self):
+		self.assertNotIn('krokeapp_tasks', self.app.extensions)
+
+		start_background_tasks(self.app)
+		tasks = self.app.extensions['krokeapp_tasks']
+		self.assertEqual(len(tasks), 3)
+		self.assertTrue(all(task.is_alive() for task in tasks))
+
+		stop_background_tasks(self.app, timeout=5)
+		self.assertFalse(any(task.is_alive() for task in tasks))
+		self.assertNotIn('krokeapp_tasks', self.app.extensions)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+import sys
+import os
+import json
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.models import Game, Player
+from krokeapp.utils import get_from_dict
+from krokeapp.status_codes import *
+
+from database_setup import database_uri, remove_database
+
+TEST_DATABASE = "summary_test.db"
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+	TOKEN_SWEEP_INTERVAL = None
+	REAP_INTERVAL = None
+
+
+class TestSummary(unittest.TestCase):
+
+	@contextmanager
+	def count_queries(self):
+		statements = []
+
+		def before_cursor_execute(conn, cursor, statement, *args):
+			statements.append(statement)
+
+		engine = db.get_engine(self.app)
+		event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+		try:
+			yield statements
+		finally:
+			event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+		cls.client = cls.app.test_client
+		init_database(db, cls.app)
+
+	@classmethod
+	def tearDownClass(cls):
+		remove_database(cls.app)
+
+	def create_player(self, name):
+		res = self.client().post('/players', json={'player': {'name': name}})
+		return res.json['player']
+
+	def summaries(self, owner):
+		res = self.client().get('/games?view=summary&owner=' + str(owner['id']))
+		self.assertEqual(res.status_code, SUCCESS)
+		return [game['game'] for game in res.json['games']]
+
+	def test_summary_counts_players(self):
+		owner = self.create_player('summary owner')
+		res = self.client().post('/games', json={'player': owner})
+		game_id = get_from_dict(res.json, ['game', 'id'])
+		res = self.client().post('/games', json={'player': owner})
+		empty_id = get_from_dict(res.json, ['game', 'id'])
+
+		players = [owner] + [self.create_player('member') for i in range(3)]
+		for player in players:
+			res = self.client().put('/games/game' + str(game_id), json={'player': player})
+			self.assertEqual(res.status_code, SUCCESS)
+		# one leaves again
+		self.client().patch('/games/game' + str(game_id),
+			json={'del_player': {'id': players[-1]['id'], 'token': players[-1]['token']}})
+
+		for source in ('aggregate', 'column'):
+			self.app.config['GAME_SUMMARY_SOURCE'] = source
+			try:
+				summaries = self.summaries(owner)
+			finally:
+				self.app.config['GAME_SUMMARY_SOURCE'] = Config.GAME_SUMMARY_SOURCE
+
+			self.assertEqual([game['id'] for game in summaries], [game_id, empty_id])
+			self.assertEqual(summaries[0]['player_count'], 3)
+			self.assertEqual(summaries[0]['owner_name'], 'summary owner')
+			self.assertEqual(summaries[0]['url'], '/games/game' + str(game_id))
+			self.assertEqual(summaries[1]['player_count'], 0)
+			self.assertNotIn('players', summaries[0])
+
+	def test_bulk_join_keeps_the_count(self):
+		owner = self.create_player('bulk owner')
+		res = self.client().post('/games', json={'player': owner})
+		first_id = get_from_dict(res.json, ['game', 'id'])
+		res = self.client().post('/games', json={'player': owner})
+		second_id = get_from_dict(res.json, ['game', 'id'])
+
+		players = [self.create_player('member') for i in range(3)]
+		items = [{'player': player} for player in players]
+		self.client().put('/games/game' + str(first_id), json={'players': items})
+		# two of them switch games
+		self.client().put('/games/game' + str(second_id), json={'players': items[:2]})
+
+		with self.app.app_context():
+			self.assertEqual(Game.by_id(first_id).player_count, 1)
+			self.assertEqual(Game.by_id(second_id).player_count, 2)
+
+	def test_summary_is_a_single_query(self):
+		with self.app.app_context():
+			for i in range(10):
+				owner = Player(name="owner")
+				game = Game(name="game", owner=owner)
+				db.session.add(game)
+				for j in range(5):
+					game.players.append(Player(name="player"))
+			db.session.commit()
+
+		with self.count_queries() as statements:
+			res = self.client().get('/games?view=summary&not_full=1')
+		self.assertEqual(res.status_code, SUCCESS)
+		self.assertGreaterEqual(len(res.json['games']), 10)
+		self.assertEqual(len(statements), 1)
+
+	def test_unknown_view(self):
+		res = self.client().get('/games?view=everything')
+		self.assertEqual(res.status_code, UNPROCESSABLE)
+
+	def test_recount_players(self):
+		with self.app.app_context():
+			owner = Player(name="owner")
+			game = Game(name="game", owner=owner)
+			db.session.add(game)
+			game.players.append(Player(name="player"))
+			db.session.flush()
+			# the player was added directly, not through a join
+			self.assertEqual(game.player_count, 0)
+
+			Game.recount_players([game.id])
+			db.session.commit()
+			self.assertEqual(game.player_count, 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+import sys
+import os
+import json
+
+from flask import jsonify
+from sqlalchemy import event
+
+# add the parent directory to path for importing krokeapp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from krokeapp import db, create_app
+from krokeapp.config import Config
+from krokeapp.database import init_database
+from krokeapp.models import Player
+from krokeapp import logger
+from krokeapp.utils import get_from_dict
+from krokeapp.status_codes import *
+
+from database_setup import database_uri, remove_database
+
+TEST_DATABASE = "transaction_test.db"
+
+
+# the tokens of the players created by the tests
+TOKENS = {}
+
+def player_payload(name="", pid=""):
+	return json.dumps({"player": {"name": name, "id": pid, "token": TOKENS.get(pid)}})
+
+
+class TestConfig(Config):
+
+	SQLALCHEMY_DATABASE_URI = database_uri(TEST_DATABASE)
+
+
+class TestRequestTransaction(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.app = create_app(TestConfig())
+		cls.client = cls.app.test_client
+
+		# routes that change the database and then fail
+		@cls.app.route('/failing/<name>')
+		def failing(name):
+			Player(name=name)
+			return jsonify(), UNPROCESSABLE
+
+		@cls.app.route('/raising/<name>')
+		def raising(name):
+			Player(name=name)
+			db.session.flush()
+			raise RuntimeError("request failed")
+
+		with cls.app.app_context():
+			init_database(db, cls.app)
+
+		cls.commits = 0
+
+		def commit(conn):
+			cls.commits += 1
+
+		event.listen(db.get_engine(cls.app), 'commit', commit)
+
+	@classmethod
+	def tearDownClass(cls):
+		# after running the tests, delete the test database
+		remove_database(cls.app)
+
+	def player_count(self, name):
+		with self.app.app_context():
+			return Player.query.filter_by(name=name).count()
+
+	def test_error_response_rolls_back(self):
+		res = self.client().get('/failing/rolled_back')
+		self.assertEqual(res.status_code, UNPROCESSABLE)
+		self.assertEqual(self.player_count('rolled_back'), 0)
+
+	def test_exception_rolls_back(self):
+		self.app.testing = False
+		try:
+			res = self.client().get('/raising/raised')
+		finally:
+			self.app.testing = True
+		self.assertEqual(res.status_code, 500)
+		self.assertEqual(self.player_count('raised'), 0)
+
+	def test_single_commit_per_request(self):
+		res = self.client().post('players',
+			data=player_payload(name='committed'), content_type='application/json')
+		player_id = get_from_dict(res.json, ['player', 'id'])
+		TOKENS[player_id] = get_from_dict(res.json, ['player', 'token'])
+		self.assertEqual(self.player_count('committed'), 1)
+
+		res = self.client().post('/games',
+			data=player_payload(pid=player_id), content_type='application/json')
+		game_id = get_from_dict(res.json, ['game', 'id'])
+		self.client().put('games/game' + str(game_id),
+			data=player_payload(pid=player_id), content_type='application/json')
+		self.client().post('games/game' + str(game_id) + '/teams',
+			data=player_payload(pid=player_id), content_type='application/json')
+		team_id = None
+		with self.app.app_context():
+			team_id = Player.by_id(player_id).game.teams[0].id
+		self.client().put('games/game' + str(game_id) + '/teams/team' + str(team_id),
+			data=player_payload(pid=player_id), content_type='application/json')
+
+		# leaving the game disbands the team and leaves both
+		# the team and the game in one transaction
+		commits = self.commits
+		data = player_payload(pid=player_id).replace('player', 'del_player', 1)
+		res = self.client().patch('/games/game' + str(game_id),
+			data=data, content_type='application/json')
+		self.assertEqual(res.status_code, SUCCESS)
+		self.assertEqual(self.commits - commits, 1)
+
+		with self.app.app_context():
+			player = Player.by_id(player_id)
+			self.assertEqual(player.game, None)
+			self.assertEqual(player.team, None)
+
+
+if __name__ == '__main__':
+	unittest.main()